@@ -16,11 +16,24 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
+    # Pool and connection settings for the configured database
+    from app.database import engine_options, init_database
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    
     # Initialize extensions with app
     db.init_app(app)
+    init_database(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
     
+    # Request timing and metrics; registered first so it sees the final response
+    from app.instrumentation import init_instrumentation
+    init_instrumentation(app)
+    
+    # Compress responses for clients that accept gzip or brotli
+    from app.http import compress_response
+    app.after_request(compress_response)
+    
     # Add custom template filters
     @app.template_filter('from_json')
     def from_json_filter(value):
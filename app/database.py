@@ -0,0 +1,148 @@
+"""Engine settings for the app database: SQLite tuning, pooling and write retries.
+
+SQLite (the default) is opened in WAL mode, so readers keep reading while a
+write commits and writers only queue behind each other, with
+``synchronous=NORMAL`` (durable across application crashes, fsyncs at
+checkpoints instead of every commit), a larger page cache, memory-mapped
+reads and a busy timeout that makes a writer wait for the lock instead of
+failing at once. Connections are pooled per process rather than opened per
+request. SQLITE_TUNING=0 keeps the driver defaults, for comparison with
+``tools/bench_writers.py``.
+
+Any other DATABASE_URL (e.g. ``postgresql://``) gets a pre-pinged,
+recycled connection pool and no pragmas.
+"""
+from functools import wraps
+import random
+import sqlite3
+import time
+
+from flask import current_app, g, jsonify
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+
+from app import db
+
+
+def is_sqlite(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+
+def _in_memory(uri):
+    return make_url(uri).database in (None, '', ':memory:')
+
+
+def engine_options(config):
+    """``SQLALCHEMY_ENGINE_OPTIONS`` for the configured database."""
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    pool = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+    }
+    if not is_sqlite(uri):
+        return dict(pool, pool_pre_ping=True, pool_recycle=config['DB_POOL_RECYCLE'])
+    if not config['SQLITE_TUNING'] or _in_memory(uri):
+        # Left to Flask-SQLAlchemy: a null pool, or one shared in-memory connection
+        return {}
+    # Pooled connections move between a worker's request threads
+    return dict(pool, poolclass=QueuePool,
+                connect_args={'timeout': config['SQLITE_BUSY_TIMEOUT'], 'check_same_thread': False})
+
+
+def sqlite_pragmas(config):
+    return [
+        'PRAGMA journal_mode=WAL',
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        # Negative sizes are in KiB
+        f"PRAGMA cache_size=-{config['SQLITE_CACHE_MB'] * 1024}",
+        f"PRAGMA mmap_size={config['SQLITE_MMAP_MB'] * 1024 * 1024}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def init_database(app):
+    """Create the app's engine and have every new SQLite connection apply the pragmas."""
+    with app.app_context():
+        engine = db.engine
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not is_sqlite(uri) or not app.config['SQLITE_TUNING'] or _in_memory(uri):
+        return
+    pragmas = sqlite_pragmas(app.config)
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def is_busy(error):
+    """Whether ``error`` is the database refusing a write because another holds the lock."""
+    if not isinstance(error, OperationalError):
+        return False
+    orig = error.orig
+    if isinstance(orig, sqlite3.OperationalError):
+        message = str(orig).lower()
+        return 'locked' in message or 'busy' in message
+    # PostgreSQL serialization failure and deadlock
+    return getattr(orig, 'pgcode', None) in ('40001', '40P01')
+
+
+def after_write(func, *args, **kwargs):
+    """Call ``func`` once the ``retry_on_busy`` view running now has returned.
+
+    For follow-up work after a view's write has committed: run inside the
+    view, a busy error from it would replay the committed write. Calls
+    queued by an attempt that is retried are dropped with it. Errors are
+    logged rather than raised, since the response already stands.
+    """
+    g._after_write.append((func, args, kwargs))
+
+
+def _run_after_write(calls):
+    for func, args, kwargs in calls:
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Follow-up to a committed write failed: %s', func.__name__)
+
+
+def retry_on_busy(view):
+    """Run a writing view again, from a rolled back session, when the database is busy.
+
+    The busy timeout already makes each statement wait for the write lock;
+    this covers a writer that waited it out. Views catching broad exceptions
+    must re-raise busy errors for the retry to see them, and queue work that
+    follows a commit with ``after_write``. After DB_WRITE_RETRIES attempts
+    the client gets a 503 to try again later.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        retries = current_app.config['DB_WRITE_RETRIES']
+        for attempt in range(retries + 1):
+            g._after_write = []
+            try:
+                response = view(*args, **kwargs)
+            except OperationalError as e:
+                db.session.rollback()
+                if not is_busy(e):
+                    raise
+                if attempt < retries:
+                    # Jittered backoff so retrying writers do not collide again
+                    time.sleep(current_app.config['DB_RETRY_BACKOFF'] * 2 ** attempt * random.uniform(0.5, 1.5))
+                continue
+            _run_after_write(g.pop('_after_write'))
+            return response
+        response = jsonify({
+            'success': False,
+            'message': 'The database is busy. Please try again.'
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    return wrapper
@@ -0,0 +1 @@
+# Spreadsheet formulas: parsing and dependency-tracked recalculation
@@ -0,0 +1,655 @@
+"""Dependency-tracked recalculation of a sheet's formula cells.
+
+Formula text stays in the cells like any other text; the value the engine
+computed for each formula cell is stored in a SheetFormula row, so reading
+a window of the sheet never evaluates anything.
+
+A FormulaGraph holds the parsed formulas of one sheet and the edges from
+every cell and range they read to the formula cells reading them. After a
+write, only the formulas downstream of the changed cells are evaluated, in
+topological order; formulas on a cycle (or downstream of one) get
+#CYCLE!. Graphs are kept per process, keyed by sheet id and version, and
+rebuilt from the SheetFormula rows when the cached one is not the version
+a write was based on.
+
+Ranges are aggregated with NumPy over the sheet's column chunks, plus the
+values of any formula cells inside them. Decoded chunks are cached per
+process under the version that wrote them, so an edit re-reads only the
+chunks it changed. PREDICT calls whose inputs are plain cells are scored
+in one batch per model.
+"""
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, defaultdict, deque
+import math
+import threading
+
+import numpy as np
+from sqlalchemy import event, tuple_
+
+from app import db
+from app.formulas.parser import is_formula, parse
+from app.instrumentation import timed
+from app.models.ml_model import MLModel
+from app.models.spreadsheet import SheetChunk, SheetFormula
+from app.storage.columnar import CHUNK_ROWS, TEXT, format_number, parse_number
+
+# Largest range PREDICT accepts as individual inputs
+MAX_PREDICT_CELLS = 10000
+
+# Rows per DELETE when replacing stored values
+_DELETE_BATCH = 500
+
+# Text chunks fetched per round trip when scanning a sheet for formulas
+_FIND_BATCH = 8
+
+
+class FormulaError(Exception):
+    """An error value such as #DIV/0!, shown in place of the formula's result."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class _SpanIndex:
+    """Row spans of the ranges reading one column, for finding those containing a row."""
+
+    def __init__(self):
+        self.spans = {}  # Formula cell -> [(row0, row1)]
+        self._arrays = None
+
+    def add(self, cell, row0, row1):
+        self.spans.setdefault(cell, []).append((row0, row1))
+        self._arrays = None
+
+    def discard(self, cell):
+        if self.spans.pop(cell, None) is not None:
+            self._arrays = None
+
+    def containing(self, row):
+        if self._arrays is None:
+            flat = [(row0, -1 if row1 is None else row1, cell)
+                    for cell, spans in self.spans.items() for row0, row1 in spans]
+            starts = np.array([f[0] for f in flat], dtype=np.int64)
+            stops = np.array([f[1] for f in flat], dtype=np.int64)
+            # Whole-column ranges have no end
+            stops[stops < 0] = np.iinfo(np.int64).max
+            self._arrays = starts, stops, [f[2] for f in flat]
+        starts, stops, cells = self._arrays
+        return {cells[i] for i in np.flatnonzero((starts <= row) & (row <= stops)).tolist()}
+
+
+class FormulaGraph:
+    """The formula cells of one sheet, their last values and the dependency edges between them."""
+
+    def __init__(self):
+        self.formulas = {}  # (row, col) -> parser.Formula
+        self.values = {}  # (row, col) -> float, str, None or FormulaError
+        self._dependents = defaultdict(set)  # Cell -> formula cells naming it directly
+        self._spans = defaultdict(_SpanIndex)  # Column -> ranges reading it
+        self._rows = defaultdict(list)  # Column -> sorted rows of its formula cells
+
+    def set(self, cell, text):
+        """Set the formula of ``cell``; returns False if it already had this formula."""
+        formula = parse(text)
+        if self.formulas.get(cell) is formula:
+            return False
+        self.remove(cell)
+        self.formulas[cell] = formula
+        insort(self._rows[cell[1]], cell[0])
+        for ref in formula.cells:
+            self._dependents[ref].add(cell)
+        for row0, col0, row1, col1 in formula.ranges:
+            for col in range(col0, col1 + 1):
+                self._spans[col].add(cell, row0, row1)
+        return True
+
+    def remove(self, cell):
+        """Forget the formula of ``cell``; returns False if it had none."""
+        formula = self.formulas.pop(cell, None)
+        if formula is None:
+            return False
+        self.values.pop(cell, None)
+        rows = self._rows[cell[1]]
+        del rows[bisect_left(rows, cell[0])]
+        for ref in formula.cells:
+            self._dependents[ref].discard(cell)
+        for _, col0, _, col1 in formula.ranges:
+            for col in range(col0, col1 + 1):
+                self._spans[col].discard(cell)
+        return True
+
+    def dependents(self, cell):
+        """Formula cells reading ``cell`` directly or through a range."""
+        found = set(self._dependents.get(cell, ()))
+        spans = self._spans.get(cell[1])
+        if spans is not None and spans.spans:
+            found |= spans.containing(cell[0])
+        return found
+
+    def precedents(self, cell):
+        """Formula cells that the formula in ``cell`` reads."""
+        formula = self.formulas[cell]
+        found = {ref for ref in formula.cells if ref in self.formulas}
+        for row0, col0, row1, col1 in formula.ranges:
+            for col in range(col0, col1 + 1):
+                found.update((row, col) for row in self.formula_rows(col, row0, row1))
+        return found
+
+    def formula_rows(self, col, row0, row1=None):
+        """Rows of formula cells in ``col`` between row0 and row1 (inclusive; None runs to the end)."""
+        rows = self._rows.get(col)
+        if not rows:
+            return []
+        stop = len(rows) if row1 is None else bisect_right(rows, row1)
+        return rows[bisect_left(rows, row0):stop]
+
+    def affected(self, cells):
+        """Every formula cell downstream of ``cells``."""
+        dirty = set()
+        stack = list(cells)
+        while stack:
+            for dependent in self.dependents(stack.pop()):
+                if dependent not in dirty:
+                    dirty.add(dependent)
+                    stack.append(dependent)
+        return dirty
+
+    def order(self, dirty):
+        """Sort formula cells ``dirty`` so each comes after those it reads.
+
+        Returns ``(ordered, cyclic)``: cells on a cycle, or reading one, cannot
+        be ordered and are returned separately.
+        """
+        indegree = {}
+        edges = defaultdict(list)
+        for cell in dirty:
+            inputs = self.precedents(cell) & dirty
+            indegree[cell] = len(inputs)
+            for precedent in inputs:
+                edges[precedent].append(cell)
+        ready = deque(sorted(cell for cell, count in indegree.items() if not count))
+        ordered = []
+        while ready:
+            cell = ready.popleft()
+            ordered.append(cell)
+            for dependent in edges[cell]:
+                indegree[dependent] -= 1
+                if not indegree[dependent]:
+                    ready.append(dependent)
+        return ordered, set(dirty) - set(ordered)
+
+
+class VersionedCache:
+    """Thread-safe LRU holding one version of a value per key; other versions miss."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version, pop=False):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            if pop:
+                del self._entries[key]
+            else:
+                self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Formula graphs by sheet id, for one sheet version each
+graph_cache = VersionedCache(32)
+
+# Decoded ``(values, numeric)`` arrays of column chunks by (sheet id, col, chunk),
+# for the chunk version that wrote them: about 150 KB per entry
+block_cache = VersionedCache(256)
+
+
+# Graphs built by a write are only cached once its transaction commits
+@event.listens_for(db.session, 'after_commit')
+def _publish_graphs(session):
+    for spreadsheet_id, (version, graph) in session.info.pop('formula_graphs', {}).items():
+        graph_cache.put(spreadsheet_id, version, graph)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _drop_graphs(session, previous_transaction):
+    session.info.pop('formula_graphs', None)
+
+
+def display(value):
+    """Render a formula value as the text shown in its cell."""
+    if isinstance(value, FormulaError):
+        return value.code
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return format_number(value)
+    return str(value)
+
+
+def _stored_value(record):
+    if record.error is not None:
+        return FormulaError(record.value, record.error)
+    if not record.value:
+        return None
+    number = parse_number(record.value)
+    return record.value if number is None else number
+
+
+def load_graph(spreadsheet):
+    """Build the sheet's graph from its stored formulas and values."""
+    graph = FormulaGraph()
+    for record in SheetFormula.query.filter_by(spreadsheet_id=spreadsheet.id):
+        cell = (record.row, record.col)
+        graph.set(cell, record.formula)
+        graph.values[cell] = _stored_value(record)
+    return graph
+
+
+def graph_for(spreadsheet):
+    """The sheet's graph at its current version, for reading only."""
+    graph = graph_cache.get(spreadsheet.id, spreadsheet.version)
+    if graph is None:
+        graph = load_graph(spreadsheet)
+        if spreadsheet.formula_version == spreadsheet.version:
+            graph_cache.put(spreadsheet.id, spreadsheet.version, graph)
+    return graph
+
+
+def find_formulas(spreadsheet):
+    """Yield ``((row, col), text)`` for every formula cell, reading text chunks only."""
+    # Streamed and expunged one chunk at a time, so a whole sheet's payloads are never held at once
+    query = SheetChunk.query.filter_by(spreadsheet_id=spreadsheet.id, kind=TEXT).yield_per(_FIND_BATCH)
+    for chunk in query:
+        column = chunk.column()
+        db.session.expunge(chunk)
+        codes = [code for code, text in enumerate(column.dictionary) if is_formula(text)]
+        if not codes:
+            continue
+        for offset in np.flatnonzero(np.isin(column.codes, codes)).tolist():
+            yield (chunk.chunk * CHUNK_ROWS + offset, chunk.col), column.dictionary[column.codes[offset]]
+
+
+class Evaluator:
+    """Evaluates formula trees against one sheet's cells and a graph's formula values.
+
+    ``writing`` is the version of an uncommitted write whose chunks are
+    being read; they are not shared with other requests until it commits.
+    """
+
+    def __init__(self, spreadsheet, graph, writing=None):
+        self.spreadsheet = spreadsheet
+        self.graph = graph
+        self.writing = writing
+        self.n_rows = spreadsheet.n_rows or 0
+        self._blocks = {}  # (col, chunk) -> (values, numeric), or None if empty
+        self._texts = {}  # (col, chunk) -> column, for reading text cells
+        self._models = None
+        self._predictions = {}  # Formula cell -> value scored by prefetch_predictions
+
+    # Cells
+
+    def _load_blocks(self, col, numbers):
+        missing = [number for number in numbers if (col, number) not in self._blocks]
+        if not missing:
+            return
+        sheet_id = self.spreadsheet.id
+        # Versions are cheap to read; payloads are only decoded for chunks that changed
+        stale = {}
+        for number, version in db.session.query(SheetChunk.chunk, SheetChunk.version).filter(
+                SheetChunk.spreadsheet_id == sheet_id, SheetChunk.col == col, SheetChunk.chunk.in_(missing)):
+            block = block_cache.get((sheet_id, col, number), version)
+            if block is None:
+                stale[number] = version
+            self._blocks[(col, number)] = block
+        for number in missing:
+            self._blocks.setdefault((col, number), None)
+        if not stale:
+            return
+        query = SheetChunk.query.filter(SheetChunk.spreadsheet_id == sheet_id, SheetChunk.col == col,
+                                        SheetChunk.chunk.in_(list(stale)))
+        for chunk in query:
+            column = chunk.column()
+            block = tuple(column.to_float())
+            self._blocks[(col, chunk.chunk)] = block
+            self._texts[(col, chunk.chunk)] = column
+            if chunk.version != self.writing:
+                block_cache.put((sheet_id, col, chunk.chunk), chunk.version, block)
+
+    def _block(self, col, number):
+        self._load_blocks(col, [number])
+        return self._blocks[(col, number)]
+
+    def _text(self, col, number, offset):
+        column = self._texts.get((col, number))
+        if column is None:
+            chunk = SheetChunk.query.filter_by(spreadsheet_id=self.spreadsheet.id, col=col, chunk=number).first()
+            if chunk is None:
+                return None
+            column = self._texts[(col, number)] = chunk.column()
+        return column.get(offset) or None
+
+    def cell_value(self, row, col):
+        """A cell's value: a float, text, None if empty, or its formula's value."""
+        cell = (row, col)
+        if cell in self.graph.formulas:
+            value = self.graph.values.get(cell)
+            if isinstance(value, FormulaError):
+                raise value
+            return value
+        number, offset = divmod(row, CHUNK_ROWS)
+        block = self._block(col, number)
+        if block is None or offset >= len(block[0]):
+            return None
+        values, numeric = block
+        if numeric[offset]:
+            return float(values[offset])
+        return self._text(col, number, offset)
+
+    def _range_bounds(self, node):
+        _, row0, col0, row1, col1 = node
+        row1 = self.n_rows - 1 if row1 is None else min(row1, self.n_rows - 1)
+        return row0, col0, row1, col1
+
+    def range_numbers(self, node):
+        """The numbers in a range, as one array: numeric cells plus numeric formula values."""
+        row0, col0, row1, col1 = self._range_bounds(node)
+        parts = []
+        extra = []
+        for col in range(col0, col1 + 1):
+            if row1 >= row0:
+                numbers = range(row0 // CHUNK_ROWS, row1 // CHUNK_ROWS + 1)
+                self._load_blocks(col, numbers)
+                for number in numbers:
+                    block = self._blocks[(col, number)]
+                    if block is None:
+                        continue
+                    values, numeric = block
+                    start = number * CHUNK_ROWS
+                    lo = max(row0 - start, 0)
+                    hi = min(row1 - start + 1, len(values))
+                    parts.append(values[lo:hi][numeric[lo:hi]])
+            # Formula cells hold text ('=...') in the chunks; their values come from the graph
+            for row in self.graph.formula_rows(col, node[1], node[3]):
+                value = self.graph.values.get((row, col))
+                if isinstance(value, FormulaError):
+                    raise value
+                if isinstance(value, float):
+                    extra.append(value)
+        if extra:
+            parts.append(np.array(extra))
+        return np.concatenate(parts) if parts else np.empty(0)
+
+    def range_values(self, node):
+        """Every cell value of a range, row by row."""
+        row0, col0, row1, col1 = self._range_bounds(node)
+        if (row1 - row0 + 1) * (col1 - col0 + 1) > MAX_PREDICT_CELLS:
+            raise FormulaError('#VALUE!', f'Range is larger than {MAX_PREDICT_CELLS} cells')
+        return [self.cell_value(row, col) for row in range(row0, row1 + 1) for col in range(col0, col1 + 1)]
+
+    # Expressions
+
+    def number(self, value):
+        if value is None:
+            return 0.0
+        if isinstance(value, float):
+            return value
+        parsed = parse_number(value)
+        if parsed is None:
+            raise FormulaError('#VALUE!', f'{value!r} is not a number')
+        return parsed
+
+    def evaluate(self, node):
+        kind = node[0]
+        if kind in ('num', 'str'):
+            return node[1]
+        if kind == 'ref':
+            return self.cell_value(node[1], node[2])
+        if kind == 'range':
+            raise FormulaError('#VALUE!', 'A range can only be used as a function argument')
+        if kind == 'neg':
+            return -self.number(self.evaluate(node[1]))
+        if kind == 'op':
+            return self.operate(node[1], self.number(self.evaluate(node[2])), self.number(self.evaluate(node[3])))
+        return self.call(node[1], node[2])
+
+    def operate(self, symbol, left, right):
+        try:
+            if symbol == '+':
+                result = left + right
+            elif symbol == '-':
+                result = left - right
+            elif symbol == '*':
+                result = left * right
+            elif symbol == '/':
+                result = left / right
+            else:
+                result = math.pow(left, right)
+        except ZeroDivisionError:
+            raise FormulaError('#DIV/0!', 'Division by zero')
+        except (OverflowError, ValueError):
+            raise FormulaError('#NUM!', 'Result is not a real number')
+        if not math.isfinite(result):
+            raise FormulaError('#NUM!', 'Result is not a finite number')
+        return result
+
+    def call(self, name, args):
+        if name == 'PREDICT':
+            return self.predict(args)
+        numbers = []
+        for arg in args:
+            if arg[0] == 'range':
+                numbers.append(self.range_numbers(arg))
+                continue
+            value = self.evaluate(arg)
+            if value is None or (arg[0] == 'ref' and not isinstance(value, float)):
+                # Empty and text cells named directly are skipped, like cells of a range
+                continue
+            numbers.append(np.array([self.number(value)]))
+        values = np.concatenate(numbers) if numbers else np.empty(0)
+        if name == 'COUNT':
+            return float(len(values))
+        if name == 'SUM':
+            return self.operate('+', float(values.sum()), 0.0)
+        if name == 'AVG':
+            if not len(values):
+                raise FormulaError('#DIV/0!', 'No numbers to average')
+            return self.operate('+', float(values.mean()), 0.0)
+        if not len(values):
+            return 0.0
+        return float(values.min() if name == 'MIN' else values.max())
+
+    # Models
+
+    def predictor(self, name):
+        # Imported here because app.ml's routes import this module
+        from app.ml.predictor import Predictor, predictor_cache
+        if self._models is None:
+            self._models = {}
+            # Later models win over older ones of the same name
+            for model in MLModel.query.filter_by(spreadsheet_id=self.spreadsheet.id).order_by(MLModel.id):
+                self._models[model.name.lower()] = model
+        model = self._models.get(name.lower())
+        if model is None:
+            raise FormulaError('#NAME?', f'Model "{name}" not found')
+        try:
+            return predictor_cache.get(model.id, model.created_at, model.version, lambda: Predictor.from_model(model))
+        except Exception as e:
+            raise FormulaError('#N/A', f'Model "{name}" is not ready: {e}')
+
+    def _inputs(self, args):
+        inputs = []
+        for arg in args:
+            inputs.extend(self.range_values(arg) if arg[0] == 'range' else [self.evaluate(arg)])
+        # Raw values; the predictor encodes them as training did
+        return inputs
+
+    def predict(self, args):
+        predictor = self.predictor(args[0][1])
+        inputs = self._inputs(args[1:])
+        if len(inputs) != predictor.n_inputs:
+            raise FormulaError('#VALUE!', f'Model "{args[0][1]}" needs {predictor.n_inputs} inputs, got {len(inputs)}')
+        return predictor.predict_one(inputs)
+
+    def _reads_formulas(self, formula):
+        if any(ref in self.graph.formulas for ref in formula.cells):
+            return True
+        return any(self.graph.formula_rows(col, row0, row1)
+                   for row0, col0, row1, col1 in formula.ranges for col in range(col0, col1 + 1))
+
+    def prefetch_predictions(self, cells):
+        """Score PREDICT formulas that read only plain cells in one batch per model."""
+        batches = defaultdict(list)
+        for cell in cells:
+            formula = self.graph.formulas[cell]
+            tree = formula.tree
+            if tree is None or tree[0] != 'call' or tree[1] != 'PREDICT' or self._reads_formulas(formula):
+                continue
+            batches[tree[2][0][1].lower()].append(cell)
+        for name, batch in batches.items():
+            try:
+                predictor = self.predictor(name)
+            except FormulaError:
+                continue
+            rows = []
+            for cell in batch:
+                try:
+                    inputs = self._inputs(self.graph.formulas[cell].tree[2][1:])
+                except FormulaError:
+                    inputs = None
+                rows.append(inputs if inputs is not None and len(inputs) == predictor.n_inputs else None)
+            scored = [cell for cell, inputs in zip(batch, rows) if inputs is not None]
+            if not scored:
+                continue
+            X = predictor.encode_rows([inputs for inputs in rows if inputs is not None])
+            for cell, result in zip(scored, predictor.predict_labels(X)):
+                self._predictions[cell] = result
+            # Cells left out fall back to evaluate_cell, which reports their error
+
+    def evaluate_cell(self, cell, formula=None):
+        """Evaluate a formula cell, returning its value or a FormulaError."""
+        if cell in self._predictions:
+            return self._predictions[cell]
+        formula = formula or self.graph.formulas[cell]
+        if formula.error is not None:
+            return FormulaError('#ERROR!', formula.error)
+        try:
+            value = self.evaluate(formula.tree)
+        except FormulaError as e:
+            return e
+        except RecursionError:
+            return FormulaError('#ERROR!', 'Formula is nested too deeply')
+        # A formula naming an empty cell shows 0, not an empty cell
+        return 0.0 if value is None else value
+
+
+@timed('formulas')
+def recalculate(spreadsheet, version, changes=None):
+    """Bring stored formula values up to date with a write that produced sheet ``version``.
+
+    ``changes`` are the ``(row, col, text)`` cell changes the write applied
+    on top of ``version - 1``. Only formulas downstream of them are
+    evaluated. Without changes, or when the stored values are not from
+    ``version - 1``, every formula of the sheet is found and evaluated.
+    Call before committing the write; the new graph is cached on commit.
+
+    Returns ``{(row, col): value}`` for every formula cell evaluated.
+    """
+    graph = None
+    if changes is not None and spreadsheet.formula_version == version - 1:
+        # A write changes the graph in place, so it leaves the cache until the write commits
+        graph = graph_cache.get(spreadsheet.id, version - 1, pop=True) or load_graph(spreadsheet)
+
+    if graph is None:
+        graph = FormulaGraph()
+        for cell, text in find_formulas(spreadsheet):
+            graph.set(cell, text)
+        SheetFormula.query.filter_by(spreadsheet_id=spreadsheet.id).delete(synchronize_session=False)
+        dirty = set(graph.formulas)
+        stale = []
+    else:
+        changed = []
+        dirty = set()
+        stale = []
+        for row, col, text in changes:
+            cell = (row, col)
+            changed.append(cell)
+            if is_formula(text):
+                graph.set(cell, text)
+                stale.append(cell)
+                dirty.add(cell)
+            elif graph.remove(cell):
+                stale.append(cell)
+        dirty |= graph.affected(changed)
+        stale.extend(cell for cell in dirty if cell not in stale)
+
+    ordered, cyclic = graph.order(dirty)
+    for cell in cyclic:
+        graph.values[cell] = FormulaError('#CYCLE!', 'Circular reference')
+    evaluator = Evaluator(spreadsheet, graph, writing=version)
+    evaluator.prefetch_predictions(ordered)
+    for cell in ordered:
+        graph.values[cell] = evaluator.evaluate_cell(cell)
+
+    # Replace the stored rows of every cell whose formula or value changed
+    for i in range(0, len(stale), _DELETE_BATCH):
+        SheetFormula.query.filter(
+            SheetFormula.spreadsheet_id == spreadsheet.id,
+            tuple_(SheetFormula.row, SheetFormula.col).in_(stale[i:i + _DELETE_BATCH])
+        ).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(SheetFormula, [{
+        'spreadsheet_id': spreadsheet.id,
+        'row': cell[0],
+        'col': cell[1],
+        'formula': graph.formulas[cell].text,
+        'value': display(graph.values[cell]),
+        'error': graph.values[cell].message if isinstance(graph.values[cell], FormulaError) else None,
+    } for cell in dirty])
+
+    spreadsheet.formula_version = version
+    db.session.info.setdefault('formula_graphs', {})[spreadsheet.id] = (version, graph)
+    return {cell: graph.values[cell] for cell in dirty}
+
+
+@timed('formulas')
+def preview(spreadsheet, formulas):
+    """Evaluate ``{(row, col): text}`` formulas against the saved sheet without storing anything."""
+    graph = graph_for(spreadsheet)
+    evaluator = Evaluator(spreadsheet, graph)
+    values = {}
+    for cell, text in formulas.items():
+        formula = parse(text)
+        if cell in formula.cells or any(row0 <= cell[0] and (row1 is None or cell[0] <= row1) and
+                                        col0 <= cell[1] <= col1 for row0, col0, row1, col1 in formula.ranges):
+            values[cell] = FormulaError('#CYCLE!', 'Circular reference')
+        else:
+            values[cell] = evaluator.evaluate_cell(cell, formula)
+    return values
+
+
+def serialize(values):
+    """Split ``{(row, col): value}`` into ``{"row-col": text}`` and ``{"row-col": error message}``."""
+    texts = {}
+    errors = {}
+    for (row, col), value in values.items():
+        key = f'{row}-{col}'
+        texts[key] = display(value)
+        if isinstance(value, FormulaError):
+            errors[key] = value.message
+    return texts, errors
@@ -0,0 +1,221 @@
+"""Parsing formula text into expression trees.
+
+A formula is cell text starting with '='. The grammar covers numbers,
+quoted strings, cell references (A1, $B$2), ranges (A1:B10, and whole
+columns such as C:C), the operators + - * / ^ with the usual precedence,
+parentheses and function calls. SUM, AVG (AVERAGE), MIN, MAX and COUNT
+aggregate their arguments; PREDICT(model, cells...) scores a model of the
+sheet. Any other call, such as the older ``=ModelName(A1, B1)`` form, is
+read as PREDICT of the model with that name.
+
+Trees are nested tuples:
+
+    ('num', value)  ('str', text)  ('ref', row, col)
+    ('range', row0, col0, row1, col1)   # row1 is None for whole columns
+    ('neg', operand)  ('op', symbol, left, right)  ('call', NAME, args)
+
+``parse`` is memoized on the formula text, so each distinct formula is
+parsed once per process however many cells hold it.
+"""
+from functools import lru_cache
+import re
+
+from app.storage.columnar import column_index
+
+FUNCTIONS = {'SUM', 'AVG', 'AVERAGE', 'MIN', 'MAX', 'COUNT', 'PREDICT'}
+
+_TOKEN = re.compile(r'''\s*(?:
+    (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<string>"(?:[^"]|"")*")
+  | (?P<range>\$?[A-Za-z]{1,3}\$?\d+\s*:\s*\$?[A-Za-z]{1,3}\$?\d+
+             | \$?[A-Za-z]{1,3}\s*:\s*\$?[A-Za-z]{1,3}(?![A-Za-z0-9_]))
+  | (?P<ref>\$?[A-Za-z]{1,3}\$?\d+)(?![A-Za-z0-9_.(])
+  | (?P<name>[A-Za-z_][A-Za-z0-9_.]*)
+  | (?P<op>[-+*/^(),])
+)''', re.VERBOSE)
+
+_CELL = re.compile(r'\$?([A-Za-z]{1,3})\$?(\d+)?$')
+
+
+class FormulaSyntaxError(ValueError):
+    pass
+
+
+class Formula:
+    """A parsed formula: its tree and the cells and ranges it reads."""
+
+    def __init__(self, text, tree=None, error=None):
+        self.text = text
+        self.tree = tree
+        self.error = error  # Syntax error message, if the text did not parse
+        cells = set()
+        ranges = set()
+        if tree is not None:
+            _collect_refs(tree, cells, ranges)
+        self.cells = frozenset(cells)
+        self.ranges = tuple(sorted(ranges, key=lambda r: (r[1], r[0])))
+
+
+def _collect_refs(node, cells, ranges):
+    kind = node[0]
+    if kind == 'ref':
+        cells.add((node[1], node[2]))
+    elif kind == 'range':
+        ranges.add(node[1:])
+    elif kind == 'neg':
+        _collect_refs(node[1], cells, ranges)
+    elif kind == 'op':
+        _collect_refs(node[2], cells, ranges)
+        _collect_refs(node[3], cells, ranges)
+    elif kind == 'call':
+        for arg in node[2]:
+            _collect_refs(arg, cells, ranges)
+
+
+def parse_cell(text):
+    """Parse 'A1' (or 'A' for a whole column) into ``(row, col)``; row is None without digits."""
+    match = _CELL.match(text.strip())
+    if not match:
+        raise FormulaSyntaxError(f'Invalid cell reference: {text}')
+    letters, digits = match.groups()
+    if digits is None:
+        return None, column_index(letters)
+    if int(digits) < 1:
+        raise FormulaSyntaxError(f'Invalid cell reference: {text}')
+    return int(digits) - 1, column_index(letters)
+
+
+def tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match or match.end() == position:
+            raise FormulaSyntaxError(f'Unexpected character at position {position + 1}: {text[position]!r}')
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1] != value):
+            expected = value or kind or 'a value'
+            raise FormulaSyntaxError(f'Expected {expected}' + (f', got {token[1]!r}' if token[1] else ''))
+        self.position += 1
+        return token
+
+    def at(self, value):
+        return self.peek() == ('op', value)
+
+    def expression(self):
+        node = self.term()
+        while self.at('+') or self.at('-'):
+            symbol = self.take()[1]
+            node = ('op', symbol, node, self.term())
+        return node
+
+    def term(self):
+        node = self.power()
+        while self.at('*') or self.at('/'):
+            symbol = self.take()[1]
+            node = ('op', symbol, node, self.power())
+        return node
+
+    def power(self):
+        # Left-associative, and binding looser than unary minus: -2^2 is 4
+        node = self.unary()
+        while self.at('^'):
+            self.take()
+            node = ('op', '^', node, self.unary())
+        return node
+
+    def unary(self):
+        if self.at('-'):
+            self.take()
+            return ('neg', self.unary())
+        if self.at('+'):
+            self.take()
+            return self.unary()
+        return self.primary()
+
+    def primary(self):
+        kind, value = self.take()
+        if kind == 'number':
+            return ('num', float(value))
+        if kind == 'string':
+            return ('str', value[1:-1].replace('""', '"'))
+        if kind == 'ref':
+            return ('ref',) + parse_cell(value)
+        if kind == 'range':
+            start, stop = value.split(':')
+            row0, col0 = parse_cell(start)
+            row1, col1 = parse_cell(stop)
+            if (row0 is None) != (row1 is None):
+                raise FormulaSyntaxError(f'Invalid range: {value}')
+            if row0 is None:
+                row0 = 0
+            else:
+                row0, row1 = min(row0, row1), max(row0, row1)
+            return ('range', row0, min(col0, col1), row1, max(col0, col1))
+        if kind == 'name' and self.at('('):
+            return self.call(value)
+        if kind == 'op' and value == '(':
+            node = self.expression()
+            self.take('op', ')')
+            return node
+        raise FormulaSyntaxError(f'Unexpected {value!r}')
+
+    def call(self, name):
+        self.take('op', '(')
+        args = []
+        function = name.upper()
+        if function not in FUNCTIONS:
+            # =ModelName(A1, B1) predicts with the model of that name
+            args.append(('str', name))
+            function = 'PREDICT'
+        elif function == 'PREDICT':
+            # The model may be quoted or bare, even if its name looks like a cell
+            kind, value = self.take()
+            if kind not in ('string', 'name', 'ref'):
+                raise FormulaSyntaxError('PREDICT needs a model name first')
+            args.append(('str', value[1:-1].replace('""', '"') if kind == 'string' else value))
+            if not self.at(')'):
+                self.take('op', ',')
+        if not self.at(')'):
+            args.append(self.expression())
+            while self.at(','):
+                self.take()
+                args.append(self.expression())
+        self.take('op', ')')
+        return ('call', 'AVG' if function == 'AVERAGE' else function, args)
+
+
+def is_formula(text):
+    return bool(text) and text.startswith('=')
+
+
+@lru_cache(maxsize=65536)
+def parse(text):
+    """Parse formula text (with its leading '='); syntax errors are kept on the result."""
+    try:
+        parser = _Parser(tokenize(text[1:]))
+        tree = parser.expression()
+        if parser.position < len(parser.tokens):
+            raise FormulaSyntaxError(f'Unexpected {parser.peek()[1]!r}')
+        return Formula(text, tree)
+    except FormulaSyntaxError as e:
+        return Formula(text, error=str(e))
+    except RecursionError:
+        # Deep nesting exhausts the recursive descent before any syntax error
+        return Formula(text, error='Formula is nested too deeply')
@@ -0,0 +1,84 @@
+"""HTTP helpers: negotiated response compression and version-based ETags."""
+import gzip
+import hashlib
+
+from flask import current_app, request
+
+from app.instrumentation import span
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = {'application/json', 'text/html', 'text/css', 'text/javascript',
+                      'application/javascript', 'text/csv', 'text/plain'}
+
+
+def _encoding_for(accept_encoding):
+    if brotli is not None and accept_encoding['br']:
+        return 'br'
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """after_request hook compressing text responses for clients that accept it."""
+    min_size = current_app.config.get('COMPRESS_MIN_SIZE', 1024)
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.is_streamed or response.direct_passthrough
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    encoding = _encoding_for(request.accept_encodings)
+    body = response.get_data()
+    if encoding is None or len(body) < min_size:
+        return response
+
+    level = current_app.config.get('COMPRESS_LEVEL', 6)
+    with span('compress'):
+        if encoding == 'br':
+            body = brotli.compress(body, quality=min(level, 11))
+        else:
+            body = gzip.compress(body, compresslevel=level, mtime=0)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+
+    # A strong ETag names one exact byte sequence, so each encoding gets its own
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+    return response
+
+
+def make_etag(*parts):
+    """Build a strong ETag value from the versions and parameters a payload depends on."""
+    return hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def matching_etag(etag):
+    """Return the variant of ``etag`` (in any encoding) named by If-None-Match, or None."""
+    if_none_match = request.if_none_match
+    for candidate in (etag, f'{etag}-gzip', f'{etag}-br'):
+        if if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def not_modified(etag):
+    """An empty 304 response for the ETag the client already holds."""
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def cacheable(response, etag):
+    """Tag a response with ``etag`` and ask clients to revalidate before reuse."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -1,23 +1,83 @@
+from sqlalchemy import inspect, text
 from app import create_app, db
+from app.formulas.engine import recalculate
+from app.models.spreadsheet import Spreadsheet
 from app.models.user import User
 
+def _default_sql(column, dialect):
+    default = column.default
+    if default is None or not default.is_scalar:
+        return ''
+    value = default.arg
+    if isinstance(value, str):
+        return " DEFAULT '" + value.replace("'", "''") + "'"
+    if isinstance(value, bool):
+        # PostgreSQL booleans do not take integers
+        if dialect.name == 'sqlite':
+            return f' DEFAULT {int(value)}'
+        return f" DEFAULT {'TRUE' if value else 'FALSE'}"
+    return f' DEFAULT {value}'
+
+def upgrade_schema():
+    """Create missing tables and add columns introduced since the database was created."""
+    db.create_all()
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{_default_sql(column, db.engine.dialect)}'))
+            # create_all only indexes the tables it creates
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+
+def migrate_legacy_sheets():
+    """Convert spreadsheets still holding JSON cell data to columnar storage."""
+    migrated = 0
+    for spreadsheet_id, in db.session.query(Spreadsheet.id).all():
+        spreadsheet = Spreadsheet.query.get(spreadsheet_id)
+        if spreadsheet.migrate_legacy_data():
+            migrated += 1
+        elif spreadsheet.column_stats is None:
+            spreadsheet.refresh_column_stats()
+        if spreadsheet.formula_version is None:
+            # Sheets saved before formulas were evaluated on the server
+            recalculate(spreadsheet, spreadsheet.version)
+        db.session.commit()
+        db.session.expunge_all()
+    return migrated
+
+def bootstrap():
+    """Bring the schema up to date and seed the demo user. Must run inside an app context."""
+    # Create all tables and bring existing ones up to date
+    upgrade_schema()
+
+    migrated = migrate_legacy_sheets()
+    if migrated:
+        print(f"Migrated {migrated} spreadsheet(s) to columnar storage")
+
+    # Check if demo user exists
+    demo_user = User.query.filter_by(username='demo').first()
+    if not demo_user:
+        # Create demo user
+        demo_user = User(username='demo')
+        demo_user.set_password('cNrV70Mr$4#%')
+        db.session.add(demo_user)
+        db.session.commit()
+        print("Demo user created successfully")
+    else:
+        print("Demo user already exists")
+
 def init_db():
     app = create_app()
     with app.app_context():
-        # Create all tables
-        db.create_all()
-        
-        # Check if demo user exists
-        demo_user = User.query.filter_by(username='demo').first()
-        if not demo_user:
-            # Create demo user
-            demo_user = User(username='demo')
-            demo_user.set_password('cNrV70Mr$4#%')
-            db.session.add(demo_user)
-            db.session.commit()
-            print("Demo user created successfully")
-        else:
-            print("Demo user already exists")
+        bootstrap()
 
 if __name__ == '__main__':
-    init_db() 
\ No newline at end of file
+    init_db()
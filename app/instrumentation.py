@@ -0,0 +1,273 @@
+"""Request instrumentation: timing spans, SQL counts, Server-Timing and Prometheus metrics.
+
+Code on the hot paths wraps itself in ``span(name)`` (or ``@timed(name)``);
+within a request, each span's calls and time add up in ``g``, alongside
+the count and duration of every SQL statement. Spans outside a request,
+such as fits in the training worker processes, cost one check and record
+nothing. When the response goes out, its spans are sent in a
+``Server-Timing`` header (shown by browser dev tools) and added to the
+process's totals, which ``/metrics`` serves in the Prometheus text format
+with request counts, latency histograms and response sizes per endpoint.
+Every gunicorn worker keeps its own totals, labelled with its pid.
+
+Setting PROFILE_SLOW_MS turns on the sampling profiler: a background
+thread samples the stack of every request thread each PROFILE_INTERVAL_MS,
+and requests slower than the threshold are written to PROFILE_DIR as
+folded stacks, one ``frame;frame;frame count`` line per distinct stack,
+the input of flamegraph.pl and speedscope.
+"""
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+import os
+import sys
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from app import db
+
+# Upper bounds of the request latency histogram, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+@contextmanager
+def span(name):
+    """Add the time spent in the block to the current request's ``name`` span."""
+    if not has_request_context() or 'spans' not in g:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = g.spans[name]
+        record[0] += 1
+        record[1] += time.perf_counter() - started
+
+
+def timed(name):
+    """Decorator recording every call of the function in the ``name`` span."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Metrics:
+    """Per-process request totals, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()  # (endpoint, method, status) -> requests
+        self.latency = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))  # endpoint -> bucket counts
+        self.latency_sum = Counter()
+        self.response_bytes = Counter()
+        self.sql_queries = Counter()
+        self.sql_seconds = Counter()
+        self.span_calls = Counter()
+        self.span_seconds = Counter()
+        self.profiles = 0
+
+    def observe(self, endpoint, method, status, seconds, size, spans, sql):
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            buckets = self.latency[endpoint]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            self.latency_sum[endpoint] += seconds
+            self.response_bytes[endpoint] += size
+            self.sql_queries[endpoint] += sql[0]
+            self.sql_seconds[endpoint] += sql[1]
+            for name, (calls, spent) in spans.items():
+                self.span_calls[name] += calls
+                self.span_seconds[name] += spent
+
+    def count_profile(self):
+        with self._lock:
+            self.profiles += 1
+
+    def render(self, extra=()):
+        pid = os.getpid()
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in samples:
+                labels = dict(labels, pid=pid)
+                rendered = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+                lines.append(f'{name}{suffix}{{{rendered}}} {value:g}' if isinstance(value, float)
+                             else f'{name}{suffix}{{{rendered}}} {value}')
+
+        with self._lock:
+            family('spreadml_requests_total', 'counter', 'Requests served.',
+                   [('', {'endpoint': e, 'method': m, 'status': s}, n)
+                    for (e, m, s), n in sorted(self.requests.items())])
+            samples = []
+            for endpoint, buckets in sorted(self.latency.items()):
+                total = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                    total += count
+                    samples.append(('_bucket', {'endpoint': endpoint, 'le': str(bound)}, total))
+                samples.append(('_sum', {'endpoint': endpoint}, float(self.latency_sum[endpoint])))
+                samples.append(('_count', {'endpoint': endpoint}, total))
+            family('spreadml_request_duration_seconds', 'histogram', 'Time to build a response.', samples)
+            family('spreadml_response_bytes_total', 'counter', 'Response body bytes sent, after compression.',
+                   [('', {'endpoint': e}, n) for e, n in sorted(self.response_bytes.items())])
+            family('spreadml_sql_queries_total', 'counter', 'SQL statements run while serving requests.',
+                   [('', {'endpoint': e}, n) for e, n in sorted(self.sql_queries.items())])
+            family('spreadml_sql_seconds_total', 'counter', 'Time spent in SQL statements.',
+                   [('', {'endpoint': e}, float(n)) for e, n in sorted(self.sql_seconds.items())])
+            family('spreadml_span_calls_total', 'counter', 'Calls of each instrumented code path.',
+                   [('', {'span': s}, n) for s, n in sorted(self.span_calls.items())])
+            family('spreadml_span_seconds_total', 'counter', 'Time spent in each instrumented code path.',
+                   [('', {'span': s}, float(n)) for s, n in sorted(self.span_seconds.items())])
+            family('spreadml_profiles_total', 'counter', 'Slow requests written out by the profiler.',
+                   [('', {}, self.profiles)])
+        for name, kind, help_text, samples in extra:
+            family(name, kind, help_text, samples)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+
+
+class Sampler:
+    """Samples the stacks of registered threads from one background thread."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stacks = {}  # thread id -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._stacks[thread_id] = Counter()
+            # Started on first use, so a preloading master never forks it away
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._stacks.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, stacks in self._stacks.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[_folded(frame)] += 1
+
+
+def _folded(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _endpoint():
+    return request.url_rule.endpoint if request.url_rule is not None else 'unmatched'
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.spans = defaultdict(lambda: [0, 0.0])
+    g.sql = [0, 0.0]
+    sampler = current_app.extensions.get('sampler')
+    if sampler is not None:
+        sampler.start(threading.get_ident())
+
+
+def _finish_request(response):
+    if 'request_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    spans = g.spans
+    entries = [f'{name};dur={spent * 1000:.2f};desc="{calls} call{"s" if calls != 1 else ""}"'
+               for name, (calls, spent) in sorted(spans.items())]
+    entries.append(f'sql;dur={g.sql[1] * 1000:.2f};desc="{g.sql[0]} quer{"ies" if g.sql[0] != 1 else "y"}"')
+    entries.append(f'app;dur={elapsed * 1000:.2f}')
+    response.headers['Server-Timing'] = ', '.join(entries)
+    size = 0 if response.is_streamed else (response.content_length or 0)
+    metrics.observe(_endpoint(), request.method, str(response.status_code), elapsed, size, spans, g.sql)
+    return response
+
+
+def _write_profile(error=None):
+    sampler = current_app.extensions.get('sampler')
+    if sampler is None:
+        return
+    stacks = sampler.stop(threading.get_ident())
+    if not stacks or 'request_started' not in g:
+        return
+    elapsed_ms = (time.perf_counter() - g.request_started) * 1000
+    if elapsed_ms < current_app.config['PROFILE_SLOW_MS']:
+        return
+    directory = current_app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{datetime.utcnow():%Y%m%dT%H%M%S%f}-{_endpoint()}-'
+                                   f'{elapsed_ms:.0f}ms-{os.getpid()}.folded')
+    with open(path, 'w') as f:
+        for stack, count in stacks.most_common():
+            f.write(f'{stack} {count}\n')
+    metrics.count_profile()
+    current_app.logger.info('Profiled %s %s (%.0f ms, %d samples) to %s',
+                            request.method, request.path, elapsed_ms, sum(stacks.values()), path)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql' in g:
+        g.sql[0] += 1
+        g.sql[1] += time.perf_counter() - conn.info['query_started']
+
+
+def init_instrumentation(app):
+    """Time every request of ``app``; must be registered before other after_request hooks."""
+    if not app.config['INSTRUMENTATION']:
+        return
+    app.before_request(_start_request)
+    # after_request hooks run in reverse order, so this one sees the final (compressed) body
+    app.after_request(_finish_request)
+    if app.config['PROFILE_SLOW_MS']:
+        app.extensions['sampler'] = Sampler(app.config['PROFILE_INTERVAL_MS'] / 1000)
+        app.teardown_request(_write_profile)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    # Time JSON encoding of responses
+    class TimedJSONEncoder(app.json_encoder):
+        def encode(self, o):
+            with span('json'):
+                return super().encode(o)
+
+    app.json_encoder = TimedJSONEncoder
@@ -2,4 +2,9 @@ from flask import Blueprint
 
 bp = Blueprint('ml', __name__, url_prefix='/ml')
 
+@bp.record_once
+def configure_cache(state):
+    from app.ml.predictor import predictor_cache
+    predictor_cache.maxsize = state.app.config.get('PREDICTOR_CACHE_SIZE', predictor_cache.maxsize)
+
 from app.ml import routes 
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""Fitted estimators persisted as versioned, checksummed joblib files.
+
+Each fit of a model is written to ``<ARTIFACT_DIR>/model-<id>-v<version>.joblib``
+and described by a small record kept in ``MLModel.parameters``. Loading
+verifies the SHA-256 checksum and memory-maps the estimator's arrays, so
+large coefficient matrices are paged in only when used. joblib (and the
+scikit-learn classes an estimator unpickles into) is imported on first use,
+so web workers that never touch an artifact never load it.
+"""
+import hashlib
+import os
+
+from flask import current_app
+
+ARTIFACT_FORMAT = 'joblib'
+
+
+def artifact_dir():
+    path = current_app.config['ARTIFACT_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_artifact(model_id, version, estimator):
+    """Write ``estimator`` for one model version and return its artifact record."""
+    filename = f'model-{model_id}-v{version}.{ARTIFACT_FORMAT}'
+    path = os.path.join(artifact_dir(), filename)
+    # Write under a temporary name so a reader never sees a partial file
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    import joblib
+    joblib.dump(estimator, tmp_path)
+    os.replace(tmp_path, path)
+    return {
+        'format': ARTIFACT_FORMAT,
+        'file': filename,
+        'version': version,
+        'sha256': _checksum(path),
+        'bytes': os.path.getsize(path),
+    }
+
+
+def load_artifact(record):
+    """Load the estimator described by an artifact record, checking its checksum."""
+    path = os.path.join(artifact_dir(), record['file'])
+    if _checksum(path) != record['sha256']:
+        raise ValueError(f"Artifact {record['file']} failed its checksum")
+    import joblib
+    return joblib.load(path, mmap_mode='r')
+
+
+def delete_artifacts(model_id, keep=None):
+    """Remove a model's artifact files, except the one named ``keep``."""
+    prefix = f'model-{model_id}-v'
+    for filename in os.listdir(artifact_dir()):
+        if filename.startswith(prefix) and filename != keep:
+            os.remove(os.path.join(artifact_dir(), filename))
+
+
+def remove_artifact(record):
+    """Remove one artifact file, e.g. after the fit that wrote it was rolled back."""
+    path = os.path.join(artifact_dir(), record['file'])
+    if os.path.exists(path):
+        os.remove(path)
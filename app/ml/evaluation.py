@@ -0,0 +1,159 @@
+"""K-fold cross-validation and hyperparameter search on a process pool.
+
+Rows are assigned to folds by a hash of their row number (see
+app.ml.training.fold_ids). Every (candidate, fold) pair is one task: fit on
+the other folds and score on this one. Tasks run on a pool of spawned
+processes that each receive the training matrix once, through the pool
+initializer, rather than with every task.
+
+A search stops early when its time budget runs out, when ``patience``
+candidates in a row finish without beating the best mean score, or when
+``should_stop()`` says so (the job was cancelled). Candidates with every
+fold scored are ranked; the rest are reported as incomplete.
+"""
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from app.ml.families import family_of
+from app.ml.training import fold_ids
+
+# Set in each pool process by _init_pool
+_X = None
+_y = None
+_folds = None
+
+
+def _init_pool(X, y, folds):
+    global _X, _y, _folds
+    _X, _y, _folds = X, y, folds
+
+
+def _run_fold(task):
+    """Fit one candidate on all folds but one and score it on that fold."""
+    from sklearn.metrics import accuracy_score, mean_squared_error, r2_score
+
+    index, model_type, params, fold = task
+    started = time.perf_counter()
+    test = _folds == fold
+    # Row indices rather than masks, which sparse matrices index as well
+    train_rows, test_rows = np.flatnonzero(~test), np.flatnonzero(test)
+    result = {'candidate': index, 'fold': fold, 'train_rows': int((~test).sum()), 'test_rows': int(test.sum()),
+              'pid': os.getpid(), 'error': None}
+    try:
+        family = family_of(params)
+        # The pool already spreads tasks over the cores, so each fit keeps to one
+        model = family.build(model_type, params, n_jobs=1)
+        model.fit(family.inputs(_X[train_rows]), _y[train_rows])
+        result['fit_seconds'] = time.perf_counter() - started
+        predicted = family.predict(model, _X[test_rows])
+        if model_type == 'regression':
+            result['metrics'] = {'r2': float(r2_score(_y[test_rows], predicted)),
+                                 'mse': float(mean_squared_error(_y[test_rows], predicted))}
+        else:
+            result['metrics'] = {'accuracy': float(accuracy_score(_y[test_rows], predicted))}
+    except Exception as e:
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def cross_validate(X, y, rows, model_type, candidates, folds=5, time_budget=60.0, patience=None,
+                   workers=None, should_stop=None):
+    """Cross-validate each hyperparameter candidate; returns a JSON-ready report.
+
+    ``rows`` are the sheet row numbers of X and y. Classification targets
+    should already be label-encoded.
+    """
+    started = time.perf_counter()
+    if len(y) < folds:
+        raise ValueError(f'Not enough data for {folds}-fold cross-validation')
+    fold_of = fold_ids(rows, folds)
+    metric = 'r2' if model_type == 'regression' else 'accuracy'
+
+    tasks = [(index, model_type, params, fold) for index, params in enumerate(candidates) for fold in range(folds)]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    results = {index: [] for index in range(len(candidates))}
+    best = None
+    since_best = 0
+    stopped = None
+
+    pool = multiprocessing.get_context('spawn').Pool(workers, initializer=_init_pool, initargs=(X, y, fold_of))
+    try:
+        # Candidate-major order, so candidates finish roughly one after another
+        outcomes = pool.imap_unordered(_run_fold, tasks)
+        for _ in range(len(tasks)):
+            while True:
+                remaining = time_budget - (time.perf_counter() - started)
+                if remaining <= 0:
+                    stopped = 'time_budget'
+                    break
+                if should_stop is not None and should_stop():
+                    stopped = 'cancelled'
+                    break
+                try:
+                    # Wake up now and then to check for cancellation
+                    outcome = outcomes.next(timeout=min(remaining, 1.0))
+                    break
+                except multiprocessing.TimeoutError:
+                    continue
+            if stopped:
+                break
+
+            scores = results[outcome['candidate']]
+            scores.append(outcome)
+            if len(scores) < folds:
+                continue
+            mean = _mean_score(scores, metric)
+            if mean is not None and (best is None or mean > best):
+                best = mean
+                since_best = 0
+            else:
+                since_best += 1
+                if patience and since_best >= patience:
+                    stopped = 'early_stopping'
+                    break
+    finally:
+        # Drops queued tasks and stops any fit still running
+        pool.terminate()
+        pool.join()
+
+    wall = time.perf_counter() - started
+    report = []
+    for index, params in enumerate(candidates):
+        scores = sorted(results[index], key=lambda outcome: outcome['fold'])
+        complete = len(scores) == folds
+        mean = _mean_score(scores, metric) if complete else None
+        values = [outcome['metrics'][metric] for outcome in scores if outcome['error'] is None]
+        report.append({
+            'params': params,
+            'complete': complete,
+            'mean': mean,
+            'std': float(np.std(values)) if complete and mean is not None else None,
+            'folds': scores,
+        })
+    ranked = sorted((c for c in report if c['mean'] is not None), key=lambda c: c['mean'], reverse=True)
+    fold_seconds = sum(outcome['seconds'] for c in report for outcome in c['folds'])
+    return {
+        'metric': metric,
+        'folds': folds,
+        'workers': workers,
+        'stopped': stopped,
+        'candidates_evaluated': len(ranked),
+        'candidates_total': len(candidates),
+        'best': {'params': ranked[0]['params'], 'mean': ranked[0]['mean'], 'std': ranked[0]['std']} if ranked else None,
+        'wall_seconds': wall,
+        'fold_seconds': fold_seconds,
+        # Sum of per-fold times over wall time; includes pool start-up
+        'speedup': fold_seconds / wall if wall else None,
+        'candidates': ranked + [c for c in report if c['mean'] is None],
+    }
+
+
+def _mean_score(scores, metric):
+    # A candidate whose fit failed on any fold is not ranked
+    if any(outcome['error'] for outcome in scores):
+        return None
+    return float(np.mean([outcome['metrics'][metric] for outcome in scores]))
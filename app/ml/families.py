@@ -0,0 +1,145 @@
+"""Registry of the model families a regression or classification can be fitted with.
+
+A family names its estimator for each task, the hyperparameters it takes
+(default and the (low, high) range a search explores on a log scale) and
+how it is fitted and scored:
+
+- ``linear`` and ``ridge`` are fitted by app.ml.training itself: least
+  squares from block moments for regression (with the ridge penalty
+  ``alpha``, 0 for ``linear`` by default), a warm-startable logistic
+  regression for classification.
+- ``lasso`` and ``elastic_net`` are L1 / mixed-penalty linear models.
+- ``random_forest`` and ``gradient_boosting`` are tree ensembles, fitted
+  on every core: the forest through ``n_jobs``, histogram gradient
+  boosting through its own threads. The latter needs dense inputs.
+
+Linear families store their coefficients, so their predictors score with
+one matrix product; the others are scored by their estimator, through
+``Family.predict``. New families register with ``register``. Building an
+estimator imports scikit-learn; importing this module does not.
+"""
+DEFAULT_FAMILY = 'linear'
+
+# Inverse regularization strength of a logistic regression
+_C = {'C': (1.0, (1e-3, 1e3))}
+_L1_RATIO = {'l1_ratio': (0.5, (0.05, 1.0))}
+_FOREST = {'n_estimators': (100, (10, 500)), 'max_depth': (0, (2, 32)), 'min_samples_leaf': (1, (1, 50))}
+_BOOSTING = {'learning_rate': (0.1, (0.01, 1.0)), 'max_iter': (100, (10, 500)), 'max_leaf_nodes': (31, (4, 255))}
+
+
+class Family:
+    """One model family: its hyperparameter spaces and estimator builders per task."""
+
+    def __init__(self, name, label, regression, classification, build, linear=False, native=False, dense=False):
+        self.name = name
+        self.label = label
+        self.spaces = {'regression': regression, 'classification': classification}
+        self._build = build
+        # Scored from stored coefficients
+        self.linear = linear
+        # Fitted by app.ml.training itself (block moments, warm-started logistic regression)
+        self.native = native
+        self.dense = dense
+
+    def space(self, model_type):
+        # Anything but regression is trained as a classifier
+        return self.spaces['regression' if model_type == 'regression' else 'classification']
+
+    def build(self, model_type, params, n_jobs=None):
+        """A new unfitted estimator; ``n_jobs`` caps the cores an ensemble uses (None for all)."""
+        return self._build(model_type == 'regression', params, n_jobs or -1)
+
+    def inputs(self, X):
+        """``X`` in the form the family's estimators accept."""
+        if self.dense and hasattr(X, 'toarray'):
+            # Bounded by the one-hot limit per categorical input
+            return X.toarray()
+        return X
+
+    def predict(self, estimator, X):
+        """Batch prediction: values, or label-encoded class indices."""
+        return estimator.predict(self.inputs(X))
+
+    def predict_proba(self, estimator, X):
+        return estimator.predict_proba(self.inputs(X))
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'label': self.label,
+            'linear': self.linear,
+            'hyperparameters': {task: {param: {'default': default, 'range': list(bounds)}
+                                       for param, (default, bounds) in space.items()}
+                                for task, space in self.spaces.items()},
+        }
+
+
+FAMILIES = {}
+
+
+def register(family):
+    FAMILIES[family.name] = family
+    return family
+
+
+def get_family(name):
+    family = FAMILIES.get(name or DEFAULT_FAMILY)
+    if family is None:
+        raise ValueError(f"Unknown model family: {name}. Choose one of {', '.join(FAMILIES)}")
+    return family
+
+
+def family_of(params):
+    """The family of stored hyperparameters; fits made before families existed are linear."""
+    return get_family((params or {}).get('family'))
+
+
+def _linear(regression, params, n_jobs):
+    if regression:
+        from sklearn.linear_model import LinearRegression, Ridge
+        return Ridge(alpha=params['alpha']) if params['alpha'] else LinearRegression()
+    from sklearn.linear_model import LogisticRegression
+    return LogisticRegression(C=params['C'], max_iter=1000)
+
+
+def _lasso(regression, params, n_jobs):
+    if regression:
+        from sklearn.linear_model import Lasso
+        return Lasso(alpha=params['alpha'], max_iter=5000)
+    from sklearn.linear_model import LogisticRegression
+    return LogisticRegression(penalty='l1', C=params['C'], solver='saga', max_iter=2000)
+
+
+def _elastic_net(regression, params, n_jobs):
+    if regression:
+        from sklearn.linear_model import ElasticNet
+        return ElasticNet(alpha=params['alpha'], l1_ratio=params['l1_ratio'], max_iter=5000)
+    from sklearn.linear_model import LogisticRegression
+    return LogisticRegression(penalty='elasticnet', C=params['C'], l1_ratio=params['l1_ratio'], solver='saga',
+                              max_iter=2000)
+
+
+def _random_forest(regression, params, n_jobs):
+    from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+    cls = RandomForestRegressor if regression else RandomForestClassifier
+    return cls(n_estimators=params['n_estimators'], max_depth=params['max_depth'] or None,
+               min_samples_leaf=params['min_samples_leaf'], n_jobs=n_jobs, random_state=0)
+
+
+def _gradient_boosting(regression, params, n_jobs):
+    # Threads come from OpenMP, which uses every core unless OMP_NUM_THREADS says otherwise
+    from sklearn.ensemble import HistGradientBoostingClassifier, HistGradientBoostingRegressor
+    cls = HistGradientBoostingRegressor if regression else HistGradientBoostingClassifier
+    return cls(learning_rate=params['learning_rate'], max_iter=params['max_iter'],
+               max_leaf_nodes=params['max_leaf_nodes'], random_state=0)
+
+
+register(Family('linear', 'Linear / logistic regression', {'alpha': (0.0, (1e-4, 1e3))}, _C, build=_linear,
+                linear=True, native=True))
+register(Family('ridge', 'Ridge (L2)', {'alpha': (1.0, (1e-4, 1e3))}, _C, build=_linear, linear=True, native=True))
+register(Family('lasso', 'Lasso (L1)', {'alpha': (0.01, (1e-5, 10.0))}, _C, build=_lasso, linear=True))
+register(Family('elastic_net', 'Elastic net', {'alpha': (0.01, (1e-5, 10.0)), **_L1_RATIO}, {**_C, **_L1_RATIO},
+                build=_elastic_net, linear=True))
+register(Family('random_forest', 'Random forest', _FOREST, _FOREST, build=_random_forest))
+register(Family('gradient_boosting', 'Gradient boosting', _BOOSTING, _BOOSTING, build=_gradient_boosting,
+                dense=True))
@@ -0,0 +1,99 @@
+"""Tunable hyperparameters of each model family and the candidates a search tries.
+
+The parameters, defaults and search ranges of each family are in the
+registry (app.ml.families). Kept free of scikit-learn so request handlers
+can validate parameters without loading it.
+"""
+import itertools
+import random
+
+import numpy as np
+
+from app.ml.families import DEFAULT_FAMILY, get_family
+
+# Candidates in a default grid, split evenly over the family's hyperparameters
+GRID_POINTS = 8
+
+
+def _space(model_type, family=DEFAULT_FAMILY):
+    return get_family(family).space(model_type)
+
+
+def clean_params(model_type, raw):
+    """Validate hyperparameter values from a request, filling in defaults for the rest.
+
+    ``family`` selects the model family (linear by default); the result
+    names it alongside its parameters. Whole-number parameters are rounded.
+    """
+    family = get_family(raw.get('family') if raw else None).name
+    params = {'family': family}
+    for name, (default, _) in _space(model_type, family).items():
+        value = raw.get(name) if raw else None
+        if value in (None, ''):
+            params[name] = default
+            continue
+        value = float(value)
+        if (not np.isfinite(value) or value < 0 or (name in ('C', 'learning_rate') and value == 0)
+                or (name == 'l1_ratio' and value > 1)):
+            raise ValueError(f'Invalid value for {name}: {value}')
+        if isinstance(default, int):
+            value = int(round(value))
+            if value < 1 and default > 0:
+                raise ValueError(f'Invalid value for {name}: {value}')
+        params[name] = value
+    return params
+
+
+def search_candidates(model_type, search, space=None, n_iter=10, seed=0, family=DEFAULT_FAMILY):
+    """List the hyperparameter settings a search evaluates for one model ``family``.
+
+    ``search`` is 'none' (just the defaults overridden by ``space``), 'grid'
+    (every combination of the values listed per parameter in ``space``, or
+    log-spaced values over the default range, about GRID_POINTS combinations
+    in all) or 'random'
+    (``n_iter`` draws, log-uniform over the ``[low, high]`` range given per
+    parameter in ``space`` or the default range).
+    """
+    space = space or {}
+    family = get_family(family).name
+    unknown = set(space) - set(_space(model_type, family))
+    if unknown:
+        raise ValueError(f"Unknown hyperparameters for {family} {model_type}: {', '.join(sorted(unknown))}")
+
+    def clean(values):
+        return clean_params(model_type, dict(values, family=family))
+
+    if search == 'none':
+        return [clean({name: value for name, value in space.items() if not isinstance(value, list)})]
+
+    values = {}
+    params = _space(model_type, family)
+    # So a family with more hyperparameters does not get a grid of GRID_POINTS ** n candidates
+    points = max(2, int(round(GRID_POINTS ** (1 / len(params))))) if params else 0
+    for name, (_, (low, high)) in params.items():
+        given = space.get(name)
+        if search == 'grid':
+            if given is None:
+                given = np.geomspace(low, high, points).tolist()
+            # Rounding whole-number parameters can repeat values
+            cleaned = [clean({name: value})[name] for value in (given if isinstance(given, list) else [given])]
+            values[name] = sorted(set(cleaned), key=cleaned.index)
+        elif search == 'random':
+            if given is not None:
+                if not isinstance(given, list) or len(given) != 2:
+                    raise ValueError(f'Random search needs a [low, high] range for {name}')
+                low, high = (clean({name: value})[name] for value in given)
+                if not 0 < low <= high:
+                    raise ValueError(f'Invalid range for {name}')
+            values[name] = (low, high)
+        else:
+            raise ValueError(f'Unknown search: {search}')
+
+    if search == 'grid':
+        names = sorted(values)
+        return [dict(zip(names, combination), family=family)
+                for combination in itertools.product(*(values[n] for n in names))]
+
+    rng = random.Random(seed)
+    return [clean({name: float(np.exp(rng.uniform(np.log(low), np.log(high)))) for name, (low, high) in values.items()})
+            for _ in range(n_iter)]
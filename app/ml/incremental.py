@@ -0,0 +1,167 @@
+"""Refreshing a fitted model from the parts of its sheet that changed.
+
+A model's ``fit_state`` records, for every block of CHUNK_ROWS rows, which
+of its columns hold data there and, for regression, the moments of the
+block's training and held-out rows (see app.ml.training). Each chunk is
+stamped with the sheet version that last wrote it, so a refresh reads only
+the blocks written after the model's ``sheet_version`` and merges their new
+moments with the stored ones of every other block: its cost follows the
+edit, not the size of the sheet.
+
+Logistic regression, the other model families (see app.ml.families) and
+regression on categorical inputs (whose one-hot features follow the
+categories of the whole sheet) have no such statistics. Whether an input
+is categorical is decided as the encoder decides it (see
+app.ml.preprocessing), from per-block counts of its cells in the
+training rows kept with the moments. A refresh still
+skips the fit when none of the model's blocks changed; otherwise it reads
+every row, and a logistic regression starts the solver from the previous
+coefficients.
+"""
+from collections import defaultdict
+import json
+import time
+
+from app import db
+from app.instrumentation import span
+from app.ml.families import family_of
+from app.ml.hyperparameters import clean_params
+from app.ml.matrix import build_training_matrix
+from app.ml.preprocessing import input_counts, is_categorical
+from app.ml.training import fit_linear, holdout_mask, moments, prediction_latency, split_moments, train_model
+from app.models.spreadsheet import SheetChunk
+from app.storage.columnar import CHUNK_ROWS, column_index
+
+
+def column_blocks(spreadsheet, cols):
+    """Map each row block holding any of ``cols`` to ``(latest chunk version, columns present)``."""
+    versions = defaultdict(int)
+    present = defaultdict(list)
+    query = db.session.query(SheetChunk.chunk, SheetChunk.col, SheetChunk.version).filter(
+        SheetChunk.spreadsheet_id == spreadsheet.id, SheetChunk.col.in_(cols))
+    for number, col, version in query:
+        versions[number] = max(versions[number], version)
+        present[number].append(col)
+    return {number: (versions[number], sorted(present[number])) for number in versions}
+
+
+def _previous_state(model, input_cols, output_col, model_type):
+    if model is None or model.sheet_version is None or not model.fit_state:
+        return None
+    state = json.loads(model.fit_state)
+    if (state.get('model_type'), state.get('input_columns'), state.get('output_column')) != (
+            model_type, input_cols, output_col):
+        return None
+    return state
+
+
+def _sum_reports(reports):
+    total = defaultdict(int)
+    for report in reports:
+        for key, value in report.items():
+            total[key] += value
+    return dict(total)
+
+
+def fit_sheet(spreadsheet, input_cols, output_col, model_type, model=None, params=None):
+    """Fit a model on the sheet, or refresh ``model`` from the blocks changed since its last fit.
+
+    ``params`` are hyperparameters as returned by ``clean_params``. The stored
+    moments do not depend on them, so a refresh may change them too.
+
+    Returns ``(estimator, metrics, state)``, where ``state`` is the new
+    ``fit_state``. Estimator and metrics are None when a refresh finds that
+    nothing the model reads has changed.
+    """
+    started = time.perf_counter()
+    params = params or clean_params(model_type, {})
+    # Read the version before any cells: a save landing mid-refresh only makes
+    # the next refresh re-read its blocks
+    sheet_version = spreadsheet.version
+    cols = sorted({column_index(col) for col in input_cols + [output_col]})
+    state = {
+        'sheet_version': sheet_version,
+        'model_type': model_type,
+        'input_columns': input_cols,
+        'output_column': output_col,
+        'blocks': {},
+    }
+
+    if spreadsheet.has_legacy_data():
+        # Legacy JSON cells have no chunk versions to compare
+        estimator, metrics = train_model(spreadsheet.load_columns(cols), input_cols, output_col, model_type,
+                                         params=params)
+        metrics['fit'].update(blocks_read=1, blocks_total=1, sheet_version=sheet_version)
+        return estimator, metrics, state
+
+    previous = _previous_state(model, input_cols, output_col, model_type)
+    stored = previous['blocks'] if previous else {}
+    blocks = column_blocks(spreadsheet, cols)
+    dirty = sorted(number for number, (version, present) in blocks.items()
+                   if str(number) not in stored or stored[str(number)]['cols'] != present
+                   or version > previous['sheet_version'])
+
+    if previous and not dirty and set(stored) == {str(number) for number in blocks}:
+        state['blocks'] = stored
+        return None, None, state
+
+    # Categorical inputs are encoded over the whole sheet's categories, so
+    # only linear regressions on numeric inputs are solved from per-block moments.
+    # A column holding nothing but text goes straight to a full fit
+    types = spreadsheet.column_types()
+    from_moments = (model_type == 'regression' and family_of(params).native
+                    and not any(types.get(col) == 'string' for col in input_cols))
+    if from_moments:
+        if any('train' not in block or 'inputs' not in block for block in stored.values()):
+            # Last fitted without block moments or input counts, so every block is read
+            dirty = sorted(blocks)
+        # Fit time covers the block moments, which are most of the work of a moment fit
+        fit_started = time.perf_counter()
+        held_X = None
+        for number, (_, present) in blocks.items():
+            if number not in dirty:
+                state['blocks'][str(number)] = stored[str(number)]
+                continue
+            start = number * CHUNK_ROWS
+            columns = spreadsheet.load_columns(cols, start, min(start + CHUNK_ROWS, spreadsheet.n_rows or 0))
+            with span('matrix'):
+                X, y, report, rows = build_training_matrix(columns, input_cols, output_col, model_type,
+                                                           with_rows=True)
+            held = holdout_mask(rows + start)
+            held_X = X[held]
+            state['blocks'][str(number)] = {
+                'cols': present,
+                'train': moments(X[~held], y[~held]),
+                'test': moments(X[held], y[held]),
+                'report': report,
+                'inputs': {col: input_counts(columns[column_index(col)], rows) for col in input_cols},
+            }
+        records = state['blocks'].values()
+        # Text in only some rows (a 'mixed' column) still makes an input categorical
+        # when it is all the training rows hold
+        from_moments = not any(is_categorical(sum(block['inputs'][col][0] for block in records),
+                                              sum(block['inputs'][col][1] for block in records))
+                               for col in input_cols)
+    if from_moments:
+        records = state['blocks'].values()
+        with span('fit'):
+            estimator, metrics = fit_linear(*split_moments([block['train'] for block in records],
+                                                           [block['test'] for block in records]),
+                                            alpha=params['alpha'])
+        metrics['data'] = _sum_reports(block['report'] for block in records)
+        fit_seconds = time.perf_counter() - fit_started
+        metrics['fit'] = {'mode': 'incremental' if previous else 'full', 'fit_seconds': round(fit_seconds, 4),
+                          # Timed on the held-out rows of the last block read
+                          'predict_us_per_row': prediction_latency(family_of(params), estimator, held_X)
+                          if held_X is not None else None}
+        metrics['params'] = params
+    else:
+        warm_start = json.loads(model.metrics) if previous else None
+        estimator, metrics = train_model(spreadsheet.load_columns(cols), input_cols, output_col, model_type,
+                                         warm_start=warm_start, params=params)
+        state['blocks'] = {str(number): {'cols': present} for number, (_, present) in blocks.items()}
+
+    metrics['fit'].update(blocks_read=len(dirty) if from_moments else len(blocks),
+                          blocks_total=len(blocks), sheet_version=sheet_version,
+                          seconds=round(time.perf_counter() - started, 4))
+    return estimator, metrics, state
@@ -0,0 +1,304 @@
+"""Background training jobs.
+
+``/ml/create`` and ``/ml/retrain`` record a TrainingJob and hand its id to a
+pool of worker processes, so a slow fit never ties up a web worker. Job
+state lives in the database, which lets any web process report status or
+cancel a job: a worker only starts a job it can move from ``queued`` to
+``running``, and only stores the fit if the job is still ``running`` when
+it finishes. Jobs for an existing model run one at a time; a job that
+finds another fit of its model running stays queued and is resubmitted
+when that fit ends.
+
+Saves queue ``refresh`` jobs for the models reading the changed columns
+(see ``refresh_models``); these fold only the changed row blocks into the
+existing fit (see app.ml.incremental).
+
+Importing this module does not import scikit-learn; only the training
+processes (or a web process running a job inline) load it.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import json
+import multiprocessing
+import threading
+
+from flask import current_app
+from sqlalchemy.orm import aliased
+
+from app import db
+from app.ml.artifacts import delete_artifacts, remove_artifact, save_artifact
+from app.models.ml_model import MLModel
+from app.models.spreadsheet import Spreadsheet
+from app.models.training_job import TrainingJob
+from app.storage.columnar import column_letter
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def active_jobs(user_id):
+    """Number of the user's own (not automatic refresh) jobs that are queued or running."""
+    return TrainingJob.query.filter(TrainingJob.user_id == user_id, TrainingJob.refresh.is_(False),
+                                    TrainingJob.status.in_(TrainingJob.ACTIVE)).count()
+
+
+def cancel_job(job_id):
+    """Cancel a queued or running job; returns False if it had already finished."""
+    cancelled = TrainingJob.query.filter(TrainingJob.id == job_id,
+                                         TrainingJob.status.in_(TrainingJob.ACTIVE)).update(
+        {TrainingJob.status: TrainingJob.CANCELLED, TrainingJob.finished_at: datetime.utcnow()},
+        synchronize_session=False)
+    db.session.commit()
+    return bool(cancelled)
+
+
+def refresh_models(spreadsheet, base_version, cols=None):
+    """Queue refreshes after a save moved ``spreadsheet`` on from ``base_version``.
+
+    Models reading any of the changed column indices ``cols`` (every column if
+    None) get a refresh job unless one is already queued. The others were not
+    affected, so if they were current at ``base_version`` they are marked
+    current at the new version without a fit. Returns the queued jobs.
+    """
+    if not current_app.config['MODEL_AUTO_REFRESH']:
+        return []
+    changed = None if cols is None else {column_letter(col) for col in cols}
+    models = db.session.query(MLModel.id, MLModel.name, MLModel.model_type, MLModel.input_columns,
+                              MLModel.output_column).filter(MLModel.spreadsheet_id == spreadsheet.id).all()
+    queued = {model_id for model_id, in db.session.query(TrainingJob.model_id).filter(
+        TrainingJob.spreadsheet_id == spreadsheet.id, TrainingJob.status == TrainingJob.QUEUED)}
+
+    unaffected = []
+    jobs = []
+    for model in models:
+        used = set(json.loads(model.input_columns)) | {model.output_column}
+        if changed is not None and not used & changed:
+            unaffected.append(model.id)
+        elif model.id not in queued:
+            jobs.append(TrainingJob(
+                user_id=spreadsheet.user_id,
+                spreadsheet_id=spreadsheet.id,
+                model_id=model.id,
+                name=model.name,
+                model_type=model.model_type,
+                input_columns=model.input_columns,
+                output_column=model.output_column,
+                refresh=True
+            ))
+    if unaffected:
+        MLModel.query.filter(MLModel.id.in_(unaffected), MLModel.sheet_version == base_version).update(
+            {MLModel.sheet_version: spreadsheet.version}, synchronize_session=False)
+    db.session.add_all(jobs)
+    db.session.commit()
+    for job in jobs:
+        submit_job(job)
+    return jobs
+
+
+def submit_job(job):
+    """Start a committed job on the worker pool (or inline if TRAINING_WORKERS is 0)."""
+    app = current_app._get_current_object()
+    if not app.config['TRAINING_WORKERS']:
+        run_job(job.id)
+        return
+
+    future = _get_executor(app).submit(_run_in_worker, job.id)
+    future.add_done_callback(lambda f: _check_future(app, job.id, f))
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            config = {key: app.config[key] for key in ('SQLALCHEMY_DATABASE_URI', 'ARTIFACT_DIR', 'CV_WORKERS',
+                                                     'TRAINING_MEMO_DIR', 'TRAINING_MEMO_SIZE', 'ENSEMBLE_JOBS')}
+            # Spawned workers get their own app and engine instead of forked connections
+            _executor = ProcessPoolExecutor(
+                max_workers=app.config['TRAINING_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(config,))
+        return _executor
+
+
+def _check_future(app, job_id, future):
+    error = future.exception()
+    if error is None and not future.result():
+        # The job did not run (cancelled, or waiting on another fit of its model)
+        return
+    with app.app_context():
+        if error is not None:
+            # A worker that died mid-job never records the failure itself
+            TrainingJob.query.filter(TrainingJob.id == job_id,
+                                     TrainingJob.status.in_(TrainingJob.ACTIVE)).update(
+                {TrainingJob.status: TrainingJob.FAILED, TrainingJob.error: f'Worker error: {error}',
+                 TrainingJob.finished_at: datetime.utcnow()},
+                synchronize_session=False)
+            db.session.commit()
+
+        # Jobs for the same model that found this one running are still queued
+        model_id = db.session.query(TrainingJob.model_id).filter_by(id=job_id).scalar()
+        if model_id is not None:
+            for waiting in TrainingJob.query.filter_by(model_id=model_id, status=TrainingJob.QUEUED):
+                submit_job(waiting)
+        db.session.remove()
+
+
+def _init_worker(config):
+    from app import create_app
+    app = create_app()
+    app.config.update(config)
+    app.app_context().push()
+
+
+def _run_in_worker(job_id):
+    try:
+        return run_job(job_id)
+    finally:
+        db.session.remove()
+
+
+def run_job(job_id):
+    """Claim, fit and store one queued job. Must run inside an app context.
+
+    Returns False if the job could not be claimed: it was no longer queued,
+    or another job for the same model is running.
+    """
+    model_id = db.session.query(TrainingJob.model_id).filter_by(id=job_id).scalar()
+    query = TrainingJob.query.filter_by(id=job_id, status=TrainingJob.QUEUED)
+    if model_id is not None:
+        # One fit per model at a time, so versions and fit states are never interleaved
+        other = aliased(TrainingJob)
+        query = query.filter(~db.session.query(other.id).filter(
+            other.model_id == model_id, other.status == TrainingJob.RUNNING).exists())
+    claimed = query.update(
+        {TrainingJob.status: TrainingJob.RUNNING, TrainingJob.started_at: datetime.utcnow()},
+        synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return False
+
+    job = TrainingJob.query.get(job_id)
+    artifact = None
+    try:
+        if job.cv_options is not None:
+            result = _evaluate(job)
+            TrainingJob.query.filter_by(id=job_id, status=TrainingJob.RUNNING).update(
+                {TrainingJob.status: TrainingJob.DONE, TrainingJob.result: json.dumps(result),
+                 TrainingJob.finished_at: datetime.utcnow()},
+                synchronize_session=False)
+            db.session.commit()
+            return True
+
+        model, artifact = _fit(job)
+        # The fit is kept only if the job was not cancelled while it ran
+        finished = TrainingJob.query.filter_by(id=job_id, status=TrainingJob.RUNNING).update(
+            {TrainingJob.status: TrainingJob.DONE, TrainingJob.model_id: model.id,
+             TrainingJob.finished_at: datetime.utcnow()},
+            synchronize_session=False)
+        if not finished:
+            db.session.rollback()
+            if artifact:
+                remove_artifact(artifact)
+            return True
+        db.session.commit()
+        if artifact:
+            delete_artifacts(model.id, keep=artifact['file'])
+    except Exception as e:
+        db.session.rollback()
+        if artifact:
+            remove_artifact(artifact)
+        TrainingJob.query.filter_by(id=job_id, status=TrainingJob.RUNNING).update(
+            {TrainingJob.status: TrainingJob.FAILED, TrainingJob.error: str(e),
+             TrainingJob.finished_at: datetime.utcnow()},
+            synchronize_session=False)
+        db.session.commit()
+    return True
+
+
+def _evaluate(job):
+    """Cross-validate the job's settings and store the report in ``job.result``."""
+    from app.ml.evaluation import cross_validate
+    from app.ml.matrix import build_training_matrix
+    from app.ml.preprocessing import FeatureEncoder, fit_encoder
+    from app.storage.columnar import column_index
+    from sklearn.preprocessing import LabelEncoder
+
+    spreadsheet = Spreadsheet.query.get(job.spreadsheet_id)
+    if spreadsheet is None:
+        raise ValueError('Spreadsheet no longer exists')
+    options = json.loads(job.cv_options)
+    input_columns = json.loads(job.input_columns)
+    columns = spreadsheet.load_columns(input_columns + [job.output_column])
+    X, y, report, rows = build_training_matrix(columns, input_columns, job.output_column, job.model_type,
+                                               with_rows=True)
+    # Inputs encoded as a fit of the model would encode them
+    X, _ = FeatureEncoder(fit_encoder(columns, input_columns, rows)).transform(
+        [columns[column_index(col)] for col in input_columns], rows)
+    if job.model_type != 'regression':
+        y = LabelEncoder().fit_transform(y)
+
+    def cancelled():
+        status = db.session.query(TrainingJob.status).filter_by(id=job.id).scalar()
+        db.session.commit()
+        return status != TrainingJob.RUNNING
+
+    result = cross_validate(X, y, rows, job.model_type, options['candidates'], folds=options['folds'],
+                            time_budget=options['time_budget'], patience=options.get('patience'),
+                            workers=current_app.config['CV_WORKERS'], should_stop=cancelled)
+    result['search'] = options['search']
+    result['data'] = report
+    return result
+
+
+def _fit(job):
+    """Train the job's model and stage it in the session; returns the model and its artifact.
+
+    The artifact is None when a refresh found nothing to refit.
+    """
+    # scikit-learn is only loaded by the processes that actually train
+    from app.ml.incremental import fit_sheet
+
+    spreadsheet = Spreadsheet.query.get(job.spreadsheet_id)
+    if spreadsheet is None:
+        raise ValueError('Spreadsheet no longer exists')
+    model = None
+    if job.model_id is not None:
+        model = MLModel.query.get(job.model_id)
+        if model is None:
+            raise ValueError('Model no longer exists')
+
+    input_columns = json.loads(job.input_columns)
+    if job.params is not None:
+        params = json.loads(job.params)
+    else:
+        params = json.loads(model.parameters or '{}').get('hyperparameters') if model is not None else None
+    estimator, metrics, state = fit_sheet(spreadsheet, input_columns, job.output_column, job.model_type,
+                                          model if job.refresh else None, params)
+    if estimator is None:
+        # Nothing the model reads changed; it is current as it stands
+        model.sheet_version = state['sheet_version']
+        model.fit_state = json.dumps(state)
+        return model, None
+
+    if model is None:
+        model = MLModel(
+            name=job.name,
+            model_type=job.model_type,
+            input_columns=job.input_columns,
+            output_column=job.output_column,
+            spreadsheet_id=job.spreadsheet_id
+        )
+        db.session.add(model)
+        db.session.flush()
+    else:
+        model.version += 1
+
+    artifact = save_artifact(model.id, model.version, estimator)
+    # Size of the stored estimator, next to its fit and prediction times
+    metrics['fit']['model_bytes'] = artifact['bytes']
+    model.metrics = json.dumps(metrics)
+    model.sheet_version = state['sheet_version']
+    model.fit_state = json.dumps(state)
+    model.parameters = json.dumps({'artifact': artifact, 'hyperparameters': metrics['params']})
+    return model, artifact
@@ -0,0 +1,70 @@
+"""Bulk extraction of training matrices from columnar sheet data."""
+import numpy as np
+from app.storage.columnar import NUMERIC, column_index, format_number
+
+
+def build_training_matrix(columns, input_cols, output_col, model_type, with_rows=False):
+    """Turn sheet columns into ``(X, y, report)`` arrays in one vectorized pass.
+
+    ``columns`` maps column index to a column from ``Spreadsheet.load_columns``.
+    Rows are taken in ascending order and kept only if the target cell is
+    non-empty (and numeric, for regression). Missing or non-numeric input
+    cells become 0. ``report`` counts the rows dropped and cells coerced.
+    With ``with_rows``, the row positions of X and y are returned as well.
+    """
+    target = columns[column_index(output_col)]
+    present = target.present
+    keep = present
+    if model_type == 'regression':
+        y_values, y_numeric = target.to_float()
+        keep = present & y_numeric
+    rows = np.flatnonzero(keep)
+
+    report = {
+        'rows_used': int(len(rows)),
+        'rows_dropped_missing_target': 0,
+        'rows_dropped_non_numeric_target': int(np.count_nonzero(present & ~keep)),
+        'cells_missing': 0,
+        'cells_coerced': 0,
+    }
+
+    X = np.zeros((len(rows), len(input_cols)))
+    any_input = np.zeros(len(target), dtype=bool)
+    for j, col in enumerate(input_cols):
+        column = columns[column_index(col)]
+        values, numeric = column.to_float()
+        input_present = column.present
+        any_input |= input_present
+
+        row_numeric = numeric[rows]
+        X[row_numeric, j] = values[rows][row_numeric]
+        report['cells_missing'] += int(np.count_nonzero(~input_present[rows]))
+        report['cells_coerced'] += int(np.count_nonzero(input_present[rows] & ~row_numeric))
+    report['rows_dropped_missing_target'] = int(np.count_nonzero(any_input & ~present))
+
+    if model_type == 'regression':
+        y = y_values[rows]
+    elif target.kind == NUMERIC:
+        y = np.array([format_number(value) for value in target.values[rows].tolist()])
+    else:
+        y = np.array(target.dictionary + [''])[target.codes[rows]]
+    if with_rows:
+        return X, y, report, rows
+    return X, y, report
+
+
+def build_input_matrix(columns, input_cols):
+    """Turn sheet columns into ``(X, has_input)`` for scoring every row.
+
+    Cells are coerced exactly as in training. ``has_input`` marks rows with
+    at least one non-empty input cell.
+    """
+    n_rows = len(columns[column_index(input_cols[0])]) if input_cols else 0
+    X = np.zeros((n_rows, len(input_cols)))
+    has_input = np.zeros(n_rows, dtype=bool)
+    for j, col in enumerate(input_cols):
+        column = columns[column_index(col)]
+        values, numeric = column.to_float()
+        X[numeric, j] = values[numeric]
+        has_input |= column.present
+    return X, has_input
@@ -0,0 +1,182 @@
+"""Training results memoized by a hash of the data the fit sees.
+
+``train_model`` hashes the encoded training matrix, target and row
+numbers (which decide the held-out split) together with the input and
+output columns (named in the stored metrics), the model type and
+hyperparameters. Hashing reads each array once, far less work than a fit,
+and a request that would fit identical data again (the same columns after a
+rename, or a save that rewrote the same cells) gets the stored estimator
+and metrics back instead.
+
+Entries are joblib files under TRAINING_MEMO_DIR, so every training worker
+process shares them; a hit touches its file, and once there are more than
+TRAINING_MEMO_SIZE entries the least recently used are removed. Each
+process writes its hit, miss and fit-seconds-saved counters to a file of
+its own there too, and ``stats`` sums them, so the web process reports
+the lookups made by the training workers.
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+from flask import current_app
+
+# Part of every key, so changing how models are fitted retires old entries
+MEMO_FORMAT = 3
+
+COUNTERS_PREFIX = 'counters-'
+
+
+def training_key(X, y, rows, model_type, params, input_cols, output_col):
+    """Hex digest identifying a fit of ``X``/``y`` from ``input_cols``/``output_col`` on sheet ``rows``."""
+    digest = hashlib.blake2b(digest_size=20)
+    header = [MEMO_FORMAT, model_type, params, list(input_cols), output_col, list(X.shape), y.dtype.str,
+              hasattr(X, 'indptr')]
+    digest.update(json.dumps(header, sort_keys=True).encode())
+    # A CSR matrix is identified by its three arrays
+    arrays = (X.data, X.indices, X.indptr) if hasattr(X, 'indptr') else (X,)
+    for array in arrays + (y, rows):
+        digest.update(np.ascontiguousarray(array).data)
+    return digest.hexdigest()
+
+
+class TrainingMemo:
+    """Fitted estimators and their metrics stored as files, evicted least recently used."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        # Names this process's counters file; a pid alone may be reused by a later worker
+        self._counters_name = f'{COUNTERS_PREFIX}{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+
+    @staticmethod
+    def _config():
+        return current_app.config['TRAINING_MEMO_DIR'], current_app.config['TRAINING_MEMO_SIZE']
+
+    def enabled(self):
+        return self._config()[1] > 0
+
+    def get(self, key):
+        """Return ``(estimator, metrics)`` stored under ``key``, or None."""
+        directory, _ = self._config()
+        path = os.path.join(directory, f'{key}.joblib')
+        import joblib
+        try:
+            estimator, metrics, seconds = joblib.load(path)
+            # Mark it recently used for eviction
+            os.utime(path)
+        except (OSError, EOFError, ValueError):
+            with self._lock:
+                self.misses += 1
+            self._save_counters(directory)
+            return None
+        with self._lock:
+            self.hits += 1
+            self.seconds_saved += seconds
+        self._save_counters(directory)
+        metrics = copy.deepcopy(metrics)
+        # The stored fit's timings still describe the model
+        metrics['fit'] = dict(metrics.get('fit', {}), mode='memoized', seconds_saved=round(seconds, 4))
+        return estimator, metrics
+
+    def put(self, key, estimator, metrics, seconds):
+        """Store a fit that took ``seconds``, then trim the directory to TRAINING_MEMO_SIZE."""
+        directory, maxsize = self._config()
+        path = os.path.join(directory, f'{key}.joblib')
+        tmp_path = f'{path}.tmp{os.getpid()}.{threading.get_ident()}'
+        import joblib
+        try:
+            os.makedirs(directory, exist_ok=True)
+            joblib.dump((estimator, metrics, seconds), tmp_path)
+            # Atomic, so another worker never loads a partial file
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self._trim(directory, maxsize)
+
+    def _save_counters(self, directory):
+        with self._lock:
+            counters = {'hits': self.hits, 'misses': self.misses, 'seconds_saved': self.seconds_saved}
+        path = os.path.join(directory, self._counters_name)
+        tmp_path = f'{path}.tmp{threading.get_ident()}'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(counters, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def _counters(self, directory):
+        """Counters summed over every process that has used the memo directory."""
+        totals = {'hits': 0, 'misses': 0, 'seconds_saved': 0.0}
+        try:
+            names = [name for name in os.listdir(directory)
+                     if name.startswith(COUNTERS_PREFIX) and name.endswith('.json')]
+        except OSError:
+            names = []
+        for name in names:
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    counters = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for key in totals:
+                totals[key] += counters.get(key, 0)
+        return totals
+
+    def _entries(self, directory):
+        try:
+            scanned = list(os.scandir(directory))
+        except OSError:
+            return []
+        entries = []
+        for entry in scanned:
+            if not entry.name.endswith('.joblib'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def _trim(self, directory, maxsize):
+        entries = sorted(self._entries(directory))
+        for _, path, _ in entries[:max(len(entries) - maxsize, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        directory, _ = self._config()
+        for _, path, _ in self._entries(directory):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        directory, maxsize = self._config()
+        entries = self._entries(directory)
+        counters = self._counters(directory)
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'entries': len(entries),
+            'maxsize': maxsize,
+            'bytes': sum(size for _, _, size in entries),
+            'hits': counters['hits'],
+            'misses': counters['misses'],
+            'hit_rate': round(counters['hits'] / lookups, 4) if lookups else None,
+            'seconds_saved': round(counters['seconds_saved'], 4),
+        }
+
+
+training_memo = TrainingMemo()
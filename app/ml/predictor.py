@@ -0,0 +1,222 @@
+"""Compiled predictors for trained models and a process-local LRU cache of them.
+
+Linear and logistic models (of every linear family) are scored from the
+coefficients stored in their metrics, held as NumPy arrays so a prediction
+is one matrix product and serving them never imports scikit-learn. Models
+whose metrics carry no coefficients wrap their fitted estimator, loaded
+from its artifact, and are scored by the estimator's own ``predict``.
+Models fitted with an input encoder (see app.ml.preprocessing) keep it
+compiled in their predictor, so raw cell values, text included, are
+encoded the way training encoded them. Predictors are cached by
+``(model id, created_at, version)``; retraining bumps the version, so a
+stale predictor is never served.
+"""
+from collections import OrderedDict
+import json
+import threading
+
+import numpy as np
+
+from app.instrumentation import timed
+from app.ml.artifacts import load_artifact
+from app.ml.families import family_of, get_family
+from app.ml.matrix import build_input_matrix
+from app.ml.preprocessing import FeatureEncoder
+from app.storage.columnar import build_column, column_index, format_number, parse_number
+
+
+def sigmoid(scores):
+    # Split by sign so np.exp never overflows
+    out = np.empty_like(scores, dtype=np.float64)
+    positive = scores >= 0
+    out[positive] = 1 / (1 + np.exp(-scores[positive]))
+    exp = np.exp(scores[~positive])
+    out[~positive] = exp / (1 + exp)
+    return out
+
+
+def softmax(scores):
+    exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class Predictor:
+    """A fitted model of any family, ready to score rows of input values."""
+
+    def __init__(self, model_type, input_columns, coef, intercept, classes=None, estimator=None, encoder=None,
+                 family=None):
+        self.model_type = model_type
+        self.family = get_family(family)
+        self.estimator = estimator
+        self.encoder = FeatureEncoder(encoder) if encoder else None
+        self.input_columns = input_columns
+        self.coef = np.atleast_2d(np.asarray(coef, dtype=np.float64))
+        self.intercept = np.atleast_1d(np.asarray(intercept, dtype=np.float64))
+        self.classes = classes or []
+
+    @classmethod
+    def from_model(cls, model):
+        metrics = json.loads(model.metrics)
+        input_columns = json.loads(model.input_columns)
+        coef = metrics.get('coef', [])
+        # Coefficients reproduce a linear model exactly, so its artifact is not needed
+        artifact = json.loads(model.parameters or '{}').get('artifact')
+        estimator = load_artifact(artifact) if artifact and not coef else None
+        encoder = metrics.get('encoder')
+        family = family_of(metrics.get('params')).name
+        if model.model_type == 'regression':
+            return cls('regression', input_columns, coef, metrics.get('intercept', 0), estimator=estimator,
+                       encoder=encoder, family=family)
+
+        intercept = metrics.get('intercept', [])
+        classes = metrics.get('classes', [])
+        if not classes or (estimator is None and (not coef or not intercept)):
+            raise ValueError("Missing model parameters for classification")
+        return cls('classification', input_columns, coef, intercept, classes, estimator=estimator,
+                   encoder=encoder, family=family)
+
+    @property
+    def n_inputs(self):
+        return len(self.input_columns)
+
+    def encode_columns(self, columns):
+        """Model inputs ``(X, has_input)`` for every row of sheet ``columns``, keyed by column index.
+
+        ``has_input`` marks rows with at least one non-empty input cell.
+        """
+        if self.encoder is None:
+            return build_input_matrix(columns, self.input_columns)
+        return self.encoder.transform([columns[column_index(col)] for col in self.input_columns])
+
+    def encode_rows(self, rows):
+        """Model inputs for rows of raw input values (numbers, cell texts or None)."""
+        rows = [list(row) for row in rows]
+        if any(len(row) != self.n_inputs for row in rows):
+            raise ValueError(f'Expected {self.n_inputs} inputs per row')
+        if self.encoder is None:
+            # Coerced as in training: empty and non-numeric inputs count as 0
+            return np.array([[_coerce(value) for value in row] for row in rows],
+                            dtype=np.float64).reshape(len(rows), self.n_inputs)
+        columns = [build_column([_cell_text(row[j]) for row in rows], len(rows)) for j in range(self.n_inputs)]
+        return self.encoder.transform(columns)[0]
+
+    def decision_function(self, X):
+        """Linear scores for a 2-D array of inputs, one column per coefficient row."""
+        return X @ self.coef.T + self.intercept
+
+    @timed('predict')
+    def predict_proba(self, X):
+        """Class probabilities for each row of ``X`` (classification only)."""
+        if not X.shape[0]:
+            # Estimators reject empty input, and an estimator-only predictor has no coefficients
+            return np.empty((0, len(self.classes)))
+        if self.estimator is not None:
+            return self.family.predict_proba(self.estimator, X)
+        scores = self.decision_function(X)
+        if len(self.classes) == 2:
+            positive = sigmoid(scores[:, 0])
+            return np.column_stack([1 - positive, positive])
+        return softmax(scores)
+
+    @timed('predict')
+    def predict(self, X):
+        """Predicted values (regression) or class indices (classification) for each row."""
+        if not X.shape[0]:
+            return np.empty(0, dtype=np.float64 if self.model_type == 'regression' else np.intp)
+        if self.estimator is not None:
+            # Classifiers are fitted on label-encoded targets, so predict returns indices
+            return self.family.predict(self.estimator, X)
+        scores = self.decision_function(X)
+        if self.model_type == 'regression':
+            return scores[:, 0]
+        if len(self.classes) == 2:
+            # sigmoid(score) > 0.5 exactly when score > 0
+            return (scores[:, 0] > 0).astype(np.intp)
+        return scores.argmax(axis=1)
+
+    def predict_labels(self, X):
+        """Predict every row of ``X`` as a list of floats or class labels."""
+        predictions = self.predict(X)
+        if self.model_type == 'regression':
+            return predictions.tolist()
+        return [self.classes[index] for index in predictions.tolist()]
+
+    def predict_one(self, values):
+        """Predict a single row of raw input values; returns a float or a class label."""
+        return self.predict_labels(self.encode_rows([values]))[0]
+
+
+def _coerce(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return parse_number(value) or 0.0
+
+
+def _cell_text(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return format_number(value)
+    return str(value)
+
+
+class PredictorCache:
+    """Thread-safe LRU of predictors keyed by ``(model id, created_at, version)``.
+
+    SQLite may hand a deleted model's id to the next model created, and
+    another worker's cache still holds the deleted one; the creation time
+    tells the two apart.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model_id, created_at, version, loader):
+        """Return the cached predictor, calling ``loader()`` to build it on a miss."""
+        key = (model_id, created_at, version)
+        with self._lock:
+            predictor = self._entries.get(key)
+            if predictor is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return predictor
+            self.misses += 1
+
+        predictor = loader()
+        with self._lock:
+            # Older versions of the same model (or a deleted model with its id) can never be asked for again
+            for stale in [k for k in self._entries if k[0] == model_id]:
+                del self._entries[stale]
+            self._entries[key] = predictor
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return predictor
+
+    def invalidate(self, model_id):
+        """Drop every cached version of a model."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == model_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+predictor_cache = PredictorCache()
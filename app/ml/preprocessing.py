@@ -0,0 +1,141 @@
+"""Encoding input columns into model features.
+
+An input column whose cells in the training rows are all non-numeric text
+(a 'string' column in the column stats) is categorical. Up to MAX_ONEHOT
+distinct values are one-hot encoded, one feature per value; beyond that
+the column becomes a single ordinal feature, the frequency rank of the
+value among the MAX_CATEGORIES most common ones. Values not seen in
+training, and empty cells, encode as all zeros (rank 0). Every other
+column is numeric, coerced as before (empty or non-numeric cells are 0),
+and standardized with the mean and scale of its training rows.
+
+The fitted encoder is a JSON-ready spec stored in the model's metrics.
+FeatureEncoder compiles it once per predictor and transforms whole
+columns at a time: a text column maps its dictionary, not its cells, to
+category indices. When any column is one-hot encoded the features are a
+scipy sparse CSR matrix, so wide categorical sheets are never densified.
+"""
+import numpy as np
+
+from app.storage.columnar import NUMERIC, column_index
+
+MAX_ONEHOT = 64
+MAX_CATEGORIES = 4096
+
+
+def input_counts(column, rows):
+    """``(present, numeric)``: non-empty and numeric cells of ``column`` among ``rows``.
+
+    Counts of disjoint row sets add up, so per-block counts decide
+    ``is_categorical`` for the whole sheet as the encoder would.
+    """
+    _, numeric = column.to_float()
+    present = column.present[rows]
+    return int(np.count_nonzero(present)), int(np.count_nonzero(numeric[rows][present]))
+
+
+def is_categorical(present, numeric):
+    """Whether an input with these ``input_counts`` in the training rows is encoded as categories."""
+    return present > 0 and numeric == 0
+
+
+def fit_encoder(columns, input_cols, rows):
+    """Fit the encoder spec of ``input_cols`` on the training ``rows`` of ``columns``."""
+    inputs = []
+    for col in input_cols:
+        column = columns[column_index(col)]
+        values, numeric = column.to_float()
+        if column.kind != NUMERIC and is_categorical(*input_counts(column, rows)):
+            codes = column.codes[rows]
+            counts = np.bincount(codes[codes >= 0], minlength=len(column.dictionary)).tolist()
+            # Most frequent first; ties in text order, so refits of the same data agree
+            categories = [text for count, text in sorted(zip(counts, column.dictionary),
+                                                         key=lambda item: (-item[0], item[1])) if count]
+            categories = categories[:MAX_CATEGORIES]
+            if len(categories) <= MAX_ONEHOT:
+                inputs.append({'col': col, 'kind': 'onehot', 'categories': categories})
+                continue
+            ranks = _category_index(column, {text: i for i, text in enumerate(categories)})[rows] + 1
+            mean, scale = _standardization(ranks.astype(np.float64))
+            inputs.append({'col': col, 'kind': 'ordinal', 'categories': categories, 'mean': mean, 'scale': scale})
+            continue
+        x = np.where(numeric, values, 0.0)[rows]
+        mean, scale = _standardization(x)
+        inputs.append({'col': col, 'kind': 'numeric', 'mean': mean, 'scale': scale})
+    return {'inputs': inputs}
+
+
+def _standardization(x):
+    if not len(x):
+        return 0.0, 1.0
+    scale = float(x.std())
+    return float(x.mean()), scale if scale > 0 else 1.0
+
+
+def _category_index(column, index):
+    """Category index of every cell (-1 for empty or unseen values)."""
+    if column.kind == NUMERIC:
+        # Categories are never numeric text, so numeric cells are all unseen
+        return np.full(len(column), -1, dtype=np.intp)
+    lookup = np.array([index.get(text, -1) for text in column.dictionary] + [-1], dtype=np.intp)
+    # Code -1 (empty) picks the trailing -1
+    return lookup[column.codes]
+
+
+def feature_names(spec):
+    """Name of each feature: the column letter, or ``letter=value`` for one-hot features."""
+    names = []
+    for entry in spec['inputs']:
+        if entry['kind'] == 'onehot':
+            names.extend(f"{entry['col']}={category}" for category in entry['categories'])
+        else:
+            names.append(entry['col'])
+    return names
+
+
+class FeatureEncoder:
+    """A fitted encoder spec compiled for transforming columns."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.inputs = spec['inputs']
+        self._indexes = [{text: i for i, text in enumerate(entry['categories'])} if 'categories' in entry else None
+                         for entry in self.inputs]
+        self.sparse = any(entry['kind'] == 'onehot' for entry in self.inputs)
+        self.n_features = len(feature_names(spec))
+
+    def transform(self, columns, rows=None):
+        """Encode ``columns`` (one per input, in order) into ``(X, has_input)``.
+
+        ``rows`` selects rows of the columns (all if None). ``has_input``
+        marks rows with at least one non-empty input cell. X is a CSR matrix
+        when any input is one-hot encoded, a dense array otherwise.
+        """
+        if rows is None:
+            n_rows = len(columns[0]) if columns else 0
+            rows = slice(None)
+        else:
+            n_rows = len(rows)
+        has_input = np.zeros(n_rows, dtype=bool)
+        blocks = []
+        for entry, index, column in zip(self.inputs, self._indexes, columns):
+            has_input |= column.present[rows]
+            if entry['kind'] == 'numeric':
+                values, numeric = column.to_float()
+                x = np.where(numeric[rows], values[rows], 0.0)
+                blocks.append(((x - entry['mean']) / entry['scale']).reshape(-1, 1))
+                continue
+            categories = _category_index(column, index)[rows]
+            if entry['kind'] == 'ordinal':
+                blocks.append(((categories + 1 - entry['mean']) / entry['scale']).reshape(-1, 1))
+                continue
+            from scipy import sparse
+            hit = np.flatnonzero(categories >= 0)
+            blocks.append(sparse.csr_matrix((np.ones(len(hit)), (hit, categories[hit])),
+                                            shape=(n_rows, len(entry['categories']))))
+
+        if not self.sparse:
+            return (np.hstack(blocks) if blocks else np.zeros((n_rows, 0))), has_input
+        from scipy import sparse
+        return sparse.hstack([block if sparse.issparse(block) else sparse.csr_matrix(block) for block in blocks],
+                             format='csr'), has_input
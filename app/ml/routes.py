@@ -1,15 +1,25 @@
-from flask import render_template, redirect, url_for, request, flash, jsonify
+from flask import render_template, redirect, url_for, request, flash, jsonify, abort, current_app
 from flask_login import login_required, current_user
 from app import db
+from app.database import after_write, is_busy, retry_on_busy
+from app.formulas.engine import recalculate
+from app.http import cacheable, make_etag, matching_etag, not_modified
 from app.ml import bp
+from app.ml.artifacts import delete_artifacts
+from app.ml.families import FAMILIES
+from app.ml.hyperparameters import clean_params, search_candidates
+from app.ml.jobs import active_jobs, cancel_job, refresh_models, submit_job
+from app.ml.memo import training_memo
+from app.ml.predictor import Predictor, predictor_cache
 from app.models.ml_model import MLModel
 from app.models.spreadsheet import Spreadsheet
+from app.models.training_job import TrainingJob
+from app.storage.cache import sheet_cache
+from app.storage.columnar import column_index, format_number
 import json
+import re
 import numpy as np
-from sklearn.linear_model import LinearRegression, LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error, r2_score, accuracy_score
-from sklearn.preprocessing import LabelEncoder
+from sqlalchemy.orm import contains_eager, undefer
 
 @bp.route('/create', methods=['POST'])
 @login_required
@@ -36,163 +46,203 @@ def create():
             'message': 'Unauthorized access to spreadsheet'
         })
     
-    # Load spreadsheet data
+    # Optional model family and its hyperparameters (see app.ml.families)
     try:
-        data = json.loads(spreadsheet.data)
-    except:
-        data = {}
+        params = clean_params(model_type, request.form)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     
-    # Create model
-    model = MLModel(
+    job = TrainingJob(
+        user_id=current_user.id,
+        spreadsheet_id=spreadsheet.id,
         name=name,
         model_type=model_type,
         input_columns=json.dumps(input_columns),
         output_column=output_column,
-        spreadsheet_id=spreadsheet_id
+        params=json.dumps(params)
     )
-    
-    # Train the model
-    try:
-        X, y, metrics = train_model(data, input_columns, output_column, model_type)
-        model.metrics = json.dumps(metrics)
-        db.session.add(model)
-        db.session.commit()
+    return enqueue_training(job, f'Training model {name}')
+
+@bp.route('/cross-validate', methods=['POST'])
+@login_required
+def cross_validate():
+    """Queue a k-fold cross-validation, optionally searching hyperparameters.
+
+    The JSON body names ``spreadsheet_id``, ``model_type``, ``input_columns``
+    and ``output_column`` as for /ml/create, plus ``folds`` (default 5),
+    ``search`` ('none', 'grid' or 'random'), ``params`` (values to try per
+    hyperparameter, or a [low, high] range for random search), ``n_iter``,
+    ``time_budget`` in seconds and ``patience``, the number of finished
+    candidates without improvement after which the search stops. The report
+    is in the job's ``result`` once it is done.
+    """
+    body = request.get_json(silent=True) or {}
+    model_type = body.get('model_type')
+    input_columns = body.get('input_columns')
+    output_column = body.get('output_column')
+    if model_type not in ('regression', 'classification') or not input_columns or not output_column:
         return jsonify({
-            'success': True,
-            'message': f'Model {name} created successfully',
-            'metrics': metrics
-        })
-    except Exception as e:
+            'success': False,
+            'message': 'Missing required fields'
+        }), 400
+    
+    spreadsheet = Spreadsheet.query.get_or_404(body.get('spreadsheet_id'))
+    if spreadsheet.user_id != current_user.id:
         return jsonify({
             'success': False,
-            'message': f'Error training model: {str(e)}'
+            'message': 'Unauthorized access to spreadsheet'
         })
-
-def train_model(data, input_cols, output_col, model_type):
-    """Train a model with the given data and parameters"""
-    # Prepare the data
-    X = []
-    y = []
-    
-    # Get all row indices from the data
-    rows = set()
-    for key in data.keys():
-        if '-' in key:
-            row, _ = key.split('-')
-            rows.add(int(row))
-    
-    # Convert column letters to indices
-    input_indices = [ord(col) - 65 for col in input_cols]  # A=0, B=1, etc.
-    output_index = ord(output_col) - 65
     
-    # For each row, get the input and output values
-    for row in rows:
-        row_inputs = []
-        for col_idx in input_indices:
-            cell_key = f"{row}-{col_idx}"
-            if cell_key in data and data[cell_key]:
-                # Try to convert to float, handle errors
-                try:
-                    row_inputs.append(float(data[cell_key]))
-                except ValueError:
-                    row_inputs.append(0)  # Default to 0 for non-numeric values
-            else:
-                row_inputs.append(0)  # Default for missing data
-        
-        # Skip rows with missing output
-        output_key = f"{row}-{output_index}"
-        if output_key not in data or not data[output_key]:
-            continue
-        
-        try:
-            X.append(row_inputs)
-            y_val = data[output_key]
-            if model_type == "regression":
-                y.append(float(y_val))
-            else:
-                y.append(y_val)  # Keep string labels for classification
-        except ValueError:
-            # Skip rows with non-numeric output for regression
-            if model_type == "regression":
-                continue
-            y.append(y_val)  # Keep string labels for classification
-    
-    # Check if we have enough data
-    if len(X) < 2:
-        raise ValueError("Not enough data for training")
+    try:
+        folds = int(body.get('folds', 5))
+        if not 2 <= folds <= 20:
+            raise ValueError('folds must be between 2 and 20')
+        search = body.get('search', 'none')
+        n_iter = int(body.get('n_iter', 10))
+        if not 1 <= n_iter <= 200:
+            raise ValueError('n_iter must be between 1 and 200')
+        candidates = search_candidates(model_type, search, body.get('params'), n_iter=n_iter,
+                                       family=body.get('family'))
+        if len(candidates) > 200:
+            raise ValueError('At most 200 hyperparameter combinations per search')
+        time_budget = min(float(body.get('time_budget', current_app.config['CV_TIME_BUDGET'])),
+                          current_app.config['CV_MAX_TIME_BUDGET'])
+        patience = body.get('patience')
+        patience = int(patience) if patience else None
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid cross-validation request: {str(e)}'
+        }), 400
     
-    # Convert to numpy arrays
-    X = np.array(X)
-    y = np.array(y)
+    job = TrainingJob(
+        user_id=current_user.id,
+        spreadsheet_id=spreadsheet.id,
+        name=body.get('name') or f'Cross-validation of {output_column}',
+        model_type=model_type,
+        input_columns=json.dumps(input_columns),
+        output_column=output_column,
+        cv_options=json.dumps({'folds': folds, 'search': search, 'candidates': candidates,
+                               'time_budget': time_budget, 'patience': patience})
+    )
+    return enqueue_training(job, f'Cross-validating {len(candidates)} candidate(s) over {folds} folds')
+
+def enqueue_training(job, message):
+    """Queue a training job for the current user, subject to the per-user limit"""
+    limit = current_app.config['TRAINING_JOBS_PER_USER']
+    if active_jobs(current_user.id) >= limit:
+        return jsonify({
+            'success': False,
+            'message': f'You already have {limit} training jobs in progress. Wait for one to finish or cancel it.'
+        }), 429
     
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    db.session.add(job)
+    db.session.commit()
+    submit_job(job)
+    return jsonify({
+        'success': True,
+        'message': message,
+        'job': TrainingJob.query.get(job.id).to_dict()
+    }), 202
+
+@bp.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = TrainingJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        return jsonify({
+            'success': False,
+            'message': 'Unauthorized access to training job'
+        })
     
-    # Train model
-    if model_type == 'regression':
-        model = LinearRegression()
-        model.fit(X_train, y_train)
-        
-        # Evaluate
-        y_pred = model.predict(X_test)
-        metrics = {
-            'mse': float(mean_squared_error(y_test, y_pred)),
-            'r2': float(r2_score(y_test, y_pred)),
-            'coef': model.coef_.tolist(),
-            'intercept': float(model.intercept_)
-        }
-    else:  # classification
-        # Use LabelEncoder to convert string labels to numeric
-        label_encoder = LabelEncoder()
-        y_train_encoded = label_encoder.fit_transform(y_train)
-        y_test_encoded = label_encoder.transform(y_test)
-        
-        model = LogisticRegression(max_iter=1000)
-        model.fit(X_train, y_train_encoded)
-        
-        # Evaluate
-        y_pred = model.predict(X_test)
-        metrics = {
-            'accuracy': float(accuracy_score(y_test_encoded, y_pred)),
-            'coef': model.coef_.tolist(),
-            'intercept': model.intercept_.tolist(),
-            'classes': label_encoder.classes_.tolist()  # Store the mapping of numeric to string labels
-        }
+    job_data = job.to_dict()
+    if job.result:
+        job_data['result'] = json.loads(job.result)
+    if job.status == TrainingJob.DONE and job.model_id:
+        model = MLModel.query.get(job.model_id)
+        if model:
+            job_data['metrics'] = json.loads(model.metrics)
+    return jsonify({
+        'success': True,
+        'job': job_data
+    })
+
+@bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel(job_id):
+    job = TrainingJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        return jsonify({
+            'success': False,
+            'message': 'Unauthorized access to training job'
+        })
     
-    return X, y, metrics
+    if not cancel_job(job_id):
+        return jsonify({
+            'success': False,
+            'message': f'Job already {job.status}'
+        })
+    return jsonify({
+        'success': True,
+        'message': 'Training job cancelled'
+    })
 
 @bp.route('/list/<int:spreadsheet_id>')
 @login_required
 def list_models(spreadsheet_id):
     # Verify that spreadsheet exists and belongs to user
-    spreadsheet = Spreadsheet.query.get_or_404(spreadsheet_id)
-    if spreadsheet.user_id != current_user.id:
+    owner_id = db.session.query(Spreadsheet.user_id).filter_by(id=spreadsheet_id).scalar()
+    if owner_id is None:
+        abort(404)
+    if owner_id != current_user.id:
         return jsonify({
             'success': False, 
             'message': 'Unauthorized access to spreadsheet'
         })
     
-    # Get all models for this user through their spreadsheets
-    models = MLModel.query.join(Spreadsheet).filter(Spreadsheet.user_id == current_user.id).all()
-    model_list = []
+    # The listing only changes when a model or a source sheet gets a new version,
+    # so revalidation needs just the version columns
+    versions = db.session.query(MLModel.id, MLModel.version, Spreadsheet.id, Spreadsheet.version).join(
+        Spreadsheet, MLModel.spreadsheet_id == Spreadsheet.id).filter(
+        Spreadsheet.user_id == current_user.id).order_by(MLModel.id).all()
+    etag = make_etag('models', spreadsheet_id, [tuple(row) for row in versions], sorted(request.args.items()))
+    held = matching_etag(etag)
+    if held:
+        return not_modified(held)
     
+    # One joined query loads the models together with their source spreadsheets.
+    # ?scope=sheet limits it to models trained on this spreadsheet; ?page and
+    # ?per_page paginate
+    query = MLModel.query.join(MLModel.spreadsheet).options(
+        contains_eager(MLModel.spreadsheet), undefer(MLModel.metrics)).filter(
+        Spreadsheet.user_id == current_user.id).order_by(MLModel.id)
+    if request.args.get('scope') == 'sheet':
+        query = query.filter(MLModel.spreadsheet_id == spreadsheet_id)
+    
+    page = request.args.get('page', type=int)
+    pagination = None
+    if page:
+        per_page = min(request.args.get('per_page', 50, type=int), 200)
+        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        models = pagination.items
+    else:
+        models = query.all()
+    
+    # Column names and types are worked out once per source spreadsheet
+    sources = {}
+    model_list = []
     for model in models:
-        # Get the source spreadsheet's column names and types
-        source_spreadsheet = Spreadsheet.query.get(model.spreadsheet_id)
-        try:
-            source_column_names = json.loads(source_spreadsheet.column_names)
-        except:
-            source_column_names = {}
-            
-        try:
-            source_data = json.loads(source_spreadsheet.data)
-            source_column_types = {}
-            for col_letter in [chr(i) for i in range(65, 75)]:  # A through J
-                col_type = detect_column_type(source_data, col_letter)
-                if col_type:
-                    source_column_types[col_letter] = col_type
-        except:
-            source_column_types = {}
+        source_spreadsheet = model.spreadsheet
+        if source_spreadsheet.id not in sources:
+            try:
+                source_column_names = json.loads(source_spreadsheet.column_names)
+            except:
+                source_column_names = {}
+            sources[source_spreadsheet.id] = (source_column_names, source_spreadsheet.column_types())
+        source_column_names, source_column_types = sources[source_spreadsheet.id]
         
         model_data = {
             'id': model.id,
@@ -201,6 +251,9 @@ def list_models(spreadsheet_id):
             'created_at': model.created_at.strftime('%Y-%m-%d %H:%M'),
             'input_columns': json.loads(model.input_columns),
             'output_column': model.output_column,
+            # Fits made before sheet versions were tracked count as current
+            'sheet_version': model.sheet_version,
+            'stale': model.sheet_version is not None and model.sheet_version < source_spreadsheet.version,
             'source_spreadsheet': {
                 'id': model.spreadsheet_id,
                 'name': source_spreadsheet.name
@@ -217,19 +270,51 @@ def list_models(spreadsheet_id):
             
         model_list.append(model_data)
     
-    return jsonify({
+    response = {
         'success': True,
         'models': model_list
-    })
+    }
+    if pagination is not None:
+        response.update(page=pagination.page, per_page=pagination.per_page,
+                        total=pagination.total, pages=pagination.pages)
+    return cacheable(jsonify(response), etag)
 
-@bp.route('/evaluate/<int:model_id>', methods=['POST'])
+@bp.route('/retrain/<int:model_id>', methods=['POST'])
 @login_required
-def evaluate(model_id):
-    """Evaluate a model with the given input values"""
-    # Get the model
+def retrain(model_id):
+    """Queue a refit of a model on the current contents of its spreadsheet"""
     model = MLModel.query.get_or_404(model_id)
+    spreadsheet = Spreadsheet.query.get(model.spreadsheet_id)
+    if not spreadsheet or spreadsheet.user_id != current_user.id:
+        return jsonify({
+            'success': False,
+            'message': 'You do not have permission to use this model'
+        })
     
-    # Check if user has access to this model
+    running = TrainingJob.query.filter(TrainingJob.model_id == model.id,
+                                       TrainingJob.status.in_(TrainingJob.ACTIVE)).first()
+    if running:
+        return jsonify({
+            'success': False,
+            'message': f'Model {model.name} is already being retrained',
+            'job': running.to_dict()
+        }), 409
+    
+    job = TrainingJob(
+        user_id=current_user.id,
+        spreadsheet_id=model.spreadsheet_id,
+        model_id=model.id,
+        name=model.name,
+        model_type=model.model_type,
+        input_columns=model.input_columns,
+        output_column=model.output_column
+    )
+    return enqueue_training(job, f'Retraining model {model.name}')
+
+@bp.route('/delete/<int:model_id>', methods=['POST'])
+@login_required
+def delete(model_id):
+    model = MLModel.query.get_or_404(model_id)
     spreadsheet = Spreadsheet.query.get(model.spreadsheet_id)
     if not spreadsheet or spreadsheet.user_id != current_user.id:
         return jsonify({
@@ -237,6 +322,54 @@ def evaluate(model_id):
             'message': 'You do not have permission to use this model'
         })
     
+    # Stop pending retrains so they do not write an artifact for a deleted model
+    TrainingJob.query.filter(TrainingJob.model_id == model.id,
+                             TrainingJob.status.in_(TrainingJob.ACTIVE)).update(
+        {TrainingJob.status: TrainingJob.CANCELLED}, synchronize_session=False)
+    db.session.delete(model)
+    db.session.commit()
+    delete_artifacts(model_id)
+    predictor_cache.invalidate(model_id)
+    return jsonify({
+        'success': True,
+        'message': f'Model {model.name} deleted'
+    })
+
+@bp.route('/families')
+@login_required
+def families():
+    # Model families a model can be created with, and their hyperparameters
+    return jsonify({
+        'success': True,
+        'families': [family.describe() for family in FAMILIES.values()]
+    })
+
+@bp.route('/cache-stats')
+@login_required
+def cache_stats():
+    return jsonify({
+        'success': True,
+        'cache': predictor_cache.stats(),
+        'sheet_cache': sheet_cache.stats(),
+        'training_memo': training_memo.stats()
+    })
+
+@bp.route('/evaluate/<int:model_id>', methods=['POST'])
+@login_required
+def evaluate(model_id):
+    """Evaluate a model with the given input values"""
+    # Check access and the current version without loading the model's JSON columns
+    row = db.session.query(MLModel.created_at, MLModel.version, Spreadsheet.user_id).join(
+        Spreadsheet, MLModel.spreadsheet_id == Spreadsheet.id).filter(MLModel.id == model_id).first()
+    if row is None:
+        abort(404)
+    created_at, version, owner_id = row
+    if owner_id != current_user.id:
+        return jsonify({
+            'success': False,
+            'message': 'You do not have permission to use this model'
+        })
+    
     # Get input values from request
     try:
         input_values = request.json.get('inputs', [])
@@ -248,80 +381,164 @@ def evaluate(model_id):
             'message': 'Invalid input data'
         })
     
-    # Get model parameters
     try:
-        metrics = json.loads(model.metrics)
-        input_columns = json.loads(model.input_columns)
+        predictor = predictor_cache.get(
+            model_id, created_at, version, lambda: Predictor.from_model(MLModel.query.get(model_id)))
         
         # Check if number of inputs matches expected
-        if len(input_values) != len(input_columns):
+        if len(input_values) != predictor.n_inputs:
             return jsonify({
                 'success': False,
-                'message': f'Expected {len(input_columns)} inputs, got {len(input_values)}'
+                'message': f'Expected {predictor.n_inputs} inputs, got {len(input_values)}'
             })
         
-        # Convert all inputs to float
-        input_values = [float(val) if val else 0 for val in input_values]
-        
-        # Apply the model
-        if model.model_type == 'regression':
-            # For regression, apply linear formula: y = b0 + b1*x1 + b2*x2 + ...
-            coef = metrics.get('coef', [])
-            intercept = metrics.get('intercept', 0)
-            result = intercept
-            
-            for i, val in enumerate(input_values):
-                if i < len(coef):
-                    result += coef[i] * val
-        else:
-            # For classification, calculate probabilities for each class
-            coef = metrics.get('coef', [])
-            intercepts = metrics.get('intercept', [])
-            classes = metrics.get('classes', [])
-            
-            if not coef or not intercepts or not classes:
-                raise ValueError("Missing model parameters for classification")
-            
-            # For binary classification, we only have one set of coefficients
-            if len(classes) == 2:
-                # Calculate log-odds for the positive class
-                log_odds = intercepts[0]
-                for i, val in enumerate(input_values):
-                    if i < len(coef[0]):
-                        log_odds += coef[0][i] * val
-                
-                # Convert to probability using sigmoid
-                probability = 1 / (1 + np.exp(-log_odds))
-                
-                # Get the predicted class
-                predicted_class_index = 1 if probability > 0.5 else 0
-                result = classes[predicted_class_index]
-            else:
-                # For multi-class classification
-                # Calculate log-odds for each class
-                log_odds = []
-                for i in range(len(classes)):
-                    log_odds_i = intercepts[i]
-                    for j, val in enumerate(input_values):
-                        if j < len(coef[i]):
-                            log_odds_i += coef[i][j] * val
-                    log_odds.append(log_odds_i)
-                
-                # Convert log-odds to probabilities using softmax
-                exp_log_odds = np.exp(log_odds)
-                probabilities = exp_log_odds / np.sum(exp_log_odds)
-                
-                # Get the class with highest probability
-                predicted_class_index = np.argmax(probabilities)
-                result = classes[predicted_class_index]
-        
+        # Raw values are encoded like the training cells: text inputs can be categories
         return jsonify({
             'success': True,
-            'result': result
+            'result': predictor.predict_one(input_values)
         })
         
     except Exception as e:
         return jsonify({
             'success': False,
             'message': f'Error evaluating model: {str(e)}'
-        }) 
\ No newline at end of file
+        })
+
+# Most sheet rows one /ml/predict request scores
+MAX_PREDICT_ROWS = 100000
+
+@bp.route('/predict/<int:model_id>', methods=['POST'])
+@login_required
+@retry_on_busy
+def predict(model_id):
+    """Score many rows in one request.
+
+    The body gives either ``inputs`` (a list of input rows) or a sheet range
+    (``spreadsheet_id``, defaulting to the model's sheet, and ``start``/``stop``
+    rows, at most MAX_PREDICT_ROWS of them and none past the sheet's last
+    row; the response's ``stop`` says where the scored rows end). Inputs are
+    encoded as in training, so empty or non-numeric cells of numeric inputs
+    count as 0. Set ``probabilities`` for class probabilities. With a range,
+    ``target_column`` (a column letter) writes the predictions back into that
+    column of the sheet; rows with no input cells are left untouched.
+    """
+    model = MLModel.query.get_or_404(model_id)
+    source = Spreadsheet.query.get(model.spreadsheet_id)
+    if not source or source.user_id != current_user.id:
+        return jsonify({
+            'success': False,
+            'message': 'You do not have permission to use this model'
+        })
+    
+    try:
+        predictor = predictor_cache.get(model.id, model.created_at, model.version, lambda: Predictor.from_model(model))
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error loading model: {str(e)}'
+        })
+    
+    body = request.get_json(silent=True) or {}
+    
+    try:
+        want_probabilities = bool(body.get('probabilities')) and predictor.model_type == 'classification'
+        target_column = body.get('target_column')
+        col = None
+        base_version = None
+        if target_column:
+            if not isinstance(target_column, str) or not re.fullmatch('[A-Z]+', target_column.upper()):
+                raise ValueError('target_column must be a column letter')
+            target_column = target_column.upper()
+            col = column_index(target_column)
+            max_cols = current_app.config['MAX_SHEET_COLS']
+            if col >= max_cols:
+                raise ValueError(f'target_column must be within the first {max_cols} columns')
+        if 'inputs' in body:
+            if target_column:
+                raise ValueError('target_column needs a sheet range, not explicit inputs')
+            spreadsheet = None
+            start = 0
+            # Encoded like the training cells: empty or non-numeric inputs become 0, or categories
+            X = predictor.encode_rows(body['inputs'])
+            has_input = np.ones(X.shape[0], dtype=bool)
+        else:
+            spreadsheet = source
+            if body.get('spreadsheet_id') is not None:
+                spreadsheet = Spreadsheet.query.get_or_404(int(body['spreadsheet_id']))
+                if spreadsheet.user_id != current_user.id:
+                    return jsonify({
+                        'success': False,
+                        'message': 'Unauthorized access to spreadsheet'
+                    })
+            n_rows = spreadsheet.n_rows or 0
+            start = int(body.get('start', 0))
+            stop = body.get('stop')
+            stop = int(stop) if stop is not None else max(n_rows, start)
+            if start < 0 or stop < start:
+                raise ValueError('Invalid row range')
+            # A larger range is scored a window at a time
+            stop = min(stop, start + MAX_PREDICT_ROWS)
+            if not spreadsheet.has_legacy_data():
+                # Rows past the sheet have no inputs
+                stop = max(min(stop, n_rows), start)
+            if col is not None:
+                if col in {column_index(c) for c in predictor.input_columns}:
+                    raise ValueError('target_column cannot be one of the model inputs')
+                base_version = int(body.get('base_version', spreadsheet.version))
+            columns = spreadsheet.load_columns(predictor.input_columns, start, stop)
+            X, has_input = predictor.encode_columns(columns)
+    except (AttributeError, TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid prediction request: {str(e)}'
+        }), 400
+    
+    # Score every row in one pass, then blank out rows that had no inputs
+    results = predictor.predict_labels(X)
+    rows = np.flatnonzero(has_input).tolist()
+    if len(rows) < len(results):
+        results = [result if present else None for result, present in zip(results, has_input.tolist())]
+    response = {
+        'success': True,
+        'start': start,
+        'stop': start + len(results),
+        'results': results
+    }
+    if want_probabilities:
+        probabilities = predictor.predict_proba(X).tolist()
+        response['classes'] = predictor.classes
+        response['probabilities'] = [p if present else None for p, present in zip(probabilities, has_input.tolist())]
+    
+    if target_column:
+        # Claim the next version like a patch, so a concurrent edit is not overwritten
+        claimed = Spreadsheet.query.filter_by(id=spreadsheet.id, version=base_version).update(
+            {Spreadsheet.version: base_version + 1})
+        if not claimed:
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'message': 'Spreadsheet was changed by another session. Reload to get the latest version.',
+                'version': Spreadsheet.query.get(spreadsheet.id).version
+            }), 409
+        
+        if predictor.model_type == 'regression':
+            changes = [(start + row, col, format_number(results[row])) for row in rows]
+        else:
+            changes = [(start + row, col, str(results[row])) for row in rows]
+        try:
+            spreadsheet.apply_changes(changes)
+            recalculate(spreadsheet, base_version + 1, changes)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if is_busy(e):
+                raise
+            return jsonify({
+                'success': False,
+                'message': f'Error writing predictions: {str(e)}'
+            })
+        after_write(refresh_models, spreadsheet, base_version, {col})
+        response['written'] = len(changes)
+        response['version'] = spreadsheet.version
+    
+    return jsonify(response)
@@ -0,0 +1,254 @@
+"""Fitting models from sheet columns.
+
+Rows are split into training and held-out rows by a hash of their row
+number, so a row stays on the same side however the rest of the sheet is
+edited. Linear regression is solved from mergeable moments (count, means
+and co-moment matrix) of those rows, which lets app.ml.incremental refit
+from the row blocks that changed and still match a full fit. The other
+model families (see app.ml.families) are fitted by their estimators.
+"""
+import time
+
+import numpy as np
+from flask import current_app
+from app.instrumentation import span
+from app.ml.families import family_of
+from app.ml.hyperparameters import clean_params
+from app.ml.matrix import build_training_matrix
+from app.ml.memo import training_key, training_memo
+from app.ml.preprocessing import FeatureEncoder, feature_names, fit_encoder
+from app.storage.columnar import column_index
+from scipy import sparse
+from sklearn.linear_model import LinearRegression, LogisticRegression, Ridge
+from sklearn.metrics import accuracy_score, mean_squared_error, r2_score
+from sklearn.preprocessing import LabelEncoder
+
+# About one row in HOLDOUT_EVERY is held out for evaluation
+HOLDOUT_EVERY = 5
+
+def _row_hash(rows):
+    # Fibonacci hashing, so regular patterns in the row order don't line up with the split
+    return (np.asarray(rows, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)
+
+def holdout_mask(rows):
+    """Whether each sheet row number is a held-out evaluation row."""
+    return _row_hash(rows) % np.uint64(HOLDOUT_EVERY) == 0
+
+def fold_ids(rows, folds):
+    """Cross-validation fold (0 to folds - 1) of each sheet row number."""
+    return (_row_hash(rows) % np.uint64(folds)).astype(np.intp)
+
+def moments(X, y):
+    """Mergeable moments of the rows of ``[X, y]``: count, column means and co-moment matrix.
+
+    A sparse X stays sparse; only the small co-moment matrix is dense.
+    """
+    if sparse.issparse(X):
+        Z = sparse.hstack([X, np.asarray(y, dtype=np.float64).reshape(-1, 1)], format='csr')
+        n = Z.shape[0]
+        mean = np.asarray(Z.mean(axis=0)).ravel() if n else np.zeros(Z.shape[1])
+        comoment = (Z.T @ Z).toarray() - n * np.outer(mean, mean)
+        return {'n': int(n), 'mean': mean.tolist(), 'comoment': comoment.tolist()}
+    Z = np.column_stack([X, y]).astype(np.float64)
+    mean = Z.mean(axis=0) if len(Z) else np.zeros(Z.shape[1])
+    centered = Z - mean
+    return {'n': int(len(Z)), 'mean': mean.tolist(), 'comoment': (centered.T @ centered).tolist()}
+
+def merge_moments(records):
+    """Combine moments records into ``(n, mean, comoment)`` arrays for the union of their rows."""
+    n, mean, comoment = 0, None, None
+    for record in records:
+        if not record['n']:
+            continue
+        other_mean = np.asarray(record['mean'])
+        other_comoment = np.asarray(record['comoment'])
+        if not n:
+            n, mean, comoment = record['n'], other_mean, other_comoment
+            continue
+        # Pairwise update (Chan et al.), stable however far apart the block means are
+        total = n + record['n']
+        delta = other_mean - mean
+        comoment = comoment + other_comoment + np.outer(delta, delta) * (n * record['n'] / total)
+        mean = mean + delta * (record['n'] / total)
+        n = total
+    return n, mean, comoment
+
+def fit_linear(train, test, alpha=0.0):
+    """Least-squares (ridge, if ``alpha``) fit from merged training moments, scored on the held-out moments"""
+    n, mean, comoment = train
+    # Solved on standardized features, so the ridge penalty weighs every feature alike
+    scale = np.sqrt(np.maximum(np.diag(comoment)[:-1], 0) / n)
+    scale[scale == 0] = 1.0
+    gram = comoment[:-1, :-1] / np.outer(scale, scale) + alpha * np.eye(len(comoment) - 1)
+    coef = np.linalg.lstsq(gram, comoment[:-1, -1] / scale, rcond=None)[0] / scale
+    intercept = float(mean[-1] - mean[:-1] @ coef)
+
+    model = Ridge(alpha=alpha) if alpha else LinearRegression()
+    model.coef_ = coef
+    model.intercept_ = intercept
+    model.n_features_in_ = len(coef)
+
+    # Residual y - x.coef - intercept, summed over the held-out rows without revisiting them
+    test_n, test_mean, test_comoment = test
+    weights = np.append(-coef, 1.0)
+    offset = test_mean[-1] - test_mean[:-1] @ coef - intercept
+    sse = max(float(weights @ test_comoment @ weights + test_n * offset ** 2), 0.0)
+    total = float(test_comoment[-1, -1])
+    metrics = {
+        'mse': sse / test_n,
+        'r2': 1 - sse / total if total > 0 else (1.0 if sse == 0 else 0.0),
+        'coef': coef.tolist(),
+        'intercept': intercept
+    }
+    return model, metrics
+
+def split_moments(train_records, test_records):
+    """Merge training and held-out moments; either side falls back to all rows if empty."""
+    train = merge_moments(train_records)
+    test = merge_moments(test_records)
+    if not train[0] or not test[0]:
+        train = test = merge_moments(list(train_records) + list(test_records))
+    if train[0] < 2:
+        raise ValueError("Not enough data for training")
+    return train, test
+
+def fit_logistic(X_train, y_train, X_test, y_test, warm_start=None, C=1.0):
+    """Fit a logistic regression, starting from ``warm_start`` metrics if their classes still match"""
+    # Use LabelEncoder to convert string labels to numeric
+    label_encoder = LabelEncoder()
+    y_train_encoded = label_encoder.fit_transform(y_train)
+    classes = label_encoder.classes_.tolist()
+
+    model = LogisticRegression(C=C, max_iter=1000)
+    warm = bool(warm_start) and warm_start.get('classes') == classes
+    if warm:
+        coef = np.asarray(warm_start['coef'], dtype=np.float64)
+        warm = coef.ndim == 2 and coef.shape[1] == X_train.shape[1]
+    if warm:
+        # The solver starts from the previous fit, so a small edit converges in a few iterations
+        model.set_params(warm_start=True)
+        model.coef_ = coef
+        model.intercept_ = np.asarray(warm_start['intercept'], dtype=np.float64)
+    model.fit(X_train, y_train_encoded)
+    model.set_params(warm_start=False)
+
+    # Evaluate; held-out labels never seen in training count as misses
+    y_pred = label_encoder.inverse_transform(model.predict(X_test))
+    metrics = {
+        'accuracy': float(accuracy_score(y_test, y_pred)),
+        'coef': model.coef_.tolist(),
+        'intercept': model.intercept_.tolist(),
+        'classes': classes  # Store the mapping of numeric to string labels
+    }
+    return model, metrics, warm
+
+def prediction_latency(family, model, X):
+    """Microseconds per row to batch-predict ``X`` with a fitted model."""
+    if not X.shape[0]:
+        return None
+    started = time.perf_counter()
+    family.predict(model, X)
+    return round((time.perf_counter() - started) * 1e6 / X.shape[0], 3)
+
+def fit_estimator(family, model_type, X_train, y_train, X_test, y_test, params, n_jobs=None):
+    """Fit a registry family's estimator and score it on the held-out rows.
+
+    Classifiers are fitted on label-encoded targets; linear families also
+    report their coefficients, so predictors need not load the estimator.
+    """
+    model = family.build(model_type, params, n_jobs)
+    if model_type == 'regression':
+        model.fit(family.inputs(X_train), y_train)
+        predicted = family.predict(model, X_test)
+        metrics = {
+            'mse': float(mean_squared_error(y_test, predicted)),
+            # R² is undefined on a single held-out row
+            'r2': float(r2_score(y_test, predicted)) if len(y_test) > 1 else 0.0
+        }
+        if family.linear:
+            metrics['coef'] = np.ravel(model.coef_).tolist()
+            metrics['intercept'] = float(model.intercept_)
+        return model, metrics
+
+    label_encoder = LabelEncoder()
+    model.fit(family.inputs(X_train), label_encoder.fit_transform(y_train))
+    y_pred = label_encoder.inverse_transform(family.predict(model, X_test))
+    metrics = {
+        'accuracy': float(accuracy_score(y_test, y_pred)),
+        'classes': label_encoder.classes_.tolist()
+    }
+    if family.linear:
+        metrics['coef'] = model.coef_.tolist()
+        metrics['intercept'] = model.intercept_.tolist()
+    return model, metrics
+
+def train_model(columns, input_cols, output_col, model_type, warm_start=None, params=None):
+    """Train a model with the given data and parameters, returning the fitted estimator and its metrics.
+
+    ``warm_start`` is the previous metrics of a classifier being refreshed;
+    ``params`` are hyperparameters as returned by ``clean_params``. Cold fits
+    of data already fitted with the same parameters come from the training memo.
+    Inputs are encoded by an encoder fitted on the kept rows (see
+    app.ml.preprocessing), stored in the metrics as ``encoder``.
+    """
+    params = params or clean_params(model_type, {})
+    family = family_of(params)
+    # Prepare the data
+    with span('matrix'):
+        X, y, report, rows = build_training_matrix(columns, input_cols, output_col, model_type, with_rows=True)
+        spec = fit_encoder(columns, input_cols, rows)
+        X, _ = FeatureEncoder(spec).transform([columns[column_index(col)] for col in input_cols], rows)
+    for entry in spec['inputs']:
+        if entry['kind'] != 'numeric':
+            # Counted as coerced to 0 by the matrix builder, but encoded as categories
+            report['cells_coerced'] -= int(np.count_nonzero(columns[column_index(entry['col'])].present[rows]))
+
+    # Check if we have enough data
+    if len(y) < 2:
+        raise ValueError("Not enough data for training")
+
+    if warm_start and feature_names(warm_start.get('encoder') or {'inputs': []}) != feature_names(spec):
+        # Coefficients of other features (or of unencoded inputs) are no place to start from
+        warm_start = None
+
+    key = None
+    if warm_start is None and training_memo.enabled():
+        key = training_key(X, y, rows, model_type, params, input_cols, output_col)
+        memoized = training_memo.get(key)
+        if memoized is not None:
+            return memoized
+
+    # Split data
+    held = holdout_mask(rows)
+    train = ~held
+    if not train.any() or not held.any():
+        train = held = np.ones(len(y), dtype=bool)
+    # Row indices rather than masks, which sparse matrices index as well
+    train = np.flatnonzero(train)
+    held = np.flatnonzero(held)
+
+    # Train model
+    started = time.perf_counter()
+    with span('fit'):
+        if not family.native:
+            model, metrics = fit_estimator(family, model_type, X[train], y[train], X[held], y[held], params,
+                                           n_jobs=current_app.config.get('ENSEMBLE_JOBS') or None)
+            mode = 'full'
+        elif model_type == 'regression':
+            model, metrics = fit_linear(*split_moments([moments(X[train], y[train])], [moments(X[held], y[held])]),
+                                        alpha=params['alpha'])
+            mode = 'full'
+        else:  # classification
+            model, metrics, warm = fit_logistic(X[train], y[train], X[held], y[held], warm_start, C=params['C'])
+            mode = 'warm_start' if warm else 'full'
+    fit_seconds = time.perf_counter() - started
+    metrics['data'] = report
+    metrics['fit'] = {'mode': mode, 'fit_seconds': round(fit_seconds, 4),
+                      'predict_us_per_row': prediction_latency(family, model, X[held])}
+    metrics['params'] = params
+    metrics['encoder'] = spec
+    metrics['features'] = feature_names(spec)
+
+    if key is not None:
+        training_memo.put(key, model, metrics, fit_seconds)
+    return model, metrics
@@ -2,6 +2,11 @@ from datetime import datetime
 from app import db
 
 class MLModel(db.Model):
+    # Serves a sheet's models, newest first, and the join from sheets to models.
+    # AUTOINCREMENT keeps SQLite from reusing a deleted model's id
+    __table_args__ = (db.Index('ix_ml_model_spreadsheet_created', 'spreadsheet_id', 'created_at'),
+                      {'sqlite_autoincrement': True})
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     model_type = db.Column(db.String(20), nullable=False)  # 'regression' or 'classification'
@@ -9,9 +14,20 @@ class MLModel(db.Model):
     input_columns = db.Column(db.Text, nullable=False)  # Stored as JSON string
     output_column = db.Column(db.String(10), nullable=False)  # Column letter (A, B, C, etc.)
     
-    # Model parameters and metrics stored as JSON
-    parameters = db.Column(db.Text, default='{}')
-    metrics = db.Column(db.Text, default='{}')
+    # Model parameters and metrics stored as JSON; deferred, and loaded together
+    # on first access, since listings only need them when they show metrics
+    parameters = db.deferred(db.Column(db.Text, default='{}'), group='fit')
+    metrics = db.deferred(db.Column(db.Text, default='{}'), group='fit')
+    
+    # Bumped on every retrain so cached predictors for older fits are never used
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Spreadsheet version the current fit reflects (None for fits made before this was tracked)
+    sheet_version = db.Column(db.Integer)
+    
+    # Per-row-block statistics that let a refresh refit from changed blocks only,
+    # as JSON (see app.ml.incremental); deferred since it grows with the sheet
+    fit_state = db.deferred(db.Column(db.Text))
     
     # Reference to the spreadsheet this model belongs to
     spreadsheet_id = db.Column(db.Integer, db.ForeignKey('spreadsheet.id'), nullable=False)
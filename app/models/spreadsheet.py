@@ -1,22 +1,386 @@
+from collections import defaultdict
+from itertools import zip_longest
 from datetime import datetime
 from app import db
+from app.instrumentation import span
+from app.storage.cache import sheet_cache
+from app.storage.columnar import (CHUNK_ROWS, assemble_column, build_column,
+                                  column_index, column_letter, decode_column, encode_column,
+                                  split_cells)
+from app.storage.stats import chunk_stats, merge_stats
 from flask_login import current_user
+import json
 
 class Spreadsheet(db.Model):
+    # Serves the home page listing: a user's sheets, most recently updated first
+    __table_args__ = (db.Index('ix_spreadsheet_user_updated', 'user_id', 'updated_at'),)
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    
-    # Store spreadsheet data as JSON string
-    data = db.Column(db.Text, default='{}')
-    
+
+    # Legacy JSON cell data; cells now live in SheetChunk rows. Deferred so
+    # queries for sheets never read it; ``legacy_data`` says whether there is any
+    data = db.deferred(db.Column(db.Text, default='{}'))
+    legacy_data = db.column_property(db.and_(data.columns[0].isnot(None), data.columns[0].notin_(['', '{}'])))
+
     # Store column names as JSON string
     column_names = db.Column(db.Text, default='{}')
-    
+
+    # Sheet dimensions, kept in sync with the chunks
+    n_rows = db.Column(db.Integer, default=0)
+    n_cols = db.Column(db.Integer, default=0)
+
+    # Bumped on every save; patches must name the version they were based on
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    # Per-column summaries (type, counts, min/max/mean, distinct estimate) as JSON,
+    # keyed by column letter and maintained on every write
+    column_stats = db.Column(db.Text)
+
+    # Sheet version the stored formula values (SheetFormula rows) were computed for;
+    # None until the sheet's formulas are first evaluated
+    formula_version = db.Column(db.Integer)
+
     # Add relationship to ML models
     models = db.relationship('MLModel', backref='spreadsheet', lazy='dynamic', cascade='all, delete-orphan')
-    
+
+    # Columnar cell storage
+    chunks = db.relationship('SheetChunk', backref='spreadsheet', lazy='dynamic', cascade='all, delete-orphan')
+
+    # Computed values of formula cells, see app.formulas.engine
+    formulas = db.relationship('SheetFormula', lazy='dynamic', cascade='all, delete-orphan')
+
+    def has_legacy_data(self):
+        """Whether cells are still stored in the legacy JSON ``data`` column."""
+        if 'data' in self.__dict__:
+            # Loaded or assigned in this session, so newer than the flag
+            return self.data not in (None, '', '{}')
+        return bool(self.legacy_data)
+
+    def _legacy_chunks(self):
+        with span('parse'):
+            try:
+                data = json.loads(self.data)
+            except ValueError:
+                data = {}
+            return split_cells(data)
+
+    def load_columns(self, cols=None, start=0, stop=None):
+        """Load columns as typed arrays, keyed by column index.
+
+        ``cols`` is a list of column indices or letters (all stored columns if
+        omitted). Only chunks overlapping rows [start, stop) of the requested
+        columns are read; ``stop`` defaults to the sheet's row count.
+        """
+        if cols is not None:
+            cols = [column_index(c) if isinstance(c, str) else c for c in cols]
+
+        chunks = defaultdict(dict)
+        if self.has_legacy_data():
+            n_rows, legacy = self._legacy_chunks()
+            for (col, number), column in legacy.items():
+                chunks[col][number] = column
+        else:
+            n_rows = self.n_rows or 0
+            if stop is None:
+                stop = n_rows
+            for (col, number), column in self._cached_chunks(
+                    cols, start // CHUNK_ROWS, max(stop - 1, start) // CHUNK_ROWS).items():
+                chunks[col][number] = column
+
+        if stop is None:
+            stop = n_rows
+        if cols is None:
+            cols = sorted(chunks)
+        return {col: assemble_column(chunks.get(col, {}), start, stop) for col in cols}
+
+    def _cached_chunks(self, cols, first, last):
+        """Decoded chunks ``first`` to ``last`` of ``cols`` (all if None), keyed by ``(col, chunk)``.
+
+        Served from the sheet cache where it holds the chunk's current version;
+        only the chunks it misses are read from the database.
+        """
+        manifest = sheet_cache.manifest(self.id, self.version)
+        if manifest is None:
+            manifest = {(col, number): version for col, number, version in db.session.query(
+                SheetChunk.col, SheetChunk.chunk, SheetChunk.version).filter_by(spreadsheet_id=self.id)}
+            sheet_cache.put_manifest(self.id, self.version, manifest)
+
+        wanted = set(cols) if cols is not None else None
+        columns = {}
+        missing = []
+        for key, version in manifest.items():
+            if first <= key[1] <= last and (wanted is None or key[0] in wanted):
+                column = sheet_cache.get(self.id, key, version)
+                if column is None:
+                    missing.append(key)
+                else:
+                    columns[key] = column
+        if missing:
+            query = SheetChunk.query.filter(
+                SheetChunk.spreadsheet_id == self.id,
+                SheetChunk.col.in_({col for col, _ in missing}),
+                SheetChunk.chunk.in_({number for _, number in missing}))
+            missing = set(missing)
+            for chunk in query:
+                key = (chunk.col, chunk.chunk)
+                if key in missing:
+                    columns[key] = chunk.column()
+                    sheet_cache.put(self.id, key, chunk.version, columns[key])
+        return columns
+
+    def cell_dict(self, cols=None):
+        """Return cells in the legacy ``{"row-col": text}`` form."""
+        data = {}
+        for col, column in self.load_columns(cols).items():
+            for row, text in column.items():
+                data[f"{row}-{col}"] = text
+        return data
+
+    def cell_window(self, row_start, row_stop, col_start, col_stop):
+        """Return cells of rows [row_start, row_stop) and columns [col_start, col_stop).
+
+        The result is a list of rows, each a list of cell texts with '' for
+        empty cells. Rows past the end of the sheet are not included.
+        """
+        if not self.has_legacy_data():
+            row_stop = min(row_stop, self.n_rows or 0)
+        columns = self.load_columns(list(range(col_start, col_stop)), row_start, max(row_start, row_stop))
+        texts = [[text or '' for text in columns[col].texts()] for col in range(col_start, col_stop)]
+        rows = [list(row) for row in zip(*texts)]
+        if self.has_legacy_data():
+            # Legacy sheets have no stored row count; drop rows past the last cell
+            while rows and not any(rows[-1]):
+                rows.pop()
+        return rows
+
+    def column_summaries(self):
+        """Return the per-column stats, keyed by column letter."""
+        if self.column_stats is None or self.has_legacy_data():
+            return {column_letter(col): merge_stats([chunk_stats(column)])
+                    for col, column in self.load_columns().items()}
+        return json.loads(self.column_stats)
+
+    def column_types(self):
+        """Return ``{letter: type}`` for every non-empty column."""
+        return {letter: summary['type'] for letter, summary in self.column_summaries().items()
+                if summary['type']}
+
+    def refresh_column_stats(self, cols=None):
+        """Re-merge the summaries of ``cols`` (all columns if omitted) from chunk stats.
+
+        Only the small per-chunk stats records are read, except for chunks
+        written before stats existed, which are computed once and stored.
+        """
+        if self.column_stats is None:
+            cols = None
+        query = db.session.query(SheetChunk.id, SheetChunk.col, SheetChunk.stats).filter(
+            SheetChunk.spreadsheet_id == self.id)
+        if cols is not None:
+            query = query.filter(SheetChunk.col.in_(cols))
+
+        records = defaultdict(list)
+        for chunk_id, col, stats in query:
+            if stats is None:
+                chunk = SheetChunk.query.get(chunk_id)
+                chunk.stats = json.dumps(chunk_stats(chunk.column()))
+                stats = chunk.stats
+            records[col].append(json.loads(stats))
+
+        summaries = {} if cols is None or self.column_stats is None else json.loads(self.column_stats)
+        for col in (cols if cols is not None else []):
+            summaries.pop(column_letter(col), None)
+        for col, col_records in records.items():
+            summaries[column_letter(col)] = merge_stats(col_records)
+        self.column_stats = json.dumps(summaries)
+
+    def _store_chunk(self, chunk, column):
+        chunk.version = self.version or 0
+        chunk.kind = column.kind
+        with span('encode'):
+            chunk.payload = encode_column(column)
+        with span('stats'):
+            stats = chunk_stats(column)
+            chunk.stats = json.dumps(stats)
+        return stats
+
+    def write_cells(self, data):
+        """Replace every cell of the sheet with the ``{"row-col": text}`` mapping ``data``."""
+        with span('parse'):
+            n_rows, columns = split_cells(data)
+        if self.id is not None:
+            SheetChunk.query.filter_by(spreadsheet_id=self.id).delete()
+            sheet_cache.invalidate(self.id)
+        records = defaultdict(list)
+        for (col, number), column in columns.items():
+            chunk = SheetChunk(col=col, chunk=number)
+            records[col].append(self._store_chunk(chunk, column))
+            self.chunks.append(chunk)
+        self.n_rows = n_rows
+        self.n_cols = max((col for col, _ in columns), default=-1) + 1
+        self.column_stats = json.dumps({column_letter(col): merge_stats(records[col])
+                                        for col in sorted(records)})
+        self.data = '{}'
+
+    def write_rows(self, rows):
+        """Replace every cell of the sheet with an iterable of row lists.
+
+        Rows are consumed one block of CHUNK_ROWS at a time: each block's chunks
+        are flushed to the database and released before the next is read, so
+        memory stays bounded however long the input is.
+        """
+        if self.id is None:
+            db.session.add(self)
+            db.session.flush()
+        else:
+            SheetChunk.query.filter_by(spreadsheet_id=self.id).delete()
+        sheet_cache.invalidate(self.id)
+
+        records = defaultdict(list)
+        n_rows = 0
+
+        def flush_block(number, block):
+            nonlocal n_rows
+            chunks = []
+            # Transpose the block into columns; short rows are padded with empty cells
+            for col, cells in enumerate(zip_longest(*block, fillvalue='')):
+                with span('parse'):
+                    column = build_column(cells)
+                if not len(column):
+                    continue
+                chunk = SheetChunk(spreadsheet_id=self.id, col=col, chunk=number)
+                records[col].append(self._store_chunk(chunk, column))
+                chunks.append(chunk)
+                n_rows = max(n_rows, number * CHUNK_ROWS + len(column))
+            db.session.add_all(chunks)
+            db.session.flush()
+            for chunk in chunks:
+                db.session.expunge(chunk)
+
+        number = 0
+        block = []
+        for row in rows:
+            block.append(row)
+            if len(block) == CHUNK_ROWS:
+                flush_block(number, block)
+                number += 1
+                block = []
+        flush_block(number, block)
+
+        self.n_rows = n_rows
+        self.n_cols = max(records, default=-1) + 1
+        self.column_stats = json.dumps({column_letter(col): merge_stats(records[col])
+                                        for col in sorted(records)})
+        self.data = '{}'
+
+    def apply_changes(self, changes):
+        """Apply ``(row, col, text)`` cell changes in place; empty text clears a cell.
+
+        Only the chunks touched by the changes are read and rewritten.
+        """
+        self.migrate_legacy_data()
+
+        grouped = defaultdict(dict)
+        for row, col, text in changes:
+            grouped[(col, row // CHUNK_ROWS)][row % CHUNK_ROWS] = text or None
+        if not grouped:
+            return
+
+        query = SheetChunk.query.filter(
+            SheetChunk.spreadsheet_id == self.id,
+            SheetChunk.col.in_({col for col, _ in grouped}),
+            SheetChunk.chunk.in_({number for _, number in grouped}))
+        existing = {(chunk.col, chunk.chunk): chunk for chunk in query}
+
+        for (col, number), cells in grouped.items():
+            chunk = existing.get((col, number))
+            if chunk is None:
+                texts = []
+            else:
+                column = sheet_cache.get(self.id, (col, number), chunk.version) or chunk.column()
+                texts = column.texts()
+            needed = max(cells) + 1
+            if len(texts) < needed:
+                texts.extend([None] * (needed - len(texts)))
+            for offset, text in cells.items():
+                texts[offset] = text
+            while texts and not texts[-1]:
+                texts.pop()
+
+            if not texts:
+                if chunk is not None:
+                    db.session.delete(chunk)
+                continue
+            if chunk is None:
+                chunk = SheetChunk(col=col, chunk=number)
+                self.chunks.append(chunk)
+            with span('parse'):
+                column = build_column(texts)
+            self._store_chunk(chunk, column)
+            # Cached once the write commits, so the next read of the chunk is a hit
+            sheet_cache.put(self.id, (col, number), chunk.version, column, on_commit=True)
+            self.n_rows = max(self.n_rows or 0, number * CHUNK_ROWS + len(texts))
+            self.n_cols = max(self.n_cols or 0, col + 1)
+
+        sheet_cache.invalidate(self.id, list(grouped))
+
+        self.refresh_column_stats(sorted({col for col, _ in grouped}))
+
+    def migrate_legacy_data(self):
+        """Move legacy JSON cell data into columnar chunks. Returns True if anything moved."""
+        if not self.has_legacy_data():
+            return False
+        try:
+            data = json.loads(self.data)
+        except ValueError:
+            data = {}
+        self.write_cells(data)
+        return True
+
+    def __repr__(self):
+        return f'<Spreadsheet {self.name}>'
+
+class SheetChunk(db.Model):
+    """One column of one block of CHUNK_ROWS rows, stored as a binary payload."""
+    __table_args__ = (db.UniqueConstraint('spreadsheet_id', 'col', 'chunk'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    spreadsheet_id = db.Column(db.Integer, db.ForeignKey('spreadsheet.id'), nullable=False, index=True)
+    col = db.Column(db.Integer, nullable=False)  # Column index (A=0, B=1, etc.)
+    chunk = db.Column(db.Integer, nullable=False)  # Row block number
+    kind = db.Column(db.SmallInteger, nullable=False)  # columnar.NUMERIC or columnar.TEXT
+    payload = db.Column(db.LargeBinary, nullable=False)
+    stats = db.Column(db.Text)  # JSON, see app.storage.stats.chunk_stats
+    # Sheet version whose save last wrote this chunk, so model refreshes can
+    # tell which row blocks changed since they were fitted
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def column(self):
+        with span('decode'):
+            return decode_column(self.kind, self.payload)
+
+    def __repr__(self):
+        return f'<SheetChunk {self.spreadsheet_id}:{self.col}:{self.chunk}>'
+
+class SheetFormula(db.Model):
+    """A formula cell and the value last computed for it.
+
+    The formula text is also kept in the cell's chunk like any other text.
+    ``value`` is the text shown in the cell; ``error`` is set when that
+    value is an error code such as #DIV/0!.
+    """
+    __table_args__ = (db.UniqueConstraint('spreadsheet_id', 'row', 'col'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    spreadsheet_id = db.Column(db.Integer, db.ForeignKey('spreadsheet.id'), nullable=False, index=True)
+    row = db.Column(db.Integer, nullable=False)
+    col = db.Column(db.Integer, nullable=False)
+    formula = db.Column(db.Text, nullable=False)
+    value = db.Column(db.Text, nullable=False, default='')
+    error = db.Column(db.Text)
+
     def __repr__(self):
-        return f'<Spreadsheet {self.name}>' 
\ No newline at end of file
+        return f'<SheetFormula {self.spreadsheet_id}:{self.row}:{self.col}>'
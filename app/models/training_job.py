@@ -0,0 +1,59 @@
+from datetime import datetime
+from app import db
+import json
+
+class TrainingJob(db.Model):
+    """A queued model fit: creating a new model, retraining ``model_id``, or cross-validating."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    ACTIVE = (QUEUED, RUNNING)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    spreadsheet_id = db.Column(db.Integer, db.ForeignKey('spreadsheet.id'), nullable=False)
+    # Set up front for a retrain, and once the fit is stored for a new model
+    model_id = db.Column(db.Integer, db.ForeignKey('ml_model.id', ondelete='SET NULL'))
+
+    # What to train, mirroring the /ml/create form
+    name = db.Column(db.String(100), nullable=False)
+    model_type = db.Column(db.String(20), nullable=False)
+    input_columns = db.Column(db.Text, nullable=False)  # Stored as JSON string
+    output_column = db.Column(db.String(10), nullable=False)
+    # Queued automatically after a save: fold only changed rows into the existing fit
+    refresh = db.Column(db.Boolean, nullable=False, default=False)
+    # Hyperparameters as JSON; a retrain without them keeps the model's own
+    params = db.Column(db.Text)
+    # Cross-validation settings as JSON; such a job stores ``result`` instead of a model
+    cv_options = db.Column(db.Text)
+    result = db.Column(db.Text)
+
+    status = db.Column(db.String(20), nullable=False, default=QUEUED, index=True)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        now = datetime.utcnow()
+        queued_until = self.started_at or self.finished_at or now
+        return {
+            'id': self.id,
+            'status': self.status,
+            'name': self.name,
+            'model_id': self.model_id,
+            'spreadsheet_id': self.spreadsheet_id,
+            'input_columns': json.loads(self.input_columns),
+            'output_column': self.output_column,
+            'refresh': self.refresh,
+            'cross_validation': self.cv_options is not None,
+            'error': self.error,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'queued_seconds': (queued_until - self.created_at).total_seconds(),
+            'run_seconds': ((self.finished_at or now) - self.started_at).total_seconds() if self.started_at else None
+        }
+
+    def __repr__(self):
+        return f'<TrainingJob {self.id} {self.status}>'
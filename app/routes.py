@@ -1,41 +1,15 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, Response, abort, current_app, render_template, request
 from flask_login import login_required, current_user
+from app.instrumentation import metrics
+from app.ml.memo import training_memo
+from app.ml.predictor import predictor_cache
+from app.storage.cache import sheet_cache
 from app.models.spreadsheet import Spreadsheet
 from app.models.ml_model import MLModel
 import json
-import numpy as np
 
 bp = Blueprint('main', __name__)
 
-def detect_column_type(data, col_letter):
-    """Detect the type of a column based on its values."""
-    col_index = ord(col_letter) - 65  # A=0, B=1, etc.
-    has_number = False
-    has_string = False
-    has_non_empty = False
-    
-    # Check all cells in the column
-    for key, value in data.items():
-        if '-' in key:
-            row, col = map(int, key.split('-'))
-            if col == col_index:
-                if value:
-                    has_non_empty = True
-                    try:
-                        float(value)
-                        has_number = True
-                    except ValueError:
-                        has_string = True
-    
-    if not has_non_empty:
-        return None
-    elif has_number and not has_string:
-        return 'number'
-    elif has_string and not has_number:
-        return 'string'
-    else:
-        return 'mixed'
-
 @bp.route('/')
 @bp.route('/home')
 @login_required
@@ -54,16 +28,7 @@ def home():
         except:
             spreadsheet_column_names[spreadsheet.id] = {}
             
-        try:
-            data = json.loads(spreadsheet.data)
-            column_types = {}
-            for col_letter in [chr(i) for i in range(65, 75)]:  # A through J
-                col_type = detect_column_type(data, col_letter)
-                if col_type:
-                    column_types[col_letter] = col_type
-            spreadsheet_column_types[spreadsheet.id] = column_types
-        except:
-            spreadsheet_column_types[spreadsheet.id] = {}
+        spreadsheet_column_types[spreadsheet.id] = spreadsheet.column_types()
     
     # Get user's models through their spreadsheets
     models = MLModel.query.join(Spreadsheet).filter(Spreadsheet.user_id == current_user.id).order_by(MLModel.created_at.desc()).all()
@@ -73,4 +38,37 @@ def home():
                          spreadsheets=spreadsheets, 
                          models=models,
                          spreadsheet_column_names=spreadsheet_column_names,
-                         spreadsheet_column_types=spreadsheet_column_types) 
\ No newline at end of file
+                         spreadsheet_column_types=spreadsheet_column_types)
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    """Request, SQL and span totals of this worker process in the Prometheus text format."""
+    if not current_app.config['INSTRUMENTATION']:
+        abort(404)
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    
+    cache = predictor_cache.stats()
+    extra = [(f'spreadml_predictor_cache_{key}_total', 'counter', f'Predictor cache {key}.', [('', {}, cache[key])])
+             for key in ('hits', 'misses', 'evictions')]
+    extra.append(('spreadml_predictor_cache_size', 'gauge', 'Predictors held in the cache.',
+                  [('', {}, cache['size'])]))
+    sheets = sheet_cache.stats()
+    extra += [(f'spreadml_sheet_cache_{key}_total', 'counter', f'Sheet chunk cache {key}.', [('', {}, sheets[key])])
+              for key in ('hits', 'misses', 'evictions')]
+    extra.append(('spreadml_sheet_cache_bytes', 'gauge', 'Memory held by decoded sheet chunks.',
+                  [('', {}, sheets['bytes'])]))
+    if 'shared' in sheets:
+        extra += [(f'spreadml_sheet_cache_shared_{key}_total', 'counter', f'Shared sheet chunk file {key}.',
+                   [('', {}, sheets['shared'][key])]) for key in ('hits', 'misses')]
+        extra.append(('spreadml_sheet_cache_shared_bytes', 'gauge', 'Disk used by shared sheet chunk files.',
+                      [('', {}, sheets['shared']['bytes'] or 0)]))
+    memo = training_memo.stats()
+    extra += [(f'spreadml_training_memo_{key}_total', 'counter', f'Training memo {key}.', [('', {}, memo[key])])
+              for key in ('hits', 'misses')]
+    extra.append(('spreadml_training_memo_seconds_saved_total', 'counter', 'Fit time skipped by memoized fits.',
+                  [('', {}, memo['seconds_saved'])]))
+    extra.append(('spreadml_training_memo_entries', 'gauge', 'Fits held in the training memo.',
+                  [('', {}, memo['entries'])]))
+    return Response(metrics.render(extra), mimetype='text/plain; version=0.0.4')
@@ -2,4 +2,9 @@ from flask import Blueprint
 
 bp = Blueprint('spreadsheet', __name__, url_prefix='/spreadsheet')
 
+@bp.record_once
+def configure_cache(state):
+    from app.storage.cache import sheet_cache
+    sheet_cache.configure(state.app.config)
+
 from app.spreadsheet import routes 
\ No newline at end of file
@@ -1,11 +1,20 @@
-from flask import render_template, redirect, url_for, request, flash, jsonify
+from flask import render_template, redirect, url_for, request, flash, jsonify, abort, Response, stream_with_context, current_app
 from flask_login import login_required, current_user
 from app import db
+from app.database import after_write, is_busy, retry_on_busy
+from app.http import cacheable, make_etag, matching_etag, not_modified
+from app.formulas.engine import preview, recalculate, serialize
+from app.formulas.parser import is_formula
+from app.ml.jobs import refresh_models
+from app.ml.predictor import Predictor, predictor_cache
+from app.models.ml_model import MLModel
 from app.spreadsheet import bp
-from app.models.spreadsheet import Spreadsheet
+from app.models.spreadsheet import SheetFormula, Spreadsheet
+from app.storage.columnar import column_letter
+from app.storage.export import FORMATS, available_formats, export_arrow, export_csv
+from app.storage.ingest import import_csv
 import json
-import csv
-import io
+import re
 
 @bp.route('/create', methods=['POST'])
 @login_required
@@ -17,7 +26,7 @@ def create():
         return redirect(url_for('main.home'))
     
     # Create new spreadsheet with empty data
-    spreadsheet = Spreadsheet(name=name, user_id=current_user.id, data='{}')
+    spreadsheet = Spreadsheet(name=name, user_id=current_user.id, data='{}', formula_version=0)
     db.session.add(spreadsheet)
     db.session.commit()
     
@@ -38,45 +47,30 @@ def upload_csv():
         return redirect(url_for('main.home'))
     
     try:
-        # Read CSV file
-        stream = io.StringIO(csv_file.stream.read().decode("UTF8"), newline=None)
-        csv_data = list(csv.reader(stream))
+        # Stream the CSV into a new spreadsheet, one block of rows at a time
+        spreadsheet = Spreadsheet(name=name, user_id=current_user.id)
+        column_headers = import_csv(spreadsheet, csv_file.stream)
         
-        if not csv_data:
+        if column_headers is None:
+            db.session.rollback()
             flash('CSV file must contain at least one row of data.')
             return redirect(url_for('main.home'))
         
-        # Extract column headers from first row
-        column_headers = csv_data[0]
-        
-        # Convert to spreadsheet data format, starting from second row
-        spreadsheet_data = {}
-        for row_idx, row in enumerate(csv_data[1:], start=1):  # Start from 1 to skip header row
-            for col_idx, value in enumerate(row):
-                if value:  # Only store non-empty values
-                    cell_key = f"{row_idx-1}-{col_idx}"
-                    spreadsheet_data[cell_key] = value
-        
         # Create column names mapping (A=0, B=1, etc.)
         column_names = {}
         for i, header in enumerate(column_headers):
-            col_letter = chr(65 + i)  # Convert index to letter (0=A, 1=B, etc.)
+            col_letter = column_letter(i)  # Convert index to letter (0=A, 1=B, ..., AA=26)
             column_names[col_letter] = header
         
-        # Create new spreadsheet with CSV data and column names
-        spreadsheet = Spreadsheet(
-            name=name,
-            user_id=current_user.id,
-            data=json.dumps(spreadsheet_data),
-            column_names=json.dumps(column_names)
-        )
-        db.session.add(spreadsheet)
+        spreadsheet.column_names = json.dumps(column_names)
+        recalculate(spreadsheet, spreadsheet.version or 0)
         db.session.commit()
         
         flash('Spreadsheet created successfully from CSV file.')
         return redirect(url_for('spreadsheet.edit', id=spreadsheet.id))
         
     except Exception as e:
+        db.session.rollback()
         flash(f'Error processing CSV file: {str(e)}')
         return redirect(url_for('main.home'))
 
@@ -90,11 +84,8 @@ def edit(id):
         flash('You do not have permission to edit this spreadsheet.')
         return redirect(url_for('main.home'))
     
-    # Load spreadsheet data
-    try:
-        data = json.loads(spreadsheet.data)
-    except:
-        data = {}
+    # Cells are fetched by the grid a window at a time from /spreadsheet/range,
+    # so the page stays the same size however large the sheet is
     
     # Load column names
     try:
@@ -104,11 +95,81 @@ def edit(id):
     
     return render_template('spreadsheet/edit.html', 
                          spreadsheet=spreadsheet, 
-                         data=data,
-                         column_names=column_names)
+                         column_names=column_names,
+                         column_types=spreadsheet.column_types())
+
+# Largest window a single range request may ask for
+MAX_WINDOW_ROWS = 1000
+MAX_WINDOW_COLS = 100
+
+@bp.route('/range/<int:id>')
+@login_required
+def cell_range(id):
+    """Return a window of cells as ``rows``, a list of lists of cell texts.
+
+    Query parameters ``r0``/``r1`` and ``c0``/``c1`` give the half-open row
+    and column ranges. The ETag follows the sheet version, so an unchanged
+    window is answered with a 304 before any cells are read.
+
+    Formula cells keep their formula text in ``rows``; ``values`` maps their
+    ``"row-col"`` keys to the computed value shown in the cell, and
+    ``errors`` gives the message behind any error value.
+    """
+    # Only the owner and version are needed to authorize and revalidate
+    header = db.session.query(Spreadsheet.user_id, Spreadsheet.version).filter_by(id=id).first()
+    if header is None:
+        abort(404)
+    
+    # Check if user owns this spreadsheet
+    if header.user_id != current_user.id:
+        return jsonify({
+            'success': False,
+            'message': 'You do not have permission to view this spreadsheet.'
+        })
+    
+    etag = make_etag('range', id, header.version, sorted(request.args.items()))
+    held = matching_etag(etag)
+    if held:
+        return not_modified(held)
+    
+    spreadsheet = Spreadsheet.query.get(id)
+    r0 = request.args.get('r0', 0, type=int)
+    r1 = request.args.get('r1', r0 + 100, type=int)
+    c0 = request.args.get('c0', 0, type=int)
+    c1 = request.args.get('c1', max(spreadsheet.n_cols or 0, c0), type=int)
+    if r0 < 0 or c0 < 0 or r1 < r0 or c1 < c0 or r1 - r0 > MAX_WINDOW_ROWS or c1 - c0 > MAX_WINDOW_COLS:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid window; at most {MAX_WINDOW_ROWS} rows and {MAX_WINDOW_COLS} columns'
+        }), 400
+    
+    values = {}
+    errors = {}
+    formulas = SheetFormula.query.filter(
+        SheetFormula.spreadsheet_id == id,
+        SheetFormula.row >= r0, SheetFormula.row < r1,
+        SheetFormula.col >= c0, SheetFormula.col < c1)
+    for record in formulas:
+        key = f'{record.row}-{record.col}'
+        values[key] = record.value
+        if record.error is not None:
+            errors[key] = record.error
+    
+    return cacheable(jsonify({
+        'success': True,
+        'version': spreadsheet.version,
+        'n_rows': spreadsheet.n_rows or 0,
+        'n_cols': spreadsheet.n_cols or 0,
+        'r0': r0,
+        'c0': c0,
+        'rows': spreadsheet.cell_window(r0, r1, c0, c1),
+        'values': values,
+        'errors': errors
+    }), etag)
 
 @bp.route('/save/<int:id>', methods=['POST'])
 @login_required
+@retry_on_busy
 def save(id):
     spreadsheet = Spreadsheet.query.get_or_404(id)
     
@@ -123,16 +184,254 @@ def save(id):
         data = request.json.get('data', {})
         column_names = request.json.get('column_names', {})
         
-        spreadsheet.data = json.dumps(data)
+        # Bump the version first so the rewritten chunks are stamped with it
+        base_version = spreadsheet.version
+        spreadsheet.version += 1
+        spreadsheet.write_cells(data)
         spreadsheet.column_names = json.dumps(column_names)
+        recalculate(spreadsheet, spreadsheet.version)
+        db.session.commit()
+        
+        # Every cell was rewritten, so every model of the sheet is refreshed
+        after_write(refresh_models, spreadsheet, base_version)
+        
+        return jsonify({
+            'success': True,
+            'message': 'Spreadsheet saved successfully.',
+            'version': spreadsheet.version
+        })
+    except Exception as e:
+        db.session.rollback()
+        if is_busy(e):
+            raise
+        return jsonify({
+            'success': False,
+            'message': f'Error saving spreadsheet: {str(e)}'
+        }) 
+
+def parse_changes(raw_changes):
+    """Validate a patch's ``[{"row": r, "col": c, "value": text}]`` list into tuples.
+
+    A null or empty ``value`` clears the cell; any other value, 0 included,
+    is stored as its text.
+    """
+    max_rows = current_app.config['MAX_SHEET_ROWS']
+    max_cols = current_app.config['MAX_SHEET_COLS']
+    changes = []
+    for change in raw_changes:
+        row = change.get('row')
+        col = change.get('col')
+        if not isinstance(row, int) or not isinstance(col, int) or row < 0 or col < 0:
+            raise ValueError('Each change needs non-negative integer "row" and "col"')
+        if row >= max_rows or col >= max_cols:
+            raise ValueError(f'Cells must be within the first {max_rows} rows and {max_cols} columns')
+        value = change.get('value')
+        changes.append((row, col, None if value is None or value == '' else str(value)))
+    return changes
+
+@bp.route('/patch/<int:id>', methods=['POST'])
+@login_required
+@retry_on_busy
+def patch(id):
+    """Apply a batch of cell changes made against ``base_version`` of the sheet."""
+    spreadsheet = Spreadsheet.query.get_or_404(id)
+    
+    # Check if user owns this spreadsheet
+    if spreadsheet.user_id != current_user.id:
+        return jsonify({
+            'success': False,
+            'message': 'You do not have permission to save this spreadsheet.'
+        })
+    
+    try:
+        base_version = int(request.json.get('base_version'))
+        changes = parse_changes(request.json.get('changes', []))
+        column_names = request.json.get('column_names')
+    except (AttributeError, TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid patch: {str(e)}'
+        }), 400
+    
+    # Claim the next version atomically so concurrent patches on one base conflict
+    claimed = Spreadsheet.query.filter_by(id=id, version=base_version).update(
+        {Spreadsheet.version: base_version + 1})
+    if not claimed:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': 'Spreadsheet was changed by another session. Reload to get the latest version.',
+            'version': Spreadsheet.query.get(id).version
+        }), 409
+    
+    try:
+        spreadsheet.apply_changes(changes)
+        if column_names is not None:
+            spreadsheet.column_names = json.dumps(column_names)
+        # Only formulas downstream of the changed cells are evaluated again
+        values, errors = serialize(recalculate(spreadsheet, base_version + 1, changes))
         db.session.commit()
         
+        after_write(refresh_models, spreadsheet, base_version, {col for _, col, _ in changes})
+        
         return jsonify({
             'success': True,
-            'message': 'Spreadsheet saved successfully.'
+            'message': 'Spreadsheet saved successfully.',
+            'version': spreadsheet.version,
+            'column_types': spreadsheet.column_types(),
+            'values': values,
+            'errors': errors
         })
     except Exception as e:
+        db.session.rollback()
+        if is_busy(e):
+            raise
         return jsonify({
             'success': False,
             'message': f'Error saving spreadsheet: {str(e)}'
-        }) 
\ No newline at end of file
+        })
+
+# Most formulas a single preview request may evaluate
+MAX_PREVIEW_FORMULAS = 1000
+
+@bp.route('/evaluate/<int:id>', methods=['POST'])
+@login_required
+def evaluate(id):
+    """Evaluate unsaved ``[{"row": r, "col": c, "value": formula}]`` against the saved sheet.
+
+    Nothing is stored; the values are for showing a formula's result while
+    it is being edited. Saving the cell computes and stores it for good.
+    """
+    spreadsheet = Spreadsheet.query.get_or_404(id)
+    
+    # Check if user owns this spreadsheet
+    if spreadsheet.user_id != current_user.id:
+        return jsonify({
+            'success': False,
+            'message': 'You do not have permission to view this spreadsheet.'
+        })
+    
+    try:
+        formulas = {}
+        for row, col, text in parse_changes(request.json.get('formulas', [])[:MAX_PREVIEW_FORMULAS]):
+            if not is_formula(text):
+                raise ValueError('Each entry needs a "value" starting with "="')
+            formulas[(row, col)] = text
+    except (AttributeError, TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid request: {str(e)}'
+        }), 400
+    
+    values, errors = serialize(preview(spreadsheet, formulas))
+    return jsonify({
+        'success': True,
+        'version': spreadsheet.version,
+        'values': values,
+        'errors': errors
+    })
+
+@bp.route('/recalculate/<int:id>', methods=['POST'])
+@login_required
+@retry_on_busy
+def recalculate_all(id):
+    """Evaluate every formula of the sheet again, e.g. after the models it predicts with changed."""
+    spreadsheet = Spreadsheet.query.get_or_404(id)
+    
+    # Check if user owns this spreadsheet
+    if spreadsheet.user_id != current_user.id:
+        return jsonify({
+            'success': False,
+            'message': 'You do not have permission to save this spreadsheet.'
+        })
+    
+    try:
+        base_version = int((request.get_json(silent=True) or {}).get('base_version', spreadsheet.version))
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'message': 'Invalid base_version'
+        }), 400
+    
+    # Claim a version like a patch, so cached windows are revalidated
+    claimed = Spreadsheet.query.filter_by(id=id, version=base_version).update(
+        {Spreadsheet.version: base_version + 1})
+    if not claimed:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': 'Spreadsheet was changed by another session. Reload to get the latest version.',
+            'version': Spreadsheet.query.get(id).version
+        }), 409
+    
+    try:
+        recalculated = recalculate(spreadsheet, base_version + 1)
+        db.session.commit()
+        return jsonify({
+            'success': True,
+            'message': f'Recalculated {len(recalculated)} formula cell(s).',
+            'version': spreadsheet.version
+        })
+    except Exception as e:
+        db.session.rollback()
+        if is_busy(e):
+            raise
+        return jsonify({
+            'success': False,
+            'message': f'Error recalculating spreadsheet: {str(e)}'
+        })
+
+@bp.route('/export/<int:id>')
+@login_required
+def export(id):
+    """Download the sheet as ``format`` csv (default), parquet or arrow.
+
+    The file is streamed a block of rows at a time. With ``model_id``, the
+    model's prediction for every row is added as a last column (empty where
+    the row has no input cells).
+    """
+    spreadsheet = Spreadsheet.query.get_or_404(id)
+    
+    # Check if user owns this spreadsheet
+    if spreadsheet.user_id != current_user.id:
+        return jsonify({
+            'success': False,
+            'message': 'You do not have permission to view this spreadsheet.'
+        })
+    
+    file_format = request.args.get('format', 'csv')
+    if file_format not in available_formats():
+        return jsonify({
+            'success': False,
+            'message': f'Unsupported format; available: {", ".join(available_formats())}'
+        }), 400
+    
+    predictor = None
+    prediction_name = None
+    model_id = request.args.get('model_id', type=int)
+    if model_id is not None:
+        model = MLModel.query.get_or_404(model_id)
+        source = Spreadsheet.query.get(model.spreadsheet_id)
+        if not source or source.user_id != current_user.id:
+            return jsonify({
+                'success': False,
+                'message': 'You do not have permission to use this model'
+            })
+        try:
+            predictor = predictor_cache.get(model.id, model.created_at, model.version, lambda: Predictor.from_model(model))
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'message': f'Error loading model: {str(e)}'
+            })
+        prediction_name = f'{model.name} (predicted)'
+    
+    if file_format == 'csv':
+        chunks = export_csv(spreadsheet, predictor, prediction_name)
+    else:
+        chunks = export_arrow(spreadsheet, file_format, predictor, prediction_name)
+    mimetype, extension = FORMATS[file_format]
+    filename = re.sub(r'[^\w.-]+', '_', spreadsheet.name, flags=re.ASCII).strip('_') or f'sheet-{id}'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}.{extension}"'
+    })
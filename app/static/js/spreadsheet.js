@@ -2,7 +2,6 @@ document.addEventListener('DOMContentLoaded', function () {
     // -------------------------------
     // Global Variables and Element References
     // -------------------------------
-    let modelCache = {};
     const spreadsheetEl = document.getElementById('spreadsheet');
     if (!spreadsheetEl) return; // Exit if the spreadsheet element is not present
   
@@ -12,13 +11,34 @@ document.addEventListener('DOMContentLoaded', function () {
     const modelsListEl = document.getElementById('models-list');
     const editorInput = document.getElementById('editor-input');
   
-    // Default grid dimensions
-    const rows = 100;
-    const cols = 10;
+    // Grid dimensions: at least 100 x 10, and rows grow as cells near the end are edited
+    const SPARE_ROWS = 50;
+    const sheetRows = parseInt(spreadsheetEl.dataset.nRows || '0', 10);
+    const sheetCols = parseInt(spreadsheetEl.dataset.nCols || '0', 10);
+    let rows = Math.max(100, sheetRows + SPARE_ROWS);
+    const cols = Math.max(10, sheetCols);
+
+    // Cells are fetched from the server a window of rows at a time, and only
+    // rows near the viewport are in the DOM
+    const WINDOW_ROWS = 200;
+    const WINDOW_COLS = 100;  // Widest window the range API serves
+    const OVERSCAN_ROWS = 20;
+    const loadedWindows = {};  // window index -> Promise for its cells
+    let rowHeight = 34;  // Measured once the first row is rendered
+    let renderedStart = 0;
+    let renderedStop = 0;
+    const renderedRows = {};  // row index -> <tr>
   
-    // In-memory representation of spreadsheet data
+    // Cells loaded so far (plus local edits), keyed by "row-col"
     let spreadsheetData = {};
     let columnNames = {};  // Store custom column names
+    let columnTypes = {};  // Column letter -> type, from the server's column stats
+    let formulaValues = {};  // "row-col" -> {formula, value, error} computed by the server
+
+    // Changes since the last version acknowledged by the server
+    let sheetVersion = parseInt(spreadsheetEl.dataset.version || '0', 10);
+    let pendingChanges = {};  // cellKey -> new value ('' clears the cell)
+    let columnNamesDirty = false;
   
     // Track the currently selected cell
     let selectedCell = null;
@@ -27,13 +47,13 @@ document.addEventListener('DOMContentLoaded', function () {
     let isSelecting = false;
   
     // -------------------------------
-    // Load Initial Spreadsheet Data
+    // Load Initial Spreadsheet Metadata
     // -------------------------------
-    if (spreadsheetEl.dataset.initial) {
+    if (spreadsheetEl.dataset.columnTypes) {
       try {
-        spreadsheetData = JSON.parse(spreadsheetEl.dataset.initial);
+        columnTypes = JSON.parse(spreadsheetEl.dataset.columnTypes);
       } catch (e) {
-        console.error('Error parsing initial spreadsheet data:', e);
+        console.error('Error parsing column types:', e);
       }
     }
   
@@ -63,6 +83,24 @@ document.addEventListener('DOMContentLoaded', function () {
       } else {
         delete spreadsheetData[cellKey];
       }
+      pendingChanges[cellKey] = value || '';
+      if (parseInt(row, 10) >= rows - SPARE_ROWS) {
+        rows = parseInt(row, 10) + SPARE_ROWS + 1;
+        renderRows();
+      }
+    }
+
+    /**
+     * Convert a zero-based column index to its letter (A, ..., Z, AA, ...).
+     * @param {number} col - Column index.
+     * @returns {string}
+     */
+    function columnLetter(col) {
+      let letter = '';
+      for (let n = col + 1; n > 0; n = Math.floor((n - 1) / 26)) {
+        letter = String.fromCharCode(65 + (n - 1) % 26) + letter;
+      }
+      return letter;
     }
   
     /**
@@ -82,24 +120,62 @@ document.addEventListener('DOMContentLoaded', function () {
     }
   
     /**
-     * Save spreadsheet data via API call.
+     * Save the cells changed since the last acknowledged version via API call.
      * @param {function} [callback] - Optional callback after saving.
      */
     function saveSpreadsheet(callback) {
+      const sent = pendingChanges;
+      const changes = Object.keys(sent).map(cellKey => {
+        const [row, col] = cellKey.split('-').map(Number);
+        return { row: row, col: col, value: sent[cellKey] };
+      });
+      if (changes.length === 0 && !columnNamesDirty) {
+        if (typeof callback === 'function') {
+          callback();
+        } else {
+          showMessage('No changes to save.', 'success');
+        }
+        return;
+      }
+
       saveBtn.disabled = true;
       saveBtn.textContent = 'Saving...';
+      pendingChanges = {};
+      const sentColumnNames = columnNamesDirty;
+      columnNamesDirty = false;
+
+      // Put unacknowledged changes back, without clobbering newer edits
+      const restorePending = () => {
+        Object.keys(sent).forEach(cellKey => {
+          if (!(cellKey in pendingChanges)) {
+            pendingChanges[cellKey] = sent[cellKey];
+          }
+        });
+        columnNamesDirty = columnNamesDirty || sentColumnNames;
+      };
   
-      fetch(`/spreadsheet/save/${spreadsheetId}`, {
+      fetch(`/spreadsheet/patch/${spreadsheetId}`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ 
-          data: spreadsheetData,
-          column_names: columnNames
+          base_version: sheetVersion,
+          changes: changes,
+          column_names: sentColumnNames ? columnNames : null
         })
       })
-        .then(response => response.json())
-        .then(data => {
-          if (data.success) {
+        .then(response => response.json().then(data => ({ status: response.status, data: data })))
+        .then(({ status, data }) => {
+          if (status === 409) {
+            restorePending();
+            showMessage(data.message, 'error');
+          } else if (data.success) {
+            sheetVersion = data.version;
+            // Values of the saved formulas and of every formula downstream of the edits
+            storeFormulaValues(data.values, data.errors);
+            if (data.column_types) {
+              columnTypes = data.column_types;
+              updateColumnHeaders();
+            }
             if (!callback) {
               showMessage('Spreadsheet saved successfully!', 'success');
             }
@@ -107,10 +183,12 @@ document.addEventListener('DOMContentLoaded', function () {
               callback();
             }
           } else {
+            restorePending();
             showMessage('Error saving spreadsheet: ' + data.message, 'error');
           }
         })
         .catch(error => {
+          restorePending();
           showMessage('An error occurred while saving.', 'error');
           console.error('Error:', error);
         })
@@ -122,24 +200,6 @@ document.addEventListener('DOMContentLoaded', function () {
         });
     }
   
-    /**
-     * Parse a cell reference (e.g., "A1") into row and column indices.
-     * @param {string} ref - The cell reference.
-     * @returns {Object|null} The row and col indices or null if invalid.
-     */
-    function parseCellReference(ref) {
-      const match = ref.match(/^([A-Z])(\d+)$/);
-      if (!match) return null;
-      const colLetter = match[1];
-      const rowNum = parseInt(match[2], 10);
-      const colIndex = colLetter.charCodeAt(0) - 65; // A=0, B=1, etc.
-      const rowIndex = rowNum - 1; // Convert 1-based to 0-based index
-      if (rowIndex < 0 || rowIndex >= rows || colIndex < 0 || colIndex >= cols) {
-        return null;
-      }
-      return { row: rowIndex, col: colIndex };
-    }
-  
     // -------------------------------
     // Formula Evaluation Functions
     // -------------------------------
@@ -173,6 +233,22 @@ document.addEventListener('DOMContentLoaded', function () {
                   `;
                 }
 
+                // Family, fit time, prediction latency and size of the fitted model
+                const fit = model.metrics.fit || {};
+                const family = (model.metrics.params && model.metrics.params.family) || 'linear';
+                const fitDetails = [
+                  fit.fit_seconds != null ? `fitted in ${fit.fit_seconds.toFixed(2)}s` : '',
+                  fit.mode === 'memoized' ? 'reused a previous fit' : '',
+                  fit.predict_us_per_row != null ? `${fit.predict_us_per_row.toFixed(2)} µs/row to predict` : '',
+                  fit.model_bytes != null ? `${(fit.model_bytes / 1024).toFixed(1)} KB` : ''
+                ].filter(Boolean).join(', ');
+                metricsHtml += `
+                  <div class="model-fit">
+                    <p><strong>Family:</strong> ${family.replace(/_/g, ' ')}</p>
+                    ${fitDetails ? `<p class="fit-info">${fitDetails}</p>` : ''}
+                  </div>
+                `;
+
                 // Format column names with custom names if available
                 const formatColumn = (col) => model.source_column_names[col] || col;
                 const inputColumns = model.input_columns.map(formatColumn);
@@ -184,10 +260,16 @@ document.addEventListener('DOMContentLoaded', function () {
                 const sourceInfo = model.source_spreadsheet.id === parseInt(spreadsheetId) 
                   ? '' 
                   : `<p class="source-info">Trained on spreadsheet: ${model.source_spreadsheet.name}</p>`;
+                
+                // Edits since the last fit are being folded in by a background refresh
+                const staleInfo = model.stale
+                  ? '<p class="stale-info">Updating with the latest sheet changes…</p>'
+                  : '';
   
                 modelCard.innerHTML = `
                   <h4>${model.name}</h4>
                   ${sourceInfo}
+                  ${staleInfo}
                   <p><strong>Type:</strong> ${model.type}</p>
                   <div class="model-columns">
                     <p><strong>Input Columns:</strong></p>
@@ -233,195 +315,110 @@ document.addEventListener('DOMContentLoaded', function () {
     }
   
     /**
-     * Evaluate a cell's formula if it starts with "=".
-     * @param {HTMLInputElement} inputEl - The cell's input element.
-     * @param {number} row - Row index.
-     * @param {number} col - Column index.
+     * Record formula values computed by the server.
+     * @param {Object} values - "row-col" -> value shown in the cell.
+     * @param {Object} errors - "row-col" -> message, for cells showing an error.
+     * @param {Object} [formulas] - "row-col" -> formula the values were computed from
+     *   (defaults to the cells' current text).
      */
-    function evaluateFormula(inputEl, row, col) {
-      const formula = inputEl.value.trim();
-      if (!formula.startsWith('=')) return;
-  
-      // Regex to capture model formula: =ModelName(A1, B1, ...)
-      const modelRegex = /^=([A-Za-z0-9_]+)\(([^)]*)\)$/;
-      const match = formula.match(modelRegex);
-      if (!match) {
-        inputEl.classList.add('formula-error');
-        inputEl.title = 'Invalid formula format. Use =ModelName(A1, B1, ...)';
+    function storeFormulaValues(values, errors, formulas) {
+      Object.keys(values || {}).forEach(cellKey => {
+        formulaValues[cellKey] = {
+          formula: formulas ? formulas[cellKey] : spreadsheetData[cellKey],
+          value: values[cellKey],
+          error: (errors || {})[cellKey] || null
+        };
+        const [row, col] = cellKey.split('-');
+        const input = cellAt(row, col);
+        if (input) fillCell(input);
+      });
+    }
+
+    // Unsaved formulas waiting to be previewed, "row-col" -> formula
+    let pendingPreviews = {};
+    let previewTimer = null;
+
+    /**
+     * Ask the server for the value of an unsaved formula. Formulas edited in
+     * quick succession are evaluated by a single request.
+     */
+    function previewFormula(cellKey, formula) {
+      pendingPreviews[cellKey] = formula;
+      clearTimeout(previewTimer);
+      previewTimer = setTimeout(flushPreviews, 150);
+    }
+
+    function flushPreviews() {
+      const sent = pendingPreviews;
+      pendingPreviews = {};
+      const formulas = Object.keys(sent).map(cellKey => {
+        const [row, col] = cellKey.split('-').map(Number);
+        return { row: row, col: col, value: sent[cellKey] };
+      });
+      if (!formulas.length) return;
+      fetch(`/spreadsheet/evaluate/${spreadsheetId}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ formulas: formulas })
+      })
+        .then(response => response.json())
+        .then(data => {
+          if (!data.success) throw new Error(data.message);
+          storeFormulaValues(data.values, data.errors, sent);
+        })
+        .catch(error => console.error('Error evaluating formulas:', error));
+    }
+
+    /**
+     * Show the computed value of a formula cell, or the formula itself until
+     * the server has evaluated it.
+     */
+    function showFormula(input, cellKey, formula) {
+      const computed = formulaValues[cellKey];
+      input.classList.add('formula-cell');
+      if (!computed || computed.formula !== formula) {
+        input.title = 'Calculating...';
+        if (pendingPreviews[cellKey] !== formula) previewFormula(cellKey, formula);
         return;
       }
-      const modelName = match[1];
-      const paramStr = match[2];
-      const params = paramStr.split(',').map(p => p.trim());
-  
-      // If models are not yet cached, load them then evaluate
-      if (Object.keys(modelCache).length === 0) {
-        fetch(`/ml/list/${spreadsheetId}`)
-          .then(response => response.json())
-          .then(data => {
-            if (data.success) {
-              data.models.forEach(model => {
-                modelCache[model.name.toLowerCase()] = model;
-              });
-              evaluateModelFormula(inputEl, row, col, modelName, params);
-            }
-          })
-          .catch(error => {
-            inputEl.classList.add('formula-error');
-            inputEl.title = 'Error loading models';
-          });
+      input.value = computed.value;
+      if (computed.error) {
+        input.classList.add('formula-error');
+        input.title = `${computed.value}: ${computed.error}`;
       } else {
-        evaluateModelFormula(inputEl, row, col, modelName, params);
+        input.title = formula;
       }
     }
-  
+
     /**
-     * Evaluate the model formula by collecting referenced cell values and calling the evaluation API.
-     * @param {HTMLInputElement} inputEl - The cell's input element.
-     * @param {number} row - Row index of the cell.
-     * @param {number} col - Column index of the cell.
-     * @param {string} modelName - The model name.
-     * @param {Array<string>} cellRefs - Array of cell references (e.g., ["A1", "B1"]).
+     * Evaluate every formula of the sheet again on the server, e.g. once a
+     * model they predict with has been (re)trained, then reload the cells.
      */
-    function evaluateModelFormula(inputEl, row, col, modelName, cellRefs) {
-      const model = modelCache[modelName.toLowerCase()];
-      if (!model) {
-        inputEl.classList.add('formula-error');
-        inputEl.title = `Model "${modelName}" not found`;
-        return;
-      }
-      if (cellRefs.length !== model.input_columns.length) {
-        inputEl.classList.add('formula-error');
-        inputEl.title = `Model requires ${model.input_columns.length} inputs, got ${cellRefs.length}`;
-        return;
-      }
-      const inputValues = [];
-      let allValid = true;
-      for (let i = 0; i < cellRefs.length; i++) {
-        const cellRef = cellRefs[i];
-        const expectedType = model.source_column_types[model.input_columns[i]];
-        const cellCoord = parseCellReference(cellRef);
-        if (!cellCoord) {
-          inputEl.classList.add('formula-error');
-          inputEl.title = `Invalid cell reference: ${cellRef}`;
-          allValid = false;
-          break;
-        }
-        const { row: cellRow, col: cellCol } = cellCoord;
-        const cellKey = `${cellRow}-${cellCol}`;
-        const cellValue = spreadsheetData[cellKey] || '';
-        
-        // Handle type conversion if needed
-        let convertedValue = cellValue;
-        if (expectedType === 'number' && cellValue) {
-          try {
-            convertedValue = parseFloat(cellValue);
-            if (isNaN(convertedValue)) {
-              inputEl.classList.add('formula-error');
-              inputEl.title = `Cell ${cellRef} must contain a numeric value for input ${model.input_columns[i]}`;
-              allValid = false;
-              break;
-            }
-          } catch (e) {
-            inputEl.classList.add('formula-error');
-            inputEl.title = `Error converting cell ${cellRef} to number for input ${model.input_columns[i]}`;
-            allValid = false;
-            break;
-          }
-        }
-        
-        inputValues.push(convertedValue || 0);
-      }
-      if (!allValid) return;
-  
-      fetch(`/ml/evaluate/${model.id}`, {
+    function recalculateFormulas() {
+      fetch(`/spreadsheet/recalculate/${spreadsheetId}`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ inputs: inputValues })
+        body: JSON.stringify({ base_version: sheetVersion })
       })
         .then(response => response.json())
         .then(data => {
-          if (data.success) {
-            // Store the original formula
-            const cellKey = `${row}-${col}`;
-            spreadsheetData[cellKey] = inputEl.value;
-            inputEl.classList.add('formula-cell');
-            inputEl.classList.remove('formula-error');
-  
-            // Show the result (limiting decimals)
-            const resultValue = parseFloat(data.result).toFixed(4);
-            inputEl.dataset.result = resultValue;
-            if (model.type === 'classification') {
-              const classValue = parseFloat(resultValue) >= 0.5 ? 1 : 0;
-              inputEl.value = classValue;
-            } else {
-              inputEl.value = resultValue;
-            }
-            inputEl.title = 'Formula result: ' + resultValue;
-          } else {
-            inputEl.classList.add('formula-error');
-            inputEl.title = data.message;
-          }
+          if (!data.success) return;
+          sheetVersion = data.version;
+          Object.keys(loadedWindows).forEach(index => delete loadedWindows[index]);
+          renderRows();
         })
-        .catch(error => {
-          inputEl.classList.add('formula-error');
-          inputEl.title = 'Error evaluating formula';
-          console.error('Error:', error);
-        });
+        .catch(error => console.error('Error recalculating formulas:', error));
     }
   
     // -------------------------------
     // Spreadsheet Grid Initialization
     // -------------------------------
   
-    /**
-     * Detect the type of a column based on its values.
-     * @param {number} col - Column index.
-     * @returns {string|null} Column type ('number', 'string', 'mixed', or null if empty).
-     */
-    function detectColumnType(col) {
-      let hasNumber = false;
-      let hasString = false;
-      let hasNonEmpty = false;
-      
-      // Check all cells in the column
-      for (let r = 0; r < rows; r++) {
-        const cellKey = `${r}-${col}`;
-        const value = spreadsheetData[cellKey];
-        
-        if (!value) {
-          continue;
-        }
-        
-        hasNonEmpty = true;
-        // Check if it's a number
-        if (!isNaN(parseFloat(value)) && isFinite(value)) {
-          hasNumber = true;
-        } else {
-          hasString = true;
-        }
-      }
-      
-      // If column is completely empty, return null
-      if (!hasNonEmpty) {
-        return null;
-      }
-      
-      // Determine column type
-      if (hasNumber && !hasString) {
-        return 'number';
-      } else if (hasString && !hasNumber) {
-        return 'string';
-      } else {
-        return 'mixed';
-      }
-    }
-  
     /**
      * Update column headers with type information and custom names.
      */
     function updateColumnHeaders() {
-      const headerRow = document.querySelector('.spreadsheet-table tr');
+      const headerRow = document.querySelector('.spreadsheet-table thead tr');
       if (!headerRow) return;
       
       // Skip the first cell (corner cell)
@@ -429,8 +426,8 @@ document.addEventListener('DOMContentLoaded', function () {
         const colHeader = headerRow.children[c + 1];
         if (!colHeader) continue;
         
-        const colType = detectColumnType(c);
-        const colLetter = String.fromCharCode(65 + c);
+        const colLetter = columnLetter(c);
+        const colType = columnTypes[colLetter];
         
         // Clear existing content
         colHeader.innerHTML = '';
@@ -455,6 +452,9 @@ document.addEventListener('DOMContentLoaded', function () {
         // Handle blur event to save changes
         letterDiv.addEventListener('blur', function() {
           const newName = this.textContent.trim();
+          if (newName !== (columnNames[this.dataset.col] || this.dataset.col)) {
+            columnNamesDirty = true;
+          }
           if (newName) {
             columnNames[this.dataset.col] = newName;
           } else {
@@ -487,276 +487,391 @@ document.addEventListener('DOMContentLoaded', function () {
         colHeader.appendChild(container);
       }
     }
+
+    /**
+     * Fetch one window of rows from the range API into spreadsheetData.
+     * Each window is requested at most once; a failed request may be retried.
+     * @param {number} index - Window index (rows index*WINDOW_ROWS onwards).
+     * @returns {Promise} Resolves once the window's cells are loaded.
+     */
+    function loadWindow(index) {
+      if (!loadedWindows[index]) {
+        const r0 = index * WINDOW_ROWS;
+        const requests = [];
+        for (let c0 = 0; c0 < cols; c0 += WINDOW_COLS) {
+          const c1 = Math.min(cols, c0 + WINDOW_COLS);
+          requests.push(
+            fetch(`/spreadsheet/range/${spreadsheetId}?r0=${r0}&r1=${r0 + WINDOW_ROWS}&c0=${c0}&c1=${c1}`)
+              .then(response => response.json())
+              .then(data => {
+                if (!data.success) throw new Error(data.message);
+                Object.keys(data.values || {}).forEach(cellKey => {
+                  const [row, col] = cellKey.split('-').map(Number);
+                  formulaValues[cellKey] = {
+                    formula: data.rows[row - data.r0][col - data.c0],
+                    value: data.values[cellKey],
+                    error: (data.errors || {})[cellKey] || null
+                  };
+                });
+                data.rows.forEach((cells, i) => {
+                  cells.forEach((value, j) => {
+                    const cellKey = `${data.r0 + i}-${data.c0 + j}`;
+                    // Unsaved local edits win over what the server sent
+                    if (value && !(cellKey in pendingChanges)) {
+                      spreadsheetData[cellKey] = value;
+                    }
+                  });
+                });
+              }));
+        }
+        loadedWindows[index] = Promise.all(requests)
+          .then(() => fillRenderedRows(r0, r0 + WINDOW_ROWS))
+          .catch(error => {
+            delete loadedWindows[index];
+            console.error('Error loading cells:', error);
+            throw error;
+          });
+      }
+      return loadedWindows[index];
+    }
+
+    /**
+     * Find the input for a cell if its row is currently rendered.
+     */
+    function cellAt(row, col) {
+      return spreadsheetEl.querySelector(`.cell[data-row="${row}"][data-col="${col}"]`);
+    }
+
+    /**
+     * Show a cell's stored value in its input, or the value of its formula.
+     */
+    function fillCell(input) {
+      const cellKey = `${input.dataset.row}-${input.dataset.col}`;
+      input.value = spreadsheetData[cellKey] || '';
+      input.classList.remove('formula-cell', 'formula-error');
+      input.title = '';
+      if (input.value.startsWith('=')) {
+        showFormula(input, cellKey, input.value);
+      }
+    }
+
+    /**
+     * Refresh rendered rows in [start, stop) after their cells were loaded.
+     */
+    function fillRenderedRows(start, stop) {
+      for (let r = Math.max(start, renderedStart); r < Math.min(stop, renderedStop); r++) {
+        renderedRows[r].querySelectorAll('.cell').forEach(input => {
+          if (input !== document.activeElement) fillCell(input);
+        });
+      }
+    }
+
+    /**
+     * Build the <tr> for one data row.
+     */
+    function createRow(r) {
+      const row = document.createElement('tr');
+      row.className = 'data-row';
+
+      // Row header (1, 2, 3, ...)
+      const rowHeader = document.createElement('th');
+      rowHeader.className = 'row-header';
+      rowHeader.textContent = r + 1;
+      row.appendChild(rowHeader);
+
+      // Data cells
+      for (let c = 0; c < cols; c++) {
+        const cell = document.createElement('td');
+        const input = document.createElement('input');
+        input.className = 'cell';
+        input.dataset.row = r;
+        input.dataset.col = c;
+        cell.appendChild(input);
+        row.appendChild(cell);
+        fillCell(input);
+      }
+      return row;
+    }
+
+    /**
+     * Render the rows around the viewport, reusing rows that stay in range,
+     * and fetch their windows plus the next one.
+     */
+    function renderRows() {
+      const tbody = spreadsheetEl.querySelector('.spreadsheet-table tbody');
+      if (!tbody) return;
+      const wrapper = spreadsheetEl.parentElement;
+      const viewportRows = Math.ceil(wrapper.clientHeight / rowHeight) + 1;
+      const start = Math.max(0, Math.min(Math.floor(wrapper.scrollTop / rowHeight), rows - viewportRows) - OVERSCAN_ROWS);
+      const stop = Math.min(rows, start + viewportRows + 2 * OVERSCAN_ROWS);
+      const topSpacer = tbody.firstElementChild;
+      const bottomSpacer = tbody.lastElementChild;
+
+      // Drop rows that left the range, then add the new ones at either end
+      Object.keys(renderedRows).forEach(key => {
+        const r = parseInt(key, 10);
+        if (r < start || r >= stop) {
+          renderedRows[r].remove();
+          delete renderedRows[r];
+        }
+      });
+      const firstKept = Math.max(start, renderedStart);
+      const lastKept = Math.min(stop, renderedStop);
+      const before = firstKept < lastKept ? renderedRows[firstKept] : bottomSpacer;
+      for (let r = start; r < stop; r++) {
+        if (renderedRows[r]) continue;
+        renderedRows[r] = createRow(r);
+        tbody.insertBefore(renderedRows[r], r < firstKept ? before : bottomSpacer);
+      }
+      renderedStart = start;
+      renderedStop = stop;
+
+      const firstRow = renderedRows[start];
+      if (firstRow && firstRow.offsetHeight) {
+        rowHeight = firstRow.offsetHeight;
+      }
+      topSpacer.style.height = `${start * rowHeight}px`;
+      bottomSpacer.style.height = `${(rows - stop) * rowHeight}px`;
+
+      const firstWindow = Math.floor(start / WINDOW_ROWS);
+      const lastWindow = Math.floor(Math.max(start, stop - 1) / WINDOW_ROWS);
+      for (let index = firstWindow; index <= lastWindow + 1; index++) {
+        if (index * WINDOW_ROWS < rows) loadWindow(index).catch(() => {});
+      }
+      if (selectionStart && selectionEnd) updateSelection();
+    }
+
+    /**
+     * Focus a cell, scrolling it into the rendered range first if needed.
+     */
+    function focusCell(row, col) {
+      let cell = cellAt(row, col);
+      if (!cell) {
+        const wrapper = spreadsheetEl.parentElement;
+        wrapper.scrollTop = Math.max(0, row * rowHeight - wrapper.clientHeight / 2);
+        renderRows();
+        cell = cellAt(row, col);
+      }
+      if (cell) {
+        cell.focus();
+        cell.select();
+      }
+    }
   
     /**
-     * Creates and appends the spreadsheet grid (table) to the DOM.
+     * Creates the spreadsheet grid (table) and wires its events.
+     * Cell events are delegated to the table because rows come and go as it scrolls.
      */
     function initSpreadsheet() {
       const table = document.createElement('table');
       table.className = 'spreadsheet-table';
   
-      // Create header row with column labels (A, B, C, ...)
+      // Header row with column labels (A, B, C, ...), filled by updateColumnHeaders
+      const thead = document.createElement('thead');
       const headerRow = document.createElement('tr');
-      const cornerCell = document.createElement('th');
-      headerRow.appendChild(cornerCell);
+      headerRow.appendChild(document.createElement('th'));
       for (let c = 0; c < cols; c++) {
-        const colHeader = document.createElement('th');
-        const colLetter = String.fromCharCode(65 + c);
-        const container = document.createElement('div');
-        container.className = 'col-header-container';
-        
-        const letterDiv = document.createElement('div');
-        letterDiv.className = 'col-letter';
-        letterDiv.textContent = columnNames[colLetter] || colLetter;
-        letterDiv.dataset.col = colLetter;
-        letterDiv.contentEditable = true;
+        headerRow.appendChild(document.createElement('th'));
+      }
+      thead.appendChild(headerRow);
+      table.appendChild(thead);
+
+      // Spacers stand in for the rows above and below the rendered range
+      const tbody = document.createElement('tbody');
+      ['top', 'bottom'].forEach(side => {
+        const spacer = document.createElement('tr');
+        spacer.className = `spacer-row spacer-${side}`;
+        const td = document.createElement('td');
+        td.colSpan = cols + 1;
+        spacer.appendChild(td);
+        tbody.appendChild(spacer);
+      });
+      table.appendChild(tbody);
+      spreadsheetEl.appendChild(table);
+
+      const cellOf = e => (e.target.classList && e.target.classList.contains('cell') ? e.target : null);
+
+      // Update data on change
+      table.addEventListener('change', function (e) {
+        const input = cellOf(e);
+        if (!input) return;
+        updateData(input.dataset.row, input.dataset.col, input.value);
+        fillCell(input);
+      });
+
+      // Handle mouse events for selection
+      table.addEventListener('mousedown', function (e) {
+        const input = cellOf(e);
+        if (!input) return;
+        isSelecting = true;
+        selectionStart = { row: parseInt(input.dataset.row), col: parseInt(input.dataset.col) };
+        selectionEnd = { ...selectionStart };
+        updateSelection();
+        e.preventDefault(); // Prevent focus from being removed
+      });
+
+      table.addEventListener('mouseover', function (e) {
+        const input = cellOf(e);
+        if (input && isSelecting) {
+          selectionEnd = { row: parseInt(input.dataset.row), col: parseInt(input.dataset.col) };
+          updateSelection();
+        }
+      });
+
+      document.addEventListener('mouseup', function () {
+        if (isSelecting) {
+          isSelecting = false;
+          // Focus the last selected cell
+          const lastCell = cellAt(selectionEnd.row, selectionEnd.col);
+          if (lastCell) {
+            lastCell.focus();
+          }
+        }
+      });
+
+      // Handle copy event
+      table.addEventListener('copy', function (e) {
+        if (!cellOf(e) || !selectionStart || !selectionEnd) return;
         
-        // Add click handler for editing
-        letterDiv.addEventListener('click', function(e) {
-          e.stopPropagation();
-          this.focus();
-        });
+        e.preventDefault();
         
-        // Handle blur event to save changes
-        letterDiv.addEventListener('blur', function() {
-          const newName = this.textContent.trim();
-          if (newName) {
-            columnNames[this.dataset.col] = newName;
-          } else {
-            delete columnNames[this.dataset.col];
-          }
-        });
+        // Get the bounds of the selection
+        const minRow = Math.min(selectionStart.row, selectionEnd.row);
+        const maxRow = Math.max(selectionStart.row, selectionEnd.row);
+        const minCol = Math.min(selectionStart.col, selectionEnd.col);
+        const maxCol = Math.max(selectionStart.col, selectionEnd.col);
         
-        // Handle keydown events
-        letterDiv.addEventListener('keydown', function(e) {
-          if (e.key === 'Enter') {
-            e.preventDefault();
-            this.blur();
-          } else if (e.key === 'Escape') {
-            e.preventDefault();
-            this.textContent = columnNames[this.dataset.col] || this.dataset.col;
-            this.blur();
+        // Build the copied data
+        const copiedData = [];
+        for (let row = minRow; row <= maxRow; row++) {
+          const rowData = [];
+          for (let col = minCol; col <= maxCol; col++) {
+            const cellKey = `${row}-${col}`;
+            rowData.push(spreadsheetData[cellKey] || '');
           }
-        });
+          copiedData.push(rowData.join('\t'));
+        }
         
-        container.appendChild(letterDiv);
-        colHeader.appendChild(container);
-        headerRow.appendChild(colHeader);
-      }
-      table.appendChild(headerRow);
-  
-      // Create data rows
-      for (let r = 0; r < rows; r++) {
-        const row = document.createElement('tr');
-  
-        // Row header (1, 2, 3, ...)
-        const rowHeader = document.createElement('th');
-        rowHeader.className = 'row-header';
-        rowHeader.textContent = r + 1;
-        row.appendChild(rowHeader);
-  
-        // Data cells
-        for (let c = 0; c < cols; c++) {
-          const cell = document.createElement('td');
-          const input = document.createElement('input');
-          input.className = 'cell';
-          input.dataset.row = r;
-          input.dataset.col = c;
-  
-          // Load data if it exists
-          const cellKey = `${r}-${c}`;
-          if (spreadsheetData[cellKey]) {
-            input.value = spreadsheetData[cellKey];
-            if (input.value && input.value.startsWith('=')) {
-              evaluateFormula(input, r, c);
-            }
-          }
-  
-          // Update data on change
-          input.addEventListener('change', function () {
-            updateData(r, c, input.value);
-            if (input.value && input.value.startsWith('=')) {
-              evaluateFormula(input, r, c);
-            }
-            // Update column headers after data change
-            updateColumnHeaders();
-          });
-
-          // Handle mouse events for selection
-          input.addEventListener('mousedown', function(e) {
-            isSelecting = true;
-            selectionStart = { row: r, col: c };
-            selectionEnd = { row: r, col: c };
-            updateSelection();
-            e.preventDefault(); // Prevent focus from being removed
-          });
-
-          input.addEventListener('mouseover', function(e) {
-            if (isSelecting) {
-              selectionEnd = { row: r, col: c };
-              updateSelection();
-            }
-          });
+        // Copy to clipboard
+        e.clipboardData.setData('text', copiedData.join('\n'));
+      });
 
-          document.addEventListener('mouseup', function(e) {
-            if (isSelecting) {
-              isSelecting = false;
-              // Focus the last selected cell
-              const lastCell = document.querySelector(
-                `.cell[data-row="${selectionEnd.row}"][data-col="${selectionEnd.col}"]`
-              );
-              if (lastCell) {
-                lastCell.focus();
-              }
+      // Handle paste events for multi-cell paste
+      table.addEventListener('paste', function (e) {
+        const input = cellOf(e);
+        if (!input) return;
+        e.preventDefault();
+        const pastedData = e.clipboardData.getData('text');
+        const pastedRows = pastedData.split('\n').map(row => row.split('\t'));
+        
+        // Get the starting position
+        const startRow = parseInt(input.dataset.row);
+        const startCol = parseInt(input.dataset.col);
+        
+        // Process each row and column; rows outside the rendered range only update the data
+        pastedRows.forEach((row, rowOffset) => {
+          row.forEach((value, colOffset) => {
+            const targetRow = startRow + rowOffset;
+            const targetCol = startCol + colOffset;
+            if (targetCol >= cols) return;
+            updateData(targetRow, targetCol, value);
+            const targetCell = cellAt(targetRow, targetCol);
+            if (targetCell) {
+              fillCell(targetCell);
             }
           });
+        });
+      });
 
-          // Handle copy event
-          input.addEventListener('copy', function(e) {
-            if (!selectionStart || !selectionEnd) return;
-            
+      table.addEventListener('focusin', function (e) {
+        const input = cellOf(e);
+        if (!input) return;
+        selectedCell = input;
+        const cellKey = `${input.dataset.row}-${input.dataset.col}`;
+        const rawValue = spreadsheetData[cellKey];
+        // Show raw formula if available, otherwise show displayed value
+        if (rawValue && rawValue.startsWith('=')) {
+          editorInput.value = rawValue;
+        } else {
+          editorInput.value = input.value;
+        }
+        // Clear any existing selection when focusing a cell
+        if (!isSelecting) {
+          selectionStart = null;
+          selectionEnd = null;
+          updateSelection();
+        }
+      });
+  
+      // Keyboard navigation for cells
+      table.addEventListener('keydown', function (e) {
+        const input = cellOf(e);
+        if (!input) return;
+        const currentRow = parseInt(input.dataset.row);
+        const currentCol = parseInt(input.dataset.col);
+        let nextRow = currentRow;
+        let nextCol = currentCol;
+        switch (e.key) {
+          case 'ArrowUp':
+            nextRow = Math.max(0, currentRow - 1);
+            break;
+          case 'ArrowDown':
+            nextRow = Math.min(rows - 1, currentRow + 1);
+            break;
+          case 'ArrowLeft':
+            nextCol = Math.max(0, currentCol - 1);
+            break;
+          case 'ArrowRight':
+            nextCol = Math.min(cols - 1, currentCol + 1);
+            break;
+          case 'Tab':
             e.preventDefault();
-            
-            // Get the bounds of the selection
-            const minRow = Math.min(selectionStart.row, selectionEnd.row);
-            const maxRow = Math.max(selectionStart.row, selectionEnd.row);
-            const minCol = Math.min(selectionStart.col, selectionEnd.col);
-            const maxCol = Math.max(selectionStart.col, selectionEnd.col);
-            
-            // Build the copied data
-            const copiedData = [];
-            for (let row = minRow; row <= maxRow; row++) {
-              const rowData = [];
-              for (let col = minCol; col <= maxCol; col++) {
-                const cellKey = `${row}-${col}`;
-                rowData.push(spreadsheetData[cellKey] || '');
+            if (e.shiftKey) {
+              if (currentCol > 0) {
+                nextCol = currentCol - 1;
+              } else if (currentRow > 0) {
+                nextRow = currentRow - 1;
+                nextCol = cols - 1;
+              }
+            } else {
+              if (currentCol < cols - 1) {
+                nextCol = currentCol + 1;
+              } else if (currentRow < rows - 1) {
+                nextRow = currentRow + 1;
+                nextCol = 0;
               }
-              copiedData.push(rowData.join('\t'));
             }
-            
-            // Copy to clipboard
-            e.clipboardData.setData('text', copiedData.join('\n'));
-          });
-
-          // Handle paste events for multi-cell paste
-          input.addEventListener('paste', function(e) {
+            break;
+          case 'Enter':
             e.preventDefault();
-            const pastedData = e.clipboardData.getData('text');
-            const pastedRows = pastedData.split('\n').map(row => row.split('\t'));
-            
-            // Get the starting position
-            const startRow = parseInt(input.dataset.row);
-            const startCol = parseInt(input.dataset.col);
-            
-            // Process each row and column
-            pastedRows.forEach((row, rowOffset) => {
-              row.forEach((value, colOffset) => {
-                const targetRow = startRow + rowOffset;
-                const targetCol = startCol + colOffset;
-                
-                // Check if we're within bounds
-                if (targetRow < rows && targetCol < cols) {
-                  const targetCell = document.querySelector(
-                    `.cell[data-row="${targetRow}"][data-col="${targetCol}"]`
-                  );
-                  if (targetCell) {
-                    targetCell.value = value;
-                    updateData(targetRow, targetCol, value);
-                    if (value && value.startsWith('=')) {
-                      evaluateFormula(targetCell, targetRow, targetCol);
-                    }
-                  }
-                }
-              });
-            });
-          });
-
-          input.addEventListener('focus', function () {
-            selectedCell = input;
-            const cellKey = `${r}-${c}`;
-            const rawValue = spreadsheetData[cellKey];
-            // Show raw formula if available, otherwise show displayed value
-            if (rawValue && rawValue.startsWith('=')) {
-              editorInput.value = rawValue;
+            if (e.shiftKey) {
+              nextRow = Math.max(0, currentRow - 1);
             } else {
-              editorInput.value = input.value;
-            }
-            // Clear any existing selection when focusing a cell
-            if (!isSelecting) {
-              selectionStart = null;
-              selectionEnd = null;
-              updateSelection();
+              nextRow = Math.min(rows - 1, currentRow + 1);
             }
-          });
-  
-          // Keyboard navigation for cells
-          input.addEventListener('keydown', function (e) {
-            const currentRow = parseInt(input.dataset.row);
-            const currentCol = parseInt(input.dataset.col);
-            let nextRow = currentRow;
-            let nextCol = currentCol;
-            switch (e.key) {
-              case 'ArrowUp':
-                nextRow = Math.max(0, currentRow - 1);
-                break;
-              case 'ArrowDown':
-                nextRow = Math.min(rows - 1, currentRow + 1);
-                break;
-              case 'ArrowLeft':
-                nextCol = Math.max(0, currentCol - 1);
-                break;
-              case 'ArrowRight':
-                nextCol = Math.min(cols - 1, currentCol + 1);
-                break;
-              case 'Tab':
-                e.preventDefault();
-                if (e.shiftKey) {
-                  if (currentCol > 0) {
-                    nextCol = currentCol - 1;
-                  } else if (currentRow > 0) {
-                    nextRow = currentRow - 1;
-                    nextCol = cols - 1;
-                  }
-                } else {
-                  if (currentCol < cols - 1) {
-                    nextCol = currentCol + 1;
-                  } else if (currentRow < rows - 1) {
-                    nextRow = currentRow + 1;
-                    nextCol = 0;
-                  }
-                }
-                break;
-              case 'Enter':
-                e.preventDefault();
-                if (e.shiftKey) {
-                  nextRow = Math.max(0, currentRow - 1);
-                } else {
-                  nextRow = Math.min(rows - 1, currentRow + 1);
-                }
-                break;
-              default:
-                return;
-            }
-            if (nextRow !== currentRow || nextCol !== currentCol) {
-              const nextCell = document.querySelector(
-                `.cell[data-row="${nextRow}"][data-col="${nextCol}"]`
-              );
-              if (nextCell) {
-                nextCell.focus();
-                nextCell.select();
-              }
-            }
-          });
-  
-          cell.appendChild(input);
-          row.appendChild(cell);
+            break;
+          default:
+            return;
         }
-        table.appendChild(row);
-      }
-      spreadsheetEl.appendChild(table);
+        if (nextRow !== currentRow || nextCol !== currentCol) {
+          focusCell(nextRow, nextCol);
+        }
+      });
+
+      // Re-render on scroll, at most once per frame
+      let renderQueued = false;
+      spreadsheetEl.parentElement.addEventListener('scroll', function () {
+        if (renderQueued) return;
+        renderQueued = true;
+        requestAnimationFrame(() => {
+          renderQueued = false;
+          renderRows();
+        });
+      });
       
-      // Update column headers with type information
+      // Update column headers with type information, then draw the first rows
       updateColumnHeaders();
+      renderRows();
     }
   
     // -------------------------------
@@ -766,12 +881,8 @@ document.addEventListener('DOMContentLoaded', function () {
     if (editorInput) {
       editorInput.addEventListener('input', function () {
         if (selectedCell) {
-          selectedCell.value = editorInput.value;
           updateData(selectedCell.dataset.row, selectedCell.dataset.col, editorInput.value);
-          // Evaluate formula if it starts with '='
-          if (editorInput.value && editorInput.value.startsWith('=')) {
-            evaluateFormula(selectedCell, selectedCell.dataset.row, selectedCell.dataset.col);
-          }
+          fillCell(selectedCell);
         }
       });
     }
@@ -814,7 +925,7 @@ document.addEventListener('DOMContentLoaded', function () {
       inputColumnsContainer.innerHTML = '';
       outputColumnSelect.innerHTML = '<option value="">Select a column</option>';
       for (let c = 0; c < cols; c++) {
-        const colLetter = String.fromCharCode(65 + c);
+        const colLetter = columnLetter(c);
         const colName = columnNames[colLetter] || colLetter;
   
         // Create input checkbox for each column
@@ -840,6 +951,30 @@ document.addEventListener('DOMContentLoaded', function () {
       }
     }
   
+    /**
+     * Poll a training job until it leaves the queued/running states.
+     * @param {number} jobId - The training job id.
+     * @returns {Promise<Object>} The finished job.
+     */
+    function waitForJob(jobId) {
+      return new Promise((resolve, reject) => {
+        const poll = () => {
+          fetch(`/ml/jobs/${jobId}`)
+            .then(response => response.json())
+            .then(data => {
+              if (!data.success) return reject(new Error(data.message));
+              if (data.job.status === 'queued' || data.job.status === 'running') {
+                setTimeout(poll, 1000);
+              } else {
+                resolve(data.job);
+              }
+            })
+            .catch(reject);
+        };
+        poll();
+      });
+    }
+  
     // Handle form submission for model creation
     createModelForm.addEventListener('submit', function (e) {
       e.preventDefault();
@@ -872,16 +1007,23 @@ document.addEventListener('DOMContentLoaded', function () {
         })
           .then(response => response.json())
           .then(data => {
-            if (data.success) {
+            if (!data.success) throw new Error(data.message);
+            submitBtn.textContent = 'Training...';
+            return waitForJob(data.job.id);
+          })
+          .then(job => {
+            if (job.status === 'done') {
               showMessage('Model created successfully!', 'success');
               modelModal.style.display = 'none';
               loadModels();
+              // Formulas may predict with the new model
+              recalculateFormulas();
             } else {
-              showMessage('Error creating model: ' + data.message, 'error');
+              showMessage('Error creating model: ' + (job.error || `training ${job.status}`), 'error');
             }
           })
           .catch(error => {
-            showMessage('An error occurred while creating the model.', 'error');
+            showMessage('Error creating model: ' + error.message, 'error');
             console.error('Error:', error);
           })
           .finally(() => {
@@ -0,0 +1 @@
+# Columnar cell storage for spreadsheets
@@ -0,0 +1,290 @@
+"""Cache of decoded sheet chunks, shared by the requests of a process and optionally across processes.
+
+Entries are the NumericColumn/TextColumn objects of single chunks, keyed by
+``(sheet id, col, chunk)`` and held for the chunk version that wrote them,
+so a save only makes the chunks it rewrote miss. Which chunks a sheet has,
+and their versions, is cached per ``(sheet id, sheet version)`` as the
+sheet's manifest, so an unchanged sheet is served without touching the
+chunk table.
+
+The process-local tier is an LRU bounded by the bytes its columns hold.
+With SHEET_CACHE_SHARED, chunks also go to a file tier under SHEET_CACHE_DIR
+(one pickle per chunk version, bounded by SHEET_CACHE_SHARED_MB), which
+gunicorn workers and training processes share through the OS page cache:
+a chunk decoded by one process is loaded, not re-read and re-decoded, by
+the others, and each process can keep a small local tier.
+
+Values read or written by a transaction that changed the database are only
+cached once it commits, so a rolled-back write never leaves chunks in the
+cache under a version number a later write will reuse.
+"""
+from collections import OrderedDict
+import os
+import pickle
+import shutil
+import sys
+import threading
+
+from sqlalchemy import event
+
+from app import db
+
+
+def column_nbytes(column):
+    """Approximate memory held by a decoded chunk column."""
+    if hasattr(column, 'values'):
+        return column.values.nbytes + column.valid.nbytes
+    return column.codes.nbytes + sum(map(sys.getsizeof, column.dictionary)) + 8 * len(column.dictionary)
+
+
+class SharedTier:
+    """Chunk columns pickled to files, one directory per sheet."""
+
+    def __init__(self, directory, maxbytes):
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self._size = None  # Bytes on disk, counted on first write
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, sheet_id, key, version=None):
+        name = f'{key[0]}-{key[1]}-' + ('' if version is None else str(version))
+        return os.path.join(self.directory, str(sheet_id), name)
+
+    def get(self, sheet_id, key, version):
+        try:
+            with open(self._path(sheet_id, key, version), 'rb') as f:
+                column = pickle.loads(f.read())
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return column
+
+    def put(self, sheet_id, key, version, column):
+        path = self._path(sheet_id, key, version)
+        data = pickle.dumps(column, protocol=pickle.HIGHEST_PROTOCOL)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temporary, 'wb') as f:
+                f.write(data)
+            # Atomic, so other processes never load a partial file
+            os.replace(temporary, path)
+        except OSError:
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._files())
+            else:
+                self._size += len(data)
+            if self._size > self.maxbytes:
+                self._trim()
+
+    def _files(self):
+        for sheet_dir in os.scandir(self.directory):
+            if not sheet_dir.is_dir():
+                continue
+            for entry in os.scandir(sheet_dir.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _trim(self):
+        # Oldest files first, down to 80% of the limit; other processes may be
+        # writing too, so the total is recounted rather than trusted
+        files = sorted(self._files(), key=lambda file: file[2])
+        self._size = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if self._size <= self.maxbytes * 0.8:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except OSError:
+                pass
+
+    def drop(self, sheet_id, keys=None):
+        if keys is None:
+            shutil.rmtree(os.path.join(self.directory, str(sheet_id)), ignore_errors=True)
+            return
+        sheet_dir = os.path.join(self.directory, str(sheet_id))
+        prefixes = tuple(os.path.basename(self._path(sheet_id, key)) for key in keys)
+        try:
+            entries = [entry for entry in os.scandir(sheet_dir) if entry.name.startswith(prefixes)]
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {
+            'directory': self.directory,
+            'bytes': self._size,
+            'maxbytes': self.maxbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class SheetCache:
+    """Thread-safe, byte-bounded LRU of decoded chunk columns and sheet manifests."""
+
+    def __init__(self, maxbytes=128 * 1024 * 1024, max_manifests=1024):
+        self.maxbytes = maxbytes
+        self.max_manifests = max_manifests
+        self.shared = None
+        self._entries = OrderedDict()  # (sheet id, col, chunk) -> (version, column, nbytes)
+        self._manifests = OrderedDict()  # sheet id -> (sheet version, {(col, chunk): version})
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, config):
+        self.maxbytes = config['SHEET_CACHE_MB'] * 1024 * 1024
+        if config['SHEET_CACHE_SHARED']:
+            self.shared = SharedTier(config['SHEET_CACHE_DIR'], config['SHEET_CACHE_SHARED_MB'] * 1024 * 1024)
+        self.clear()
+
+    def manifest(self, sheet_id, version):
+        """The sheet's ``{(col, chunk): chunk version}`` at sheet ``version``, or None."""
+        with self._lock:
+            entry = self._manifests.get(sheet_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._manifests.move_to_end(sheet_id)
+            return entry[1]
+
+    def put_manifest(self, sheet_id, version, manifest):
+        if _staged(('manifest', sheet_id, version, manifest)):
+            return
+        with self._lock:
+            self._manifests[sheet_id] = (version, manifest)
+            self._manifests.move_to_end(sheet_id)
+            while len(self._manifests) > self.max_manifests:
+                self._manifests.popitem(last=False)
+
+    def get(self, sheet_id, key, version):
+        """The decoded column of chunk ``key`` = ``(col, chunk)`` at chunk ``version``, or None."""
+        entry_key = (sheet_id,) + key
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        if self.shared is None:
+            return None
+        column = self.shared.get(sheet_id, key, version)
+        if column is not None:
+            self._store(entry_key, version, column)
+        return column
+
+    def put(self, sheet_id, key, version, column, on_commit=False):
+        """Cache a chunk read from the database, or with ``on_commit``, one the session is writing."""
+        if _staged(('column', sheet_id, key, version, column), on_commit):
+            return
+        self._store((sheet_id,) + key, version, column)
+        if self.shared is not None:
+            self.shared.put(sheet_id, key, version, column)
+
+    def _store(self, entry_key, version, column):
+        nbytes = column_nbytes(column)
+        if nbytes > self.maxbytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(entry_key, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self._entries[entry_key] = (version, column, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.maxbytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, sheet_id, keys=None):
+        """Drop the cached chunks ``keys`` (every chunk if None) of a sheet being rewritten."""
+        with self._lock:
+            self._manifests.pop(sheet_id, None)
+            if keys is None:
+                doomed = [k for k in self._entries if k[0] == sheet_id]
+            else:
+                doomed = [(sheet_id,) + key for key in keys]
+            for entry_key in doomed:
+                entry = self._entries.pop(entry_key, None)
+                if entry is not None:
+                    self.bytes -= entry[2]
+        if self.shared is not None:
+            self.shared.drop(sheet_id, keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._manifests.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'entries': len(self._entries),
+                'manifests': len(self._manifests),
+                'bytes': self.bytes,
+                'maxbytes': self.maxbytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+            }
+        if self.shared is not None:
+            stats['shared'] = self.shared.stats()
+        return stats
+
+
+sheet_cache = SheetCache()
+
+
+def _staged(entry, on_commit=False):
+    """Hold ``entry`` until commit if the current transaction has written; True if held."""
+    session = db.session()
+    if not on_commit and not session.info.get('sheet_cache_wrote'):
+        return False
+    session.info.setdefault('sheet_cache_pending', []).append(entry)
+    return True
+
+
+@event.listens_for(db.session, 'after_flush')
+def _flushed(session, flush_context):
+    session.info['sheet_cache_wrote'] = True
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _executed(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['sheet_cache_wrote'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish(session):
+    session.info.pop('sheet_cache_wrote', None)
+    for entry in session.info.pop('sheet_cache_pending', []):
+        if entry[0] == 'manifest':
+            sheet_cache.put_manifest(*entry[1:])
+        else:
+            sheet_cache.put(*entry[1:])
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard(session, previous_transaction):
+    session.info.pop('sheet_cache_wrote', None)
+    session.info.pop('sheet_cache_pending', None)
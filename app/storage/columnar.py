@@ -0,0 +1,374 @@
+"""Typed, contiguous column storage for spreadsheet cells.
+
+A sheet is split into chunks, one per column and block of CHUNK_ROWS rows.
+Each chunk is either numeric (float64 values plus a validity mask) or text
+(dictionary-encoded strings) and serializes to a compact binary payload, so
+callers can load just the columns and row blocks they need.
+"""
+import struct
+from collections import defaultdict
+
+import numpy as np
+
+CHUNK_ROWS = 16384
+
+# Chunk kinds, stored in SheetChunk.kind
+NUMERIC = 0
+TEXT = 1
+
+# Row count and integer style, padded so values stay 8-byte aligned
+_NUMERIC_HEADER = struct.Struct('<I?3x')
+_TEXT_HEADER = struct.Struct('<II')  # row count, dictionary size
+
+# Wide enough for any float64 repr, e.g. '-2.2250738585072014e-308'
+_NUMBER_TEXT = 'U32'
+
+
+def column_letter(index):
+    """Convert a zero-based column index to its letter (0=A, 25=Z, 26=AA)."""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def column_index(letter):
+    """Convert a column letter (A, B, ..., Z, AA, ...) to its zero-based index."""
+    index = 0
+    for char in letter.upper():
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+
+def parse_number(text):
+    """Parse cell text the way the app always has (``float()``), or return None."""
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def format_number(value, float_style=False):
+    """Render a float as cell text.
+
+    Whole numbers are written as '5', or as '5.0' when ``float_style`` is set;
+    everything else uses the shortest round-trip repr.
+    """
+    value = float(value)
+    if not float_style and value.is_integer() and abs(value) < 1e16:
+        return str(int(value))
+    return repr(value)
+
+
+def render_numbers(values, float_style=False):
+    """Vectorized format_number over a float64 array; returns a unicode array."""
+    text = values.astype(_NUMBER_TEXT)  # NumPy renders float64 exactly like repr()
+    if not float_style:
+        whole = np.isfinite(values) & (np.abs(values) < 1e16)
+        whole[whole] = values[whole] == np.trunc(values[whole])
+        text[whole] = values[whole].astype(np.int64).astype(_NUMBER_TEXT)
+    return text
+
+
+def parse_numbers(texts):
+    """Parse an array of cell texts; returns ``(values, parsed)`` with NaN where unparsable."""
+    texts = np.asarray(texts)
+    try:
+        return texts.astype(np.float64), np.ones(len(texts), dtype=bool)
+    except ValueError:
+        parsed = [parse_number(text) for text in texts.tolist()]
+        values = np.array([np.nan if p is None else p for p in parsed], dtype=np.float64)
+        return values, np.array([p is not None for p in parsed], dtype=bool)
+
+
+def _numeric_style(texts, values):
+    """Return the float_style that renders ``values`` back to ``texts`` exactly, or None."""
+    if not len(texts):
+        return False
+    if (render_numbers(values) == texts).all():
+        return False
+    if (render_numbers(values, float_style=True) == texts).all():
+        return True
+    return None
+
+
+class NumericColumn:
+    """A column of float64 values with a mask marking non-empty cells."""
+    kind = NUMERIC
+
+    def __init__(self, values, valid, float_style=False):
+        self.values = values
+        self.valid = valid
+        self.float_style = float_style
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def present(self):
+        return self.valid
+
+    def get(self, row):
+        if row < len(self.values) and self.valid[row]:
+            return format_number(self.values[row], self.float_style)
+        return ''
+
+    def items(self):
+        """Yield ``(row, text)`` for every non-empty cell."""
+        rows = np.flatnonzero(self.valid)
+        return zip(rows.tolist(), render_numbers(self.values[rows], self.float_style).tolist())
+
+    def texts(self):
+        """Return the cell texts as a list, with None for empty cells."""
+        texts = render_numbers(self.values, self.float_style).astype(object)
+        texts[~self.valid] = None
+        return texts.tolist()
+
+    def to_float(self):
+        """Return ``(values, numeric)``: floats (NaN where empty) and a mask of parsable cells."""
+        return self.values, self.valid
+
+    def count_numeric(self):
+        """Return ``(non_empty, numeric)`` cell counts."""
+        count = int(np.count_nonzero(self.valid))
+        return count, count
+
+
+class TextColumn:
+    """A column of dictionary-encoded strings; code -1 marks an empty cell."""
+    kind = TEXT
+
+    def __init__(self, dictionary, codes):
+        self.dictionary = dictionary
+        self.codes = codes
+        self._lookup = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def present(self):
+        return self.codes >= 0
+
+    def get(self, row):
+        if row < len(self.codes) and self.codes[row] >= 0:
+            return self.dictionary[self.codes[row]]
+        return ''
+
+    def items(self):
+        rows = np.flatnonzero(self.codes >= 0)
+        dictionary = self.dictionary
+        for row, code in zip(rows.tolist(), self.codes[rows].tolist()):
+            yield row, dictionary[code]
+
+    def texts(self):
+        dictionary = self.dictionary
+        return [dictionary[code] if code >= 0 else None for code in self.codes.tolist()]
+
+    def _numeric_lookup(self):
+        # Each distinct string is parsed once, then broadcast through the codes
+        if self._lookup is None:
+            self._lookup = parse_numbers(np.array(self.dictionary, dtype=str))
+        return self._lookup
+
+    def to_float(self):
+        lookup_values, lookup_numeric = self._numeric_lookup()
+        present = self.codes >= 0
+        codes = self.codes[present]
+        values = np.full(len(self.codes), np.nan)
+        numeric = np.zeros(len(self.codes), dtype=bool)
+        values[present] = lookup_values[codes]
+        numeric[present] = lookup_numeric[codes]
+        return values, numeric
+
+    def count_numeric(self):
+        codes = self.codes[self.codes >= 0]
+        if not len(codes):
+            return 0, 0
+        counts = np.bincount(codes, minlength=len(self.dictionary))
+        _, lookup_numeric = self._numeric_lookup()
+        return int(counts.sum()), int(counts[lookup_numeric].sum())
+
+
+class ColumnBuilder:
+    """Collect the non-empty cells of one chunk, then encode them in bulk.
+
+    A chunk is numeric only if every cell round-trips exactly through float64
+    (with a single integer style), so the original text can always be
+    reproduced; otherwise it is dictionary-encoded text.
+    """
+
+    def __init__(self):
+        self.offsets = []
+        self.texts = []
+
+    def add(self, offset, text):
+        """Set the cell at ``offset`` (past any earlier offset) to non-empty ``text``."""
+        self.offsets.append(offset)
+        self.texts.append(text)
+
+    def build(self, length=None):
+        """Encode the collected cells as a column of ``length`` rows (default: last cell + 1)."""
+        if length is None:
+            length = self.offsets[-1] + 1 if self.offsets else 0
+        return _encode_cells(np.array(self.offsets, dtype=np.intp), np.array(self.texts, dtype=str), length)
+
+
+def _encode_cells(offsets, texts, length):
+    values, parsed = parse_numbers(texts)
+    style = _numeric_style(texts, values) if parsed.all() else None
+    if style is not None:
+        column_values = np.full(length, np.nan)
+        valid = np.zeros(length, dtype=bool)
+        column_values[offsets] = values
+        valid[offsets] = True
+        return NumericColumn(column_values, valid, style)
+
+    dictionary, inverse = np.unique(texts, return_inverse=True)
+    codes = np.full(length, -1, dtype=np.int32)
+    codes[offsets] = inverse
+    return TextColumn(dictionary.tolist(), codes)
+
+
+def build_column(texts, length=None):
+    """Encode a dense sequence of cell texts (None or '' for empty) as the most compact column.
+
+    The column is ``length`` rows long, or only as long as its last non-empty
+    cell if ``length`` is omitted.
+    """
+    if None in texts:
+        texts = [text or '' for text in texts]
+    texts = np.array(texts, dtype=str)
+    offsets = np.flatnonzero(texts != '')
+    if length is None:
+        length = offsets[-1] + 1 if len(offsets) else 0
+    return _encode_cells(offsets, texts[offsets], length)
+
+
+def empty_column(length):
+    return NumericColumn(np.full(length, np.nan), np.zeros(length, dtype=bool))
+
+
+def take_rows(column, start, stop):
+    """Return rows [start, stop) of a column, padding with empty cells past its end."""
+    length = stop - start
+    if column.kind == NUMERIC:
+        values = np.full(length, np.nan)
+        valid = np.zeros(length, dtype=bool)
+        part = column.values[start:stop]
+        values[:len(part)] = part
+        valid[:len(part)] = column.valid[start:stop]
+        return NumericColumn(values, valid, column.float_style)
+    codes = np.full(length, -1, dtype=np.int32)
+    part = column.codes[start:stop]
+    codes[:len(part)] = part
+    return TextColumn(column.dictionary, codes)
+
+
+def _as_text(column):
+    if column.kind == TEXT:
+        return column
+    rows = np.flatnonzero(column.valid)
+    dictionary, inverse = np.unique(render_numbers(column.values[rows], column.float_style),
+                                    return_inverse=True)
+    codes = np.full(len(column), -1, dtype=np.int32)
+    codes[rows] = inverse
+    return TextColumn(dictionary.tolist(), codes)
+
+
+def concat_columns(columns):
+    """Concatenate columns end to end, falling back to text if their encodings differ."""
+    # Columns without cells fit either integer style
+    styles = {c.float_style for c in columns if c.kind == NUMERIC and c.valid.any()}
+    if all(c.kind == NUMERIC for c in columns) and len(styles) <= 1:
+        return NumericColumn(np.concatenate([c.values for c in columns]),
+                             np.concatenate([c.valid for c in columns]),
+                             styles.pop() if styles else False)
+    index = {}
+    parts = []
+    for column in columns:
+        column = _as_text(column)
+        # A trailing -1 keeps empty cells (code -1) empty after remapping
+        remap = np.array([index.setdefault(text, len(index)) for text in column.dictionary] + [-1],
+                         dtype=np.int32)
+        parts.append(remap[column.codes])
+    return TextColumn(list(index), np.concatenate(parts) if parts else np.empty(0, dtype=np.int32))
+
+
+def assemble_column(chunks, start, stop):
+    """Build rows [start, stop) of one column from its ``{chunk number: column}`` map."""
+    if stop <= start:
+        return empty_column(0)
+    first = start // CHUNK_ROWS
+    last = (stop - 1) // CHUNK_ROWS
+    parts = []
+    for number in range(first, last + 1):
+        chunk = chunks.get(number)
+        lo = max(start - number * CHUNK_ROWS, 0)
+        hi = min(stop - number * CHUNK_ROWS, CHUNK_ROWS)
+        parts.append(take_rows(chunk, lo, hi) if chunk is not None else empty_column(hi - lo))
+    return parts[0] if len(parts) == 1 else concat_columns(parts)
+
+
+def encode_column(column):
+    """Serialize a column to its binary payload."""
+    length = len(column)
+    if column.kind == NUMERIC:
+        return b''.join((
+            _NUMERIC_HEADER.pack(length, column.float_style),
+            np.ascontiguousarray(column.values, dtype='<f8').tobytes(),
+            np.packbits(column.valid).tobytes(),
+        ))
+    encoded = [text.encode('utf-8') for text in column.dictionary]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    return b''.join([
+        _TEXT_HEADER.pack(length, len(encoded)),
+        np.ascontiguousarray(column.codes, dtype='<i4').tobytes(),
+        offsets.tobytes(),
+    ] + encoded)
+
+
+def decode_column(kind, payload):
+    """Deserialize a payload produced by encode_column."""
+    if kind == NUMERIC:
+        length, float_style = _NUMERIC_HEADER.unpack_from(payload)
+        offset = _NUMERIC_HEADER.size
+        values = np.frombuffer(payload, dtype='<f8', count=length, offset=offset)
+        bits = np.frombuffer(payload, dtype=np.uint8, offset=offset + 8 * length)
+        valid = np.unpackbits(bits, count=length).astype(bool)
+        return NumericColumn(values, valid, float_style)
+    length, size = _TEXT_HEADER.unpack_from(payload)
+    offset = _TEXT_HEADER.size
+    codes = np.frombuffer(payload, dtype='<i4', count=length, offset=offset)
+    offset += 4 * length
+    offsets = np.frombuffer(payload, dtype='<u4', count=size + 1, offset=offset).tolist()
+    blob = bytes(payload[offset + 4 * (size + 1):])
+    dictionary = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(size)]
+    return TextColumn(dictionary, codes)
+
+
+def split_cells(data):
+    """Split a legacy ``{"row-col": text}`` cell dict into chunk columns.
+
+    Returns ``(n_rows, {(col, chunk): column})``. Each chunk column is only as
+    long as its last non-empty row.
+    """
+    groups = defaultdict(dict)
+    n_rows = 0
+    for key, value in data.items():
+        if not value or '-' not in key:
+            continue
+        row, col = map(int, key.split('-'))
+        groups[(col, row // CHUNK_ROWS)][row % CHUNK_ROWS] = str(value)
+        n_rows = max(n_rows, row + 1)
+
+    columns = {}
+    for key, cells in groups.items():
+        builder = ColumnBuilder()
+        for offset in sorted(cells):
+            builder.add(offset, cells[offset])
+        columns[key] = builder.build()
+    return n_rows, columns
@@ -0,0 +1,199 @@
+"""Streaming export of sheets as CSV, Parquet or Arrow.
+
+A sheet is read one block of CHUNK_ROWS rows at a time and each block is
+encoded and handed to the response before the next is read, so memory
+follows the block size however many rows the sheet has. Formula cells are
+exported as their computed values. A compiled predictor may add a column
+of predictions, scored block by block from the same rows.
+
+Parquet and Arrow output needs pyarrow, which is optional; CSV needs
+nothing beyond the standard library.
+"""
+from collections import defaultdict
+import csv
+import io
+import json
+
+from app.instrumentation import span
+from app.models.spreadsheet import SheetFormula
+from app.storage.columnar import CHUNK_ROWS, column_index, column_letter, empty_column, format_number
+
+try:
+    import pyarrow
+except ImportError:  # Optional; only Parquet and Arrow export need it
+    pyarrow = None
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+
+def available_formats():
+    return [name for name in FORMATS if name == 'csv' or pyarrow is not None]
+
+
+def _headers(spreadsheet, cols):
+    try:
+        names = json.loads(spreadsheet.column_names or '{}')
+    except ValueError:
+        names = {}
+    return [names.get(column_letter(col)) or column_letter(col) for col in cols]
+
+
+def _blocks(spreadsheet, cols, extra):
+    """Yield ``(start, stop, columns)`` for each block of rows; ``extra`` columns are loaded too."""
+    wanted = sorted(set(cols) | set(extra))
+    if spreadsheet.has_legacy_data():
+        # Legacy JSON cells are parsed whole whatever is asked for
+        columns = spreadsheet.load_columns(wanted)
+        n_rows = max((len(column) for column in columns.values()), default=0)
+        yield 0, n_rows, spreadsheet.load_columns(wanted, 0, n_rows)
+        return
+    n_rows = spreadsheet.n_rows or 0
+    for start in range(0, n_rows, CHUNK_ROWS):
+        stop = min(start + CHUNK_ROWS, n_rows)
+        yield start, stop, spreadsheet.load_columns(wanted, start, stop)
+
+
+def _formula_values(spreadsheet, start, stop):
+    query = SheetFormula.query.with_entities(SheetFormula.row, SheetFormula.col, SheetFormula.value).filter(
+        SheetFormula.spreadsheet_id == spreadsheet.id, SheetFormula.row >= start, SheetFormula.row < stop)
+    return {(row, col): value for row, col, value in query}
+
+
+def _predictions(predictor, columns):
+    """Predicted values of a block, with None for rows that have no input cells."""
+    X, has_input = predictor.encode_columns(columns)
+    labels = predictor.predict_labels(X)
+    return [label if present else None for label, present in zip(labels, has_input.tolist())]
+
+
+def _sheet_columns(spreadsheet):
+    if spreadsheet.has_legacy_data():
+        return sorted(spreadsheet.load_columns())
+    return list(range(spreadsheet.n_cols or 0))
+
+
+def _input_cols(predictor):
+    return [column_index(col) for col in predictor.input_columns] if predictor is not None else []
+
+
+def export_csv(spreadsheet, predictor=None, prediction_name=None):
+    """Yield the sheet as UTF-8 CSV, a header row of column names then one block of rows at a time."""
+    cols = _sheet_columns(spreadsheet)
+    positions = {col: i for i, col in enumerate(cols)}
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header = _headers(spreadsheet, cols)
+    if predictor is not None:
+        header.append(prediction_name)
+    writer.writerow(header)
+    yield buffer.getvalue().encode('utf-8')
+
+    for start, stop, columns in _blocks(spreadsheet, cols, _input_cols(predictor)):
+        with span('export'):
+            texts = [columns.get(col, empty_column(stop - start)).texts() for col in cols]
+            for (row, col), value in _formula_values(spreadsheet, start, stop).items():
+                if col in positions:
+                    texts[positions[col]][row - start] = value
+        if predictor is not None:
+            predictions = _predictions(predictor, columns)
+            if predictor.model_type == 'regression':
+                predictions = [format_number(value) if value is not None else None for value in predictions]
+            texts.append(predictions)
+        with span('export'):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(zip(*texts))
+            data = buffer.getvalue().encode('utf-8')
+        yield data
+
+
+class _Drain(io.RawIOBase):
+    """Write-only file collecting what pyarrow writes until it is taken."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _arrow_schema(spreadsheet, cols, predictor, prediction_name):
+    types = spreadsheet.column_types()
+    fields = [pyarrow.field(name, pyarrow.float64() if types.get(column_letter(col)) == 'number'
+                            else pyarrow.string())
+              for col, name in zip(cols, _headers(spreadsheet, cols))]
+    if predictor is not None:
+        fields.append(pyarrow.field(prediction_name, pyarrow.float64() if predictor.model_type == 'regression'
+                                    else pyarrow.string()))
+    return pyarrow.schema(fields)
+
+
+def _arrow_batches(spreadsheet, cols, schema, predictor):
+    for start, stop, columns in _blocks(spreadsheet, cols, _input_cols(predictor)):
+        formulas = defaultdict(list)
+        for (row, col), value in _formula_values(spreadsheet, start, stop).items():
+            formulas[col].append((row - start, value))
+        arrays = []
+        with span('export'):
+            for col, field in zip(cols, schema):
+                column = columns.get(col, empty_column(stop - start))
+                if field.type == pyarrow.float64():
+                    values, numeric = column.to_float()
+                    arrays.append(pyarrow.array(values, mask=~numeric))
+                else:
+                    texts = column.texts()
+                    for row, value in formulas.get(col, ()):
+                        texts[row] = value
+                    arrays.append(pyarrow.array(texts, pyarrow.string()))
+        if predictor is not None:
+            arrays.append(pyarrow.array(_predictions(predictor, columns), schema.field(len(cols)).type))
+        yield pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def export_arrow(spreadsheet, file_format, predictor=None, prediction_name=None):
+    """Yield the sheet as a Parquet file (one row group per block) or an Arrow IPC stream.
+
+    Numeric columns are float64 with nulls for empty cells; every other
+    column, and formula values, are strings.
+    """
+    if pyarrow is None:
+        raise RuntimeError('Parquet and Arrow export need pyarrow installed')
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    cols = _sheet_columns(spreadsheet)
+    schema = _arrow_schema(spreadsheet, cols, predictor, prediction_name)
+    sink = _Drain()
+    if file_format == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(sink, schema)
+        write = writer.write_table
+        wrap = lambda batch: pyarrow.Table.from_batches([batch])
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+        wrap = lambda batch: batch
+
+    for batch in _arrow_batches(spreadsheet, cols, schema, predictor):
+        with span('export'):
+            write(wrap(batch))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
@@ -0,0 +1,20 @@
+"""Streaming CSV import into columnar sheet storage."""
+import codecs
+import csv
+
+
+def import_csv(spreadsheet, stream, encoding='utf-8'):
+    """Decode and parse a binary CSV stream straight into ``spreadsheet``'s chunks.
+
+    The first row is returned as the column headers; the remaining rows become
+    cells. The upload is read incrementally and never held in memory as a
+    whole. Returns None if the file has no rows at all.
+    """
+    # Decoded line by line; io.TextIOWrapper needs the io ABCs, which an
+    # upload's SpooledTemporaryFile lacks before Python 3.11
+    reader = csv.reader(codecs.iterdecode(stream, encoding))
+    headers = next(reader, None)
+    if headers is None:
+        return None
+    spreadsheet.write_rows(reader)
+    return headers
@@ -0,0 +1,105 @@
+"""Per-column statistics maintained as cells are written.
+
+Every chunk keeps a small stats record (counts, numeric min/max/sum and a
+k-minimum-values sketch of its distinct values). Column summaries are
+merged from the chunk records, so an edit only recomputes the chunks it
+touched.
+"""
+import hashlib
+
+import numpy as np
+
+from app.storage.columnar import NUMERIC, parse_numbers, render_numbers
+
+SKETCH_SIZE = 256
+
+_HASH_SPACE = float(2 ** 64)
+
+
+def _mix(bits):
+    # splitmix64 finalizer: spreads float64 bit patterns uniformly over uint64
+    z = bits.astype(np.uint64)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return z ^ (z >> np.uint64(31))
+
+
+def _hash_numbers(values):
+    # Adding 0.0 folds -0.0 into 0.0, which is stored as the same text
+    return _mix((np.asarray(values, dtype=np.float64) + 0.0).view(np.uint64))
+
+
+def _hash_texts(texts):
+    texts = np.array(texts, dtype=str)
+    values, parsed = parse_numbers(texts)
+    # Hash exact numeric text like a numeric cell so both kinds of chunk agree
+    numeric = parsed & ((render_numbers(values) == texts) | (render_numbers(values, True) == texts))
+    hashes = [int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+              for text in texts[~numeric].tolist()]
+    return np.concatenate([_hash_numbers(values[numeric]), np.array(hashes, dtype=np.uint64)])
+
+
+def _sketch(hashes):
+    return np.unique(np.asarray(hashes, dtype=np.uint64))[:SKETCH_SIZE].tolist()
+
+
+def infer_type(count, numeric):
+    """Classify a column as 'number', 'string', 'mixed' or None (empty)."""
+    if not count:
+        return None
+    elif numeric == count:
+        return 'number'
+    elif not numeric:
+        return 'string'
+    else:
+        return 'mixed'
+
+
+def chunk_stats(column):
+    """Compute the mergeable stats record for one chunk column."""
+    count, numeric = column.count_numeric()
+    values, is_numeric = column.to_float()
+    numbers = values[is_numeric]
+    # Text such as "inf" parses to ±inf, which JSON cannot carry
+    numbers = numbers[np.isfinite(numbers)]
+
+    if column.kind == NUMERIC:
+        hashes = _hash_numbers(np.unique(column.values[column.valid]))
+    else:
+        used = np.unique(column.codes[column.codes >= 0])
+        hashes = _hash_texts([column.dictionary[code] for code in used.tolist()])
+
+    return {
+        'count': count,
+        'numeric': numeric,
+        'finite': int(len(numbers)),
+        'sum': float(numbers.sum()),
+        'min': float(numbers.min()) if len(numbers) else None,
+        'max': float(numbers.max()) if len(numbers) else None,
+        'sketch': _sketch(hashes),
+    }
+
+
+def merge_stats(records):
+    """Merge chunk stats records into a column summary."""
+    count = sum(r['count'] for r in records)
+    numeric = sum(r['numeric'] for r in records)
+    finite = sum(r['finite'] for r in records)
+    mins = [r['min'] for r in records if r['min'] is not None]
+    maxes = [r['max'] for r in records if r['max'] is not None]
+
+    sketch = _sketch([h for r in records for h in r['sketch']])
+    if len(sketch) < SKETCH_SIZE:
+        distinct = len(sketch)
+    else:
+        distinct = int(round((SKETCH_SIZE - 1) / (sketch[-1] / _HASH_SPACE)))
+
+    return {
+        'type': infer_type(count, numeric),
+        'count': count,
+        'numeric': numeric,
+        'min': min(mins) if mins else None,
+        'max': max(maxes) if maxes else None,
+        'mean': sum(r['sum'] for r in records) / finite if finite else None,
+        'distinct': distinct,
+    }
@@ -5,7 +5,73 @@ basedir = Path(__file__).parent
 instance_dir = basedir / 'instance'
 instance_dir.mkdir(exist_ok=True)
 
+def database_url():
+    url = os.environ.get('DATABASE_URL') or f'sqlite:///{instance_dir}/spreadml.db'
+    # Hosting platforms hand out postgres:// URLs, which SQLAlchemy 1.4 no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-key-for-testing'
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f'sqlite:///{instance_dir}/spreadml.db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False 
\ No newline at end of file
+    SQLALCHEMY_DATABASE_URI = database_url()
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connections pooled per process; the default covers a gunicorn worker's threads
+    # (PostgreSQL needs the psycopg2 driver installed)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 10)
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT') or 30)
+    # Seconds before a server-side database connection is replaced
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
+    # Times a write is retried when the database stays locked, and the first wait in seconds
+    DB_WRITE_RETRIES = int(os.environ.get('DB_WRITE_RETRIES') or 3)
+    DB_RETRY_BACKOFF = float(os.environ.get('DB_RETRY_BACKOFF') or 0.05)
+    # WAL mode, pragmas and pooling for SQLite (0 keeps the driver defaults)
+    SQLITE_TUNING = (os.environ.get('SQLITE_TUNING') or '1') != '0'
+    # Seconds a writer waits for the lock before the statement fails
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT') or 15)
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    # Page cache per connection and memory-mapped reads, in MiB
+    SQLITE_CACHE_MB = int(os.environ.get('SQLITE_CACHE_MB') or 32)
+    SQLITE_MMAP_MB = int(os.environ.get('SQLITE_MMAP_MB') or 256)
+    # Largest row and column index a cell edit may write (past them a single cell
+    # would make every full-sheet read allocate for the whole range)
+    MAX_SHEET_ROWS = int(os.environ.get('MAX_SHEET_ROWS') or 10000000)
+    MAX_SHEET_COLS = int(os.environ.get('MAX_SHEET_COLS') or 16384)
+    # Compiled predictors kept per worker process for /ml/evaluate
+    PREDICTOR_CACHE_SIZE = int(os.environ.get('PREDICTOR_CACHE_SIZE') or 128)
+    # Fitted estimators, one joblib file per model version
+    ARTIFACT_DIR = os.environ.get('ARTIFACT_DIR') or str(instance_dir / 'artifacts')
+    # Training worker processes per web process (0 trains inline in the request)
+    TRAINING_WORKERS = int(os.environ.get('TRAINING_WORKERS') or 2)
+    # Queued plus running training jobs allowed per user
+    TRAINING_JOBS_PER_USER = int(os.environ.get('TRAINING_JOBS_PER_USER') or 2)
+    # Refresh models in the background when the sheet columns they read are saved
+    MODEL_AUTO_REFRESH = (os.environ.get('MODEL_AUTO_REFRESH') or '1') != '0'
+    # Fits memoized by a hash of their training data, shared by the training workers (0 disables)
+    TRAINING_MEMO_SIZE = int(os.environ.get('TRAINING_MEMO_SIZE') or 64)
+    TRAINING_MEMO_DIR = os.environ.get('TRAINING_MEMO_DIR') or str(instance_dir / 'training_memo')
+    # Cores a random forest fit uses in each training worker (0 uses every core)
+    ENSEMBLE_JOBS = int(os.environ.get('ENSEMBLE_JOBS') or 0)
+    # Processes a cross-validation run spreads its folds over (0 uses every core)
+    CV_WORKERS = int(os.environ.get('CV_WORKERS') or 0)
+    # Default and largest time budget of a cross-validation run, in seconds
+    CV_TIME_BUDGET = float(os.environ.get('CV_TIME_BUDGET') or 60)
+    CV_MAX_TIME_BUDGET = float(os.environ.get('CV_MAX_TIME_BUDGET') or 600)
+    # Responses smaller than this are sent uncompressed
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE') or 1024)
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL') or 6)
+    # Decoded sheet chunks kept per process, in MiB
+    SHEET_CACHE_MB = int(os.environ.get('SHEET_CACHE_MB') or 128)
+    # Also keep decoded chunks in files every worker process can load (1 enables)
+    SHEET_CACHE_SHARED = (os.environ.get('SHEET_CACHE_SHARED') or '0') != '0'
+    SHEET_CACHE_DIR = os.environ.get('SHEET_CACHE_DIR') or str(instance_dir / 'sheet_cache')
+    SHEET_CACHE_SHARED_MB = int(os.environ.get('SHEET_CACHE_SHARED_MB') or 1024)
+    # Per-request timing spans, Server-Timing headers and /metrics (0 turns them off)
+    INSTRUMENTATION = (os.environ.get('INSTRUMENTATION') or '1') != '0'
+    # Bearer token /metrics requires, if set
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Sample request stacks and write requests slower than this to PROFILE_DIR (0 disables)
+    PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS') or 0)
+    PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS') or 5)
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or str(instance_dir / 'profiles') 
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""Gunicorn settings for serving the app: ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+The master imports the app and NumPy once, before it forks, so workers
+share those pages copy-on-write instead of each paying for the imports.
+scikit-learn is left to the training processes unless GUNICORN_PRELOAD_ML
+asks for it. Schema upgrades and the demo user are set up once in the
+master (``on_starting``) rather than at import time in every process.
+
+Worker boot time and each worker's first-request latency are logged, see
+``tools/bench_startup.py``. Environment overrides:
+
+  PORT                port to bind (default 8000)
+  WEB_CONCURRENCY     worker processes (default CPU count + 1, at most 8)
+  GUNICORN_THREADS    threads per worker (default 4)
+  GUNICORN_PRELOAD    set to 0 to import the app in each worker instead
+  GUNICORN_PRELOAD_ML set to 1 to also preload joblib and scikit-learn, for
+                      deployments serving models that need their estimator
+  GUNICORN_BOOTSTRAP  set to 0 when schema upgrades run as a separate release step
+"""
+import importlib
+import multiprocessing
+import os
+import time
+
+_config_loaded = time.monotonic()
+
+cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# Predictions and sheet reads are CPU-bound numpy work, so one worker per
+# core plus one to cover a worker waiting on I/O; each worker holds its own
+# predictor cache, hence the cap
+workers = int(os.environ.get('WEB_CONCURRENCY') or min(cpus + 1, 8))
+# Threads overlap database and artifact file waits within a worker
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS') or 4)
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+
+# Imported in the master before fork even without preload_app
+PRELOAD_MODULES = ('numpy',)
+if os.environ.get('GUNICORN_PRELOAD_ML', '0') != '0':
+    PRELOAD_MODULES += ('joblib', 'sklearn.linear_model', 'sklearn.preprocessing')
+BOOTSTRAP = os.environ.get('GUNICORN_BOOTSTRAP', '1') != '0'
+
+
+def on_starting(server):
+    started = time.monotonic()
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+    imported = time.monotonic()
+
+    if BOOTSTRAP:
+        from app import create_app, db
+        from app.init_db import bootstrap
+
+        app = create_app()
+        with app.app_context():
+            bootstrap()
+            # Workers must open their own connections, not inherit the master's
+            db.engine.dispose()
+
+    bootstrapped = time.monotonic()
+
+    if preload_app:
+        # Compile templates once here instead of on each worker's first page
+        jinja_env = server.app.wsgi().jinja_env
+        for name in jinja_env.list_templates():
+            jinja_env.get_template(name)
+
+    server.log.info('Preloaded %s in %.0f ms, bootstrap took %.0f ms, templates %.0f ms',
+                    ', '.join(PRELOAD_MODULES), (imported - started) * 1000,
+                    (bootstrapped - imported) * 1000, (time.monotonic() - bootstrapped) * 1000)
+
+
+def when_ready(server):
+    server.log.info('Master ready in %.0f ms (preload_app=%s, %d workers x %d threads)',
+                    (time.monotonic() - _config_loaded) * 1000, preload_app, workers, threads)
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+    worker.served_first_request = False
+
+
+def post_worker_init(worker):
+    worker.log.info('Worker %s booted in %.0f ms', worker.pid,
+                    (time.monotonic() - worker.forked_at) * 1000)
+
+
+def pre_request(worker, req):
+    req.started_at = time.monotonic()
+
+
+def post_request(worker, req, environ, resp):
+    if worker.served_first_request:
+        return
+    worker.served_first_request = True
+    worker.log.info('Worker %s first request %s %s in %.1f ms', worker.pid, req.method, req.path,
+                    (time.monotonic() - req.started_at) * 1000)
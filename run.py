@@ -1,10 +1,9 @@
-from app import create_app, db
-from app.models.user import User
+from app import create_app
+from app.init_db import upgrade_schema
 
 app = create_app()
 
-with app.app_context():
-    db.create_all()
-
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', debug=False)
\ No newline at end of file
+    with app.app_context():
+        upgrade_schema()
+    app.run(host='0.0.0.0', debug=False)
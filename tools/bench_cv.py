@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Benchmark cross-validation and hyperparameter search across worker counts.
+
+Cross-validates a logistic regression grid on synthetic data with an
+increasing number of pool processes and reports wall time, the summed
+per-fold time and the resulting speedup. Expect the speedup to level off
+at the number of cores. Run from the repository root:
+
+    python tools/bench_cv.py --rows 200000 --candidates 8 --workers 1 2 4
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.ml.evaluation import cross_validate  # noqa: E402
+from app.ml.hyperparameters import search_candidates  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parallel cross-validation.')
+    parser.add_argument('--rows', type=int, default=200000, help='Training rows.')
+    parser.add_argument('--inputs', type=int, default=8, help='Input columns.')
+    parser.add_argument('--folds', type=int, default=5, help='Cross-validation folds.')
+    parser.add_argument('--candidates', type=int, default=8, help='Grid points for C.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Pool sizes to compare.')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(args.rows, args.inputs))
+    y = (X @ rng.normal(size=args.inputs) + rng.normal(size=args.rows) > 0).astype(int)
+    rows = np.arange(args.rows)
+    candidates = search_candidates('classification', 'grid',
+                                   {'C': np.geomspace(1e-3, 1e3, args.candidates).tolist()})
+
+    print(f"{args.rows} rows x {args.inputs} inputs, {len(candidates)} candidates x {args.folds} folds, "
+          f"{os.cpu_count()} cores")
+    print(f"{'workers':>7} {'wall s':>8} {'fold s':>8} {'speedup':>8} {'best C':>9} {'accuracy':>9}")
+    for workers in args.workers:
+        result = cross_validate(X, y, rows, 'classification', candidates, folds=args.folds,
+                                time_budget=3600, workers=workers)
+        print(f"{result['workers']:>7} {result['wall_seconds']:>8.2f} {result['fold_seconds']:>8.2f} "
+              f"{result['speedup']:>7.2f}x {result['best']['params']['C']:>9.3g} {result['best']['mean']:>9.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Benchmark streaming export: rows/sec, MB/sec and peak RSS of exporting a
+sheet as CSV, Parquet and Arrow, with and without a prediction column.
+
+Builds a throwaway sheet of numeric columns and one label column, fits a
+linear regression for the prediction column, then drains each export
+generator the way a response would. Peak RSS should stay near the
+baseline however many rows the sheet has. Formats needing pyarrow are
+skipped when it is not installed. Run from the repository root:
+
+    python tools/bench_export.py --rows 1000000 --cols 10
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def build_sheet(db_path, n_rows, n_cols):
+    """Write the benchmark sheet and a model on it to a new database."""
+    sys.path.insert(0, ROOT)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from app import create_app, db
+    from app.ml.incremental import fit_sheet
+    from app.models.ml_model import MLModel
+    from app.models.spreadsheet import Spreadsheet
+    from app.models.user import User
+    from app.storage.columnar import column_letter
+
+    rng = random.Random(0)
+    labels = ['red', 'green', 'blue']
+    inputs = [column_letter(j) for j in range(n_cols - 2)]
+
+    def row():
+        values = [rng.gauss(0, 10) for _ in inputs]
+        y = sum(values) + rng.gauss(0, 1)
+        return [f'{v:.4f}' for v in values] + [f'{y:.4f}', rng.choice(labels)]
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench')
+        db.session.add(user)
+        db.session.commit()
+        names = {column_letter(j): f'col{j}' for j in range(n_cols)}
+        sheet = Spreadsheet(name='bench', user_id=user.id, column_names=json.dumps(names))
+        sheet.write_rows(row() for _ in range(n_rows))
+        db.session.commit()
+        _, metrics, state = fit_sheet(sheet, inputs, column_letter(n_cols - 2), 'regression')
+        model = MLModel(name='bench', model_type='regression', input_columns=json.dumps(inputs),
+                        output_column=column_letter(n_cols - 2), spreadsheet_id=sheet.id,
+                        metrics=json.dumps(metrics), sheet_version=state['sheet_version'],
+                        fit_state=json.dumps(state))
+        db.session.add(model)
+        db.session.commit()
+
+
+def run_export(db_path, file_format, with_predictions, n_rows):
+    """Drain one export of the benchmark sheet and print a JSON result line."""
+    sys.path.insert(0, ROOT)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from app import create_app
+    from app.ml.predictor import Predictor
+    from app.models.ml_model import MLModel
+    from app.models.spreadsheet import Spreadsheet
+    from app.storage.export import export_arrow, export_csv
+
+    app = create_app()
+    with app.app_context():
+        sheet = Spreadsheet.query.first()
+        predictor = Predictor.from_model(MLModel.query.first()) if with_predictions else None
+        baseline = peak_rss_mb()
+        start = time.perf_counter()
+        if file_format == 'csv':
+            chunks = export_csv(sheet, predictor, 'predicted')
+        else:
+            chunks = export_arrow(sheet, file_format, predictor, 'predicted')
+        size = sum(len(chunk) for chunk in chunks)
+        elapsed = time.perf_counter() - start
+
+    print(json.dumps({'seconds': elapsed, 'rows_per_sec': n_rows / elapsed, 'mb': size / (1024 * 1024),
+                      'baseline_rss_mb': baseline, 'peak_rss_mb': peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streaming sheet export.')
+    parser.add_argument('--rows', type=int, default=1000000, help='Rows in the benchmark sheet.')
+    parser.add_argument('--cols', type=int, default=10, help='Columns in the benchmark sheet (at least 3).')
+    parser.add_argument('--formats', nargs='+', default=['csv', 'parquet', 'arrow'],
+                        choices=['csv', 'parquet', 'arrow'])
+    parser.add_argument('--run', choices=['csv', 'parquet', 'arrow'], help=argparse.SUPPRESS)
+    parser.add_argument('--predict', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--build', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.build:
+        build_sheet(args.db, args.rows, args.cols)
+        return
+
+    if args.run:
+        run_export(args.db, args.run, args.predict, args.rows)
+        return
+
+    formats = args.formats
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        formats = [name for name in formats if name == 'csv']
+        print('pyarrow is not installed; benchmarking CSV only')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        start = time.perf_counter()
+        # Built in its own process so the export runs start from a fresh heap
+        subprocess.run([sys.executable, __file__, '--build', '--db', db_path, '--rows', str(args.rows),
+                        '--cols', str(args.cols)], check=True)
+        print(f"{args.rows} rows x {args.cols} cols built in {time.perf_counter() - start:.1f}s")
+        print(f"{'format':>8} {'predict':>8} {'seconds':>9} {'rows/sec':>10} {'MB':>8} {'MB/sec':>8} "
+              f"{'baseline MB':>12} {'peak RSS MB':>12}")
+        for file_format in formats:
+            for with_predictions in (False, True):
+                command = [sys.executable, __file__, '--run', file_format, '--db', db_path, '--rows', str(args.rows)]
+                if with_predictions:
+                    command.append('--predict')
+                out = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+                result = json.loads(out.strip().splitlines()[-1])
+                print(f"{file_format:>8} {'yes' if with_predictions else 'no':>8} {result['seconds']:>9.2f} "
+                      f"{result['rows_per_sec']:>10.0f} {result['mb']:>8.1f} {result['mb'] / result['seconds']:>8.1f} "
+                      f"{result['baseline_rss_mb']:>12.1f} {result['peak_rss_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark bytes on the wire and server CPU per request for the sheet range
+and model list endpoints, with and without compression and revalidation.
+
+Modes:
+  identity    no Accept-Encoding and no If-None-Match (the old behaviour)
+  gzip / br   compressed full responses (br only if brotli is installed)
+  revalidate  If-None-Match with the ETag from a previous response (304)
+
+Requests go through Flask's test client, so CPU is the server-side cost
+of building the response. Run from the repository root:
+
+    python tools/bench_http.py --rows 100000 --cols 12 --models 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def wire_bytes(response):
+    """Body plus header bytes, roughly as they would appear on the wire."""
+    headers = sum(len(name) + len(value) + 4 for name, value in response.headers.items())
+    return len(response.get_data()), headers
+
+
+def setup(app, n_rows, n_cols, n_models):
+    from app import db
+    from app.models.ml_model import MLModel
+    from app.models.spreadsheet import Spreadsheet
+    from app.models.user import User
+
+    rng = random.Random(0)
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench')
+        db.session.add(user)
+        db.session.commit()
+        sheet = Spreadsheet(name='bench', user_id=user.id, column_names='{}')
+        sheet.write_rows([str(round(rng.gauss(0, 100), 3)) for _ in range(n_cols - 1)] + [rng.choice('abc')]
+                         for _ in range(n_rows))
+        db.session.commit()
+        for i in range(n_models):
+            db.session.add(MLModel(
+                name=f'model {i}', model_type='regression', input_columns=json.dumps(['A', 'B', 'C']),
+                output_column='D', spreadsheet_id=sheet.id,
+                metrics=json.dumps({'coef': [rng.random() for _ in range(3)], 'intercept': rng.random(),
+                                    'mse': rng.random(), 'r2': rng.random()})))
+        db.session.commit()
+        return user.id, sheet.id
+
+
+def measure(client, url, headers, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        response = client.get(url, headers=headers)
+    cpu = (time.process_time() - start) / repeat
+    return response, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark response compression and ETags.')
+    parser.add_argument('--rows', type=int, default=100000, help='Rows in the benchmark sheet.')
+    parser.add_argument('--cols', type=int, default=12, help='Columns in the benchmark sheet.')
+    parser.add_argument('--models', type=int, default=50, help='Models trained on the sheet.')
+    parser.add_argument('--repeat', type=int, default=50, help='Requests per measurement.')
+    args = parser.parse_args()
+
+    db_path = tempfile.mktemp(suffix='.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from app import create_app
+    from app.http import brotli
+
+    app = create_app()
+    user_id, sheet_id = setup(app, args.rows, args.cols, args.models)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    endpoints = {
+        'range 200 rows': f'/spreadsheet/range/{sheet_id}?r0=5000&r1=5200&c0=0&c1={args.cols}',
+        'model list': f'/ml/list/{sheet_id}',
+    }
+    modes = ['identity', 'gzip'] + (['br'] if brotli is not None else []) + ['revalidate']
+
+    print(f"{args.rows} rows x {args.cols} cols, {args.models} models, {args.repeat} requests each")
+    print(f"{'endpoint':<16} {'mode':<11} {'status':>6} {'body B':>9} {'header B':>9} {'CPU ms/req':>11}")
+    for name, url in endpoints.items():
+        baseline = None
+        for mode in modes:
+            if mode == 'revalidate':
+                etag = client.get(url, headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+                headers = {'Accept-Encoding': 'gzip', 'If-None-Match': etag}
+            elif mode == 'identity':
+                headers = {}
+            else:
+                headers = {'Accept-Encoding': mode}
+            response, cpu = measure(client, url, headers, args.repeat)
+            body, header = wire_bytes(response)
+            baseline = baseline or (body + header, cpu)
+            print(f"{name:<16} {mode:<11} {response.status_code:>6} {body:>9} {header:>9} {cpu * 1000:>11.2f}"
+                  f"   ({(body + header) / baseline[0]:.1%} bytes, {cpu / baseline[1]:.1%} CPU)")
+
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Measure what a fresh worker pays to import and build the app, with the ML
+stack loaded lazily (the default) or eagerly at import time as it used to be.
+
+Each sample runs in a new interpreter, like a worker started without
+preload_app, and reports:
+
+  create_app   seconds to import the app and call create_app()
+  RSS          resident memory once the app is built
+  sklearn      whether scikit-learn was loaded by then
+  train import seconds and extra RSS to load the training stack, which a
+               lazy worker pays on its first training request instead
+
+Linux only (RSS comes from /proc). Run from the repository root:
+
+    python tools/bench_imports.py --samples 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def child(mode):
+    sys.path.insert(0, ROOT)
+    start = time.perf_counter()
+    if mode == 'eager':
+        # What importing the ml blueprint used to pull in
+        import joblib  # noqa: F401
+        import app.ml.training  # noqa: F401
+    from app import create_app
+    create_app()
+    built = time.perf_counter()
+    rss_built = rss_mb()
+    loaded = 'sklearn' in sys.modules
+
+    import app.ml.training  # noqa: F401,F811
+    import joblib  # noqa: F401,F811
+    trained = time.perf_counter()
+    print(json.dumps({
+        'create_app': built - start,
+        'rss': rss_built,
+        'sklearn': loaded,
+        'train_import': trained - built,
+        'train_rss': rss_mb() - rss_built,
+    }))
+
+
+def sample(mode, db_path):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}')
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode],
+                            cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure app import time and RSS with lazy and eager ML imports.')
+    parser.add_argument('--samples', type=int, default=5, help='Fresh interpreters per mode (medians are shown).')
+    parser.add_argument('--child', choices=['lazy', 'eager'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    db_path = tempfile.mktemp(suffix='.db')
+    print(f"median of {args.samples} fresh interpreters")
+    print(f"{'mode':<6} {'create_app s':>13} {'RSS MB':>8} {'sklearn':>8} {'train import s':>15} {'train +RSS MB':>14}")
+    for mode in ('eager', 'lazy'):
+        samples = [sample(mode, db_path) for _ in range(args.samples)]
+
+        def median(key):
+            return statistics.median(s[key] for s in samples)
+
+        print(f"{mode:<6} {median('create_app'):>13.3f} {median('rss'):>8.1f} {str(samples[0]['sklearn']):>8} "
+              f"{median('train_import'):>15.3f} {median('train_rss'):>14.1f}")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
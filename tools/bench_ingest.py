@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark CSV import: rows/sec and peak RSS of the streaming importer
+versus the old read-everything approach of upload_csv.
+
+Each measurement runs in a fresh subprocess so peak RSS is not shared
+between modes. Run from the repository root:
+
+    python tools/bench_ingest.py --rows 1000000 --cols 30
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def write_csv(path, n_rows, n_cols, seed=0):
+    """Write a CSV with numeric columns, one text column and some empty cells."""
+    rng = random.Random(seed)
+    labels = ['red', 'green', 'blue', 'n/a']
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([f'col{i}' for i in range(n_cols)])
+        for _ in range(n_rows):
+            row = [str(round(rng.gauss(0, 100), 3)) if rng.random() > 0.05 else ''
+                   for _ in range(n_cols - 1)]
+            row.append(rng.choice(labels))
+            writer.writerow(row)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def legacy_import(spreadsheet, path):
+    """The upload_csv body before streaming import, storing the JSON blob."""
+    import io
+    with open(path, 'rb') as f:
+        stream = io.StringIO(f.read().decode("UTF8"), newline=None)
+    csv_data = list(csv.reader(stream))
+    spreadsheet_data = {}
+    for row_idx, row in enumerate(csv_data[1:], start=1):
+        for col_idx, value in enumerate(row):
+            if value:
+                spreadsheet_data[f"{row_idx-1}-{col_idx}"] = value
+    spreadsheet.data = json.dumps(spreadsheet_data)
+
+
+def run_import(mode, path, n_rows):
+    """Import ``path`` into a throwaway database and print a JSON result line."""
+    sys.path.insert(0, ROOT)
+    db_path = tempfile.mktemp(suffix='.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from app import create_app, db
+    from app.models.spreadsheet import Spreadsheet
+    from app.models.user import User
+    from app.storage.ingest import import_csv
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench')
+        db.session.add(user)
+        db.session.commit()
+        baseline = peak_rss_mb()
+
+        start = time.perf_counter()
+        spreadsheet = Spreadsheet(name='bench', user_id=user.id)
+        if mode == 'stream':
+            with open(path, 'rb') as f:
+                import_csv(spreadsheet, f)
+        else:
+            db.session.add(spreadsheet)
+            legacy_import(spreadsheet, path)
+        db.session.commit()
+        elapsed = time.perf_counter() - start
+
+    os.remove(db_path)
+    print(json.dumps({'mode': mode, 'seconds': elapsed, 'rows_per_sec': n_rows / elapsed,
+                      'baseline_rss_mb': baseline, 'peak_rss_mb': peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streaming CSV import.')
+    parser.add_argument('--rows', type=int, default=1000000, help='Data rows in the generated CSV.')
+    parser.add_argument('--cols', type=int, default=30, help='Columns in the generated CSV.')
+    parser.add_argument('--modes', nargs='+', default=['stream', 'legacy'], choices=['stream', 'legacy'])
+    parser.add_argument('--run', choices=['stream', 'legacy'], help=argparse.SUPPRESS)
+    parser.add_argument('--csv', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_import(args.run, args.csv, args.rows)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.csv')
+        write_csv(path, args.rows, args.cols)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"{args.rows} rows x {args.cols} cols, {size_mb:.1f} MB CSV")
+        print(f"{'mode':>8} {'seconds':>9} {'rows/sec':>10} {'baseline MB':>12} {'peak RSS MB':>12}")
+        for mode in args.modes:
+            out = subprocess.run(
+                [sys.executable, __file__, '--run', mode, '--csv', path, '--rows', str(args.rows)],
+                capture_output=True, text=True, check=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            print(f"{mode:>8} {result['seconds']:>9.2f} {result['rows_per_sec']:>10.0f} "
+                  f"{result['baseline_rss_mb']:>12.1f} {result['peak_rss_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark the vectorized training matrix builder against the original
+per-cell Python loop from train_model.
+
+Run from the repository root:
+
+    python tools/bench_matrix.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.ml.matrix import build_training_matrix  # noqa: E402
+from app.storage.columnar import NumericColumn, TextColumn, format_number  # noqa: E402
+
+
+def legacy_matrix(data, input_cols, output_col, model_type):
+    """The row loop train_model used before columnar storage."""
+    X = []
+    y = []
+    rows = set()
+    for key in data.keys():
+        if '-' in key:
+            row, _ = key.split('-')
+            rows.add(int(row))
+    input_indices = [ord(col) - 65 for col in input_cols]
+    output_index = ord(output_col) - 65
+    for row in rows:
+        row_inputs = []
+        for col_idx in input_indices:
+            cell_key = f"{row}-{col_idx}"
+            if cell_key in data and data[cell_key]:
+                try:
+                    row_inputs.append(float(data[cell_key]))
+                except ValueError:
+                    row_inputs.append(0)
+            else:
+                row_inputs.append(0)
+        output_key = f"{row}-{output_index}"
+        if output_key not in data or not data[output_key]:
+            continue
+        X.append(row_inputs)
+        y.append(float(data[output_key]) if model_type == 'regression' else data[output_key])
+    return np.array(X), np.array(y)
+
+
+def make_sheet(n_rows, seed=0):
+    """Build the same synthetic sheet as a legacy cell dict and as columns.
+
+    Columns A-C are numeric inputs with ~5% empty cells, D is a text input
+    with a few non-numeric values, and E is the numeric target with ~2%
+    missing.
+    """
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for col in range(3):
+        values = np.round(rng.normal(size=n_rows), 3)
+        valid = rng.random(n_rows) > 0.05
+        columns[col] = NumericColumn(np.where(valid, values, np.nan), valid)
+    codes = rng.integers(-1, 4, size=n_rows).astype(np.int32)
+    columns[3] = TextColumn(['1', '2', 'n/a', '3.5'], codes)
+    target = np.nan_to_num(columns[0].values) * 2 + rng.normal(size=n_rows)
+    target_valid = rng.random(n_rows) > 0.02
+    columns[4] = NumericColumn(np.where(target_valid, np.round(target, 3), np.nan), target_valid)
+
+    data = {}
+    for col, column in columns.items():
+        for row, text in column.items():
+            data[f"{row}-{col}"] = text
+    return data, columns
+
+
+def best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark training matrix extraction.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='Row counts to benchmark.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement (best is reported).')
+    args = parser.parse_args()
+
+    input_cols = ['A', 'B', 'C', 'D']
+    print(f"{'rows':>10} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>9}")
+    for n_rows in args.sizes:
+        data, columns = make_sheet(n_rows)
+        legacy_time, (X_old, y_old) = best_of(
+            lambda: legacy_matrix(data, input_cols, 'E', 'regression'), args.repeat)
+        new_time, (X_new, y_new, report) = best_of(
+            lambda: build_training_matrix(columns, input_cols, 'E', 'regression'), args.repeat)
+        assert np.array_equal(X_old, X_new) and np.array_equal(y_old, y_new), 'matrices differ'
+        print(f"{n_rows:>10} {legacy_time:>12.4f} {new_time:>15.4f} {legacy_time / new_time:>8.1f}x")
+    print(f"last report: {report}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark refreshing a model after an edit against refitting it from scratch.
+
+Builds a throwaway sheet, fits a linear regression and a logistic
+regression on it, then edits cells spread over a growing number of row
+blocks and times the refresh of each model (app.ml.incremental.fit_sheet)
+next to a full fit of the same data. Regression refresh time should follow
+the number of edited blocks; classification reads every row but starts
+from the previous coefficients. Run from the repository root:
+
+    python tools/bench_refresh.py --rows 1000000 --inputs 4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark incremental model refresh.')
+    parser.add_argument('--rows', type=int, default=1000000, help='Rows in the benchmark sheet.')
+    parser.add_argument('--inputs', type=int, default=4, help='Numeric input columns.')
+    parser.add_argument('--blocks', type=int, nargs='+', default=[1, 4, 16],
+                        help='Numbers of row blocks to edit before each refresh.')
+    args = parser.parse_args()
+
+    db_path = tempfile.mktemp(suffix='.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from app import create_app, db
+    from app.ml.incremental import fit_sheet
+    from app.models.ml_model import MLModel
+    from app.models.spreadsheet import Spreadsheet
+    from app.models.user import User
+    from app.storage.columnar import CHUNK_ROWS, column_letter
+
+    app = create_app()
+    rng = random.Random(0)
+    inputs = [column_letter(j) for j in range(args.inputs)]
+    target = column_letter(args.inputs)
+    label = column_letter(args.inputs + 1)
+
+    def row():
+        values = [rng.gauss(0, 10) for _ in inputs]
+        y = sum((j + 1) * v for j, v in enumerate(values)) + rng.gauss(0, 1)
+        return [f'{v:.4f}' for v in values] + [f'{y:.4f}', 'high' if y > 0 else 'low']
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench')
+        db.session.add(user)
+        db.session.commit()
+        sheet = Spreadsheet(name='bench', user_id=user.id, column_names='{}')
+        sheet.write_rows(row() for _ in range(args.rows))
+        db.session.commit()
+        n_blocks = -(-sheet.n_rows // CHUNK_ROWS)
+        print(f"{args.rows} rows in {n_blocks} blocks, {args.inputs} inputs")
+
+        models = {}
+        for model_type, output in (('regression', target), ('classification', label)):
+            estimator, metrics, state = fit_sheet(sheet, inputs, output, model_type)
+            model = MLModel(name=model_type, model_type=model_type, input_columns=json.dumps(inputs),
+                            output_column=output, spreadsheet_id=sheet.id, metrics=json.dumps(metrics),
+                            sheet_version=state['sheet_version'], fit_state=json.dumps(state))
+            db.session.add(model)
+            models[model_type] = (model, output)
+        db.session.commit()
+
+        print(f"{'model':<15} {'edited blocks':>13} {'refresh s':>10} {'full fit s':>11} {'speedup':>8} {'mode':>12}")
+        for edited in args.blocks:
+            edited = min(edited, n_blocks)
+            base_version = sheet.version
+            Spreadsheet.query.filter_by(id=sheet.id, version=base_version).update(
+                {Spreadsheet.version: base_version + 1})
+            changes = []
+            for number in rng.sample(range(n_blocks), edited):
+                r = min(number * CHUNK_ROWS + rng.randrange(CHUNK_ROWS), sheet.n_rows - 1)
+                changes += [(r, col, text) for col, text in enumerate(row())]
+            sheet.apply_changes(changes)
+            db.session.commit()
+
+            for model_type, (model, output) in models.items():
+                refresh, (_, metrics, state) = timed(lambda: fit_sheet(sheet, inputs, output, model_type, model))
+                full, _ = timed(lambda: fit_sheet(sheet, inputs, output, model_type))
+                model.metrics = json.dumps(metrics)
+                model.sheet_version = state['sheet_version']
+                model.fit_state = json.dumps(state)
+                db.session.commit()
+                print(f"{model_type:<15} {edited:>13} {refresh:>10.3f} {full:>11.3f} {full / refresh:>7.1f}x "
+                      f"{metrics['fit']['mode']:>12}")
+
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
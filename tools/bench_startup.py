@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Measure gunicorn startup with and without preload_app.
+
+Starts ``gunicorn -c gunicorn.conf.py wsgi:app`` on a throwaway database
+and reports, for each mode:
+
+  ready     seconds from launch until the first response
+  boot      per-worker time from fork to ready to serve (from the server log)
+  first     per-worker latency of its first request (from the server log)
+  steady    median client latency of the remaining requests
+  PSS       proportional memory of master plus workers, which shows how
+            much of the preloaded pages the workers share
+
+Linux only (PSS comes from /proc). Run from the repository root:
+
+    python tools/bench_startup.py --workers 4 --requests 50
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+BOOTED = re.compile(r'Worker (\d+) booted in (\d+) ms')
+FIRST = re.compile(r'Worker (\d+) first request \S+ \S+ in ([\d.]+) ms')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def pss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def get(url):
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=10) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def run(preload, workers, n_requests):
+    db_path = tempfile.mktemp(suffix='.db')
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', PORT=str(port),
+               WEB_CONCURRENCY=str(workers), GUNICORN_PRELOAD='1' if preload else '0')
+    log = []
+    launched = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    reader = threading.Thread(target=lambda: log.extend(server.stderr), daemon=True)
+    reader.start()
+
+    url = f'http://127.0.0.1:{port}/auth/login'
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError('gunicorn exited:\n' + ''.join(log))
+            try:
+                first = get(url)
+                break
+            except OSError:
+                time.sleep(0.02)
+        ready = time.perf_counter() - launched
+        steady = [get(url) for _ in range(n_requests)]
+        time.sleep(0.5)  # let the log catch up
+
+        text = ''.join(log)
+        pids = [int(pid) for pid, _ in BOOTED.findall(text)]
+        pss = pss_kb(server.pid) + sum(pss_kb(pid) for pid in pids)
+    finally:
+        server.terminate()
+        server.wait()
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+    boot = [float(ms) for _, ms in BOOTED.findall(text)]
+    firsts = [float(ms) for _, ms in FIRST.findall(text)]
+    return {
+        'ready': ready,
+        'boot': boot,
+        'first': firsts,
+        'client first': first * 1000,
+        'steady': statistics.median(steady) * 1000,
+        'pss': pss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure gunicorn worker start and first-request latency.')
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes to start.')
+    parser.add_argument('--requests', type=int, default=50, help='Requests sent after the first.')
+    args = parser.parse_args()
+
+    print(f"{args.workers} workers, {args.requests} requests")
+    print(f"{'preload':<8} {'ready s':>8} {'boot ms (max)':>14} {'first ms (max)':>15} "
+          f"{'client first ms':>16} {'steady ms':>10} {'PSS MB':>8}")
+    for preload in (False, True):
+        result = run(preload, args.workers, args.requests)
+        print(f"{str(preload):<8} {result['ready']:>8.2f} {max(result['boot'], default=0):>14.0f} "
+              f"{max(result['first'], default=0):>15.1f} {result['client first']:>16.1f} "
+              f"{result['steady']:>10.2f} {result['pss']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
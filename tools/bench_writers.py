@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Load-test sheet saves with concurrent writers, with and without the SQLite tuning.
+
+Each writer is a separate process, like a gunicorn worker, patching a few
+cells of its own sheet in a loop through the /spreadsheet/patch endpoint;
+optional readers fetch cell windows at the same time. Both runs use a fresh
+copy of the same database:
+
+  stock   SQLITE_TUNING=0 and no write retries: rollback journal, a
+          connection per request, the driver's 5 s lock timeout
+  tuned   the defaults: WAL, synchronous=NORMAL, pooled connections,
+          busy timeout and retries (see app.database)
+
+Reports successful saves per second, save latency and failed saves (lock
+errors surfacing to the client). Run from the repository root:
+
+    python tools/bench_writers.py --writers 8 --readers 2 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def setup(db_path, n_sheets, n_rows):
+    from app import create_app, db
+    from app.formulas.engine import recalculate
+    from app.models.spreadsheet import Spreadsheet
+    from app.models.user import User
+    from config import Config
+
+    class SetupConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        SQLITE_TUNING = False
+
+    rng = random.Random(0)
+    app = create_app(SetupConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench')
+        db.session.add(user)
+        db.session.commit()
+        sheet_ids = []
+        for i in range(n_sheets):
+            sheet = Spreadsheet(name=f'bench {i}', user_id=user.id, column_names='{}')
+            sheet.write_rows([f'{rng.gauss(0, 10):.4f}' for _ in range(4)] + ([f'=SUM(A1:D{n_rows})'] if r == 0 else [])
+                             for r in range(n_rows))
+            recalculate(sheet, sheet.version)
+            db.session.commit()
+            sheet_ids.append(sheet.id)
+        db.engine.dispose()
+        return user.id, sheet_ids
+
+
+def client_for(db_path, tuned, user_id):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['SQLITE_TUNING'] = '1' if tuned else '0'
+    if not tuned:
+        os.environ['DB_WRITE_RETRIES'] = '0'
+    os.environ['TRAINING_WORKERS'] = '0'
+    os.environ['MODEL_AUTO_REFRESH'] = '0'
+    from app import create_app
+
+    client = create_app().test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def writer(db_path, tuned, user_id, sheet_id, n_rows, cells, start_at, stop_at, results):
+    client = client_for(db_path, tuned, user_id)
+    rng = random.Random(sheet_id)
+    version = client.get(f'/spreadsheet/range/{sheet_id}?r0=0&r1=1').get_json()['version']
+    latencies, failed = [], 0
+    time.sleep(max(0, start_at - time.time()))
+    while time.time() < stop_at:
+        changes = [{'row': rng.randrange(n_rows), 'col': rng.randrange(4), 'value': f'{rng.gauss(0, 10):.4f}'}
+                   for _ in range(cells)]
+        started = time.perf_counter()
+        response = client.post(f'/spreadsheet/patch/{sheet_id}', json={'base_version': version, 'changes': changes})
+        elapsed = time.perf_counter() - started
+        data = response.get_json() or {}
+        if data.get('success'):
+            latencies.append(elapsed)
+            version = data['version']
+        elif response.status_code == 409:
+            version = data['version']
+        else:
+            failed += 1
+    results.put(('write', latencies, failed))
+
+
+def reader(db_path, tuned, user_id, sheet_ids, n_rows, start_at, stop_at, results):
+    client = client_for(db_path, tuned, user_id)
+    rng = random.Random(-len(sheet_ids))
+    reads, failed = 0, 0
+    time.sleep(max(0, start_at - time.time()))
+    while time.time() < stop_at:
+        r0 = rng.randrange(max(n_rows - 100, 1))
+        response = client.get(f'/spreadsheet/range/{rng.choice(sheet_ids)}?r0={r0}&r1={r0 + 100}')
+        if response.status_code == 200 and response.get_json().get('success'):
+            reads += 1
+        else:
+            failed += 1
+    results.put(('read', reads, failed))
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(db_path, tuned, user_id, sheet_ids, args):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    # Leave time for every process to import the app before the clock starts
+    start_at = time.time() + args.warmup
+    stop_at = start_at + args.duration
+    processes = [context.Process(target=writer, args=(db_path, tuned, user_id, sheet_id, args.rows, args.cells,
+                                                      start_at, stop_at, results))
+                 for sheet_id in sheet_ids]
+    processes += [context.Process(target=reader, args=(db_path, tuned, user_id, sheet_ids, args.rows,
+                                                       start_at, stop_at, results))
+                  for _ in range(args.readers)]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies, failed, reads, read_failed = [], 0, 0, 0
+    for outcome in outcomes:
+        if outcome[0] == 'write':
+            latencies += outcome[1]
+            failed += outcome[2]
+        else:
+            reads += outcome[1]
+            read_failed += outcome[2]
+    return {
+        'saves/s': len(latencies) / args.duration,
+        'p50 ms': percentile(latencies, 0.5) * 1000,
+        'p95 ms': percentile(latencies, 0.95) * 1000,
+        'max ms': max(latencies, default=float('nan')) * 1000,
+        'failed': failed,
+        'reads/s': reads / args.duration,
+        'read fail': read_failed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test concurrent sheet saves on SQLite.')
+    parser.add_argument('--writers', type=int, default=8, help='Writer processes, each saving its own sheet.')
+    parser.add_argument('--readers', type=int, default=2, help='Reader processes fetching cell windows.')
+    parser.add_argument('--rows', type=int, default=20000, help='Rows in each sheet.')
+    parser.add_argument('--cells', type=int, default=5, help='Cells changed by each save.')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds each run lasts.')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds allowed for the processes to start.')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    template = os.path.join(workdir, 'template.db')
+    user_id, sheet_ids = setup(template, args.writers, args.rows)
+
+    print(f"{args.writers} writers x {args.cells} cells per save, {args.readers} readers, "
+          f"{args.rows} rows per sheet, {args.duration:.0f} s per run")
+    columns = ['saves/s', 'p50 ms', 'p95 ms', 'max ms', 'failed', 'reads/s', 'read fail']
+    print(f"{'mode':<6} " + ' '.join(f'{name:>9}' for name in columns))
+    for mode in ('stock', 'tuned'):
+        db_path = os.path.join(workdir, f'{mode}.db')
+        shutil.copy(template, db_path)
+        stats = run(db_path, mode == 'tuned', user_id, sheet_ids, args)
+        print(f"{mode:<6} " + ' '.join(f'{stats[name]:>9.1f}' if isinstance(stats[name], float)
+                                       else f'{stats[name]:>9}' for name in columns))
+
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
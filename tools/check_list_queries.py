@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Check that /ml/list/<id> issues the same number of SQL queries however
+many models the user has.
+
+Builds a throwaway database with a few spreadsheets, adds models in
+rounds and counts the statements each listing executes. Exits non-zero if
+the count grows with the number of models. Run from the repository root:
+
+    python tools/check_list_queries.py --models 1 10 100
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def count_queries(engine, func):
+    from sqlalchemy import event
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        result = func()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return statements, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check /ml/list query count is independent of model count.')
+    parser.add_argument('--models', type=int, nargs='+', default=[1, 10, 100],
+                        help='Model counts to list (cumulative).')
+    parser.add_argument('--sheets', type=int, default=3, help='Spreadsheets the models are spread over.')
+    parser.add_argument('--verbose', action='store_true', help='Print the statements of each listing.')
+    args = parser.parse_args()
+
+    db_path = tempfile.mktemp(suffix='.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from app import create_app, db
+    from app.models.ml_model import MLModel
+    from app.models.spreadsheet import Spreadsheet
+    from app.models.user import User
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        user = User(username='check')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        sheet_ids = []
+        for i in range(args.sheets):
+            sheet = Spreadsheet(name=f'sheet {i}', user_id=user_id, column_names='{}')
+            sheet.write_rows([[str(row), str(row * 2), 'x' if row % 2 else 'y'] for row in range(20)])
+            db.session.commit()
+            sheet_ids.append(sheet.id)
+
+    client = app.test_client()
+    # Log in through Flask-Login's session keys; the login form only admits the demo account
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    counts = {}
+    created = 0
+    for n_models in sorted(args.models):
+        with app.app_context():
+            for i in range(created, n_models):
+                db.session.add(MLModel(
+                    name=f'model {i}', model_type='regression', input_columns=json.dumps(['A']),
+                    output_column='B', metrics=json.dumps({'coef': [2.0], 'intercept': 0.0}),
+                    spreadsheet_id=sheet_ids[i % len(sheet_ids)]))
+            db.session.commit()
+            created = n_models
+
+            statements, response = count_queries(db.engine, lambda: client.get(f'/ml/list/{sheet_ids[0]}'))
+        listed = len(response.get_json()['models'])
+        assert listed == n_models, f'listed {listed} of {n_models} models'
+        counts[n_models] = len(statements)
+        print(f'{n_models:>6} models: {len(statements)} queries')
+        if args.verbose:
+            for statement in statements:
+                print('    ' + ' '.join(statement.split())[:160])
+
+    os.remove(db_path)
+    if len(set(counts.values())) > 1:
+        print('FAIL: query count grows with the number of models')
+        sys.exit(1)
+    print('OK: query count is constant')
+
+
+if __name__ == '__main__':
+    main()
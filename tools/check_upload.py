@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Check that /spreadsheet/upload_csv imports a CSV posted as a file upload.
+
+Builds a throwaway database, posts a small CSV (quoted newlines, non-ASCII
+text, a formula) through the Flask test client the way a browser form
+would, and verifies the spreadsheet it creates. Large uploads reach the
+route as a SpooledTemporaryFile, so --rows can be raised past Werkzeug's
+in-memory limit to exercise that path too. Exits non-zero on failure. Run
+from the repository root:
+
+    python tools/check_upload.py --rows 20000
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check CSV upload through the Flask test client.')
+    parser.add_argument('--rows', type=int, default=20000, help='Data rows in the uploaded CSV.')
+    args = parser.parse_args()
+
+    db_path = tempfile.mktemp(suffix='.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from app import create_app, db
+    from app.models.spreadsheet import Spreadsheet
+    from app.models.user import User
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        user = User(username='check')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = app.test_client()
+    # Log in through Flask-Login's session keys; the login form only admits the demo account
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    lines = ['name,value,note', '"two\nlines",1,café', 'total,=B2*2,']
+    lines += [f'row {i},{i},' for i in range(args.rows - 2)]
+    data = ('\r\n'.join(lines) + '\r\n').encode('utf-8')
+    response = client.post('/spreadsheet/upload_csv', content_type='multipart/form-data', data={
+        'spreadsheet_name': 'upload check',
+        'csv_file': (io.BytesIO(data), 'check.csv'),
+    })
+
+    failures = []
+    if response.status_code != 302 or '/spreadsheet/edit/' not in response.headers.get('Location', ''):
+        failures.append(f'upload returned {response.status_code} {response.headers.get("Location")}')
+    with app.app_context():
+        sheet = Spreadsheet.query.filter_by(name='upload check').first()
+        if sheet is None:
+            failures.append('no spreadsheet was created')
+        else:
+            names = json.loads(sheet.column_names)
+            if names != {'A': 'name', 'B': 'value', 'C': 'note'}:
+                failures.append(f'column names {names}')
+            columns = sheet.load_columns([0, 2], 0, 1)
+            first = (columns[0].texts()[0], columns[2].texts()[0])
+            if first != ('two\nlines', 'café'):
+                failures.append(f'first row {first}')
+            if sheet.n_rows != args.rows:
+                failures.append(f'{sheet.n_rows} rows imported of {args.rows}')
+
+    os.remove(db_path)
+    if failures:
+        for failure in failures:
+            print(f'FAIL: {failure}')
+        sys.exit(1)
+    print(f'OK: {args.rows} rows uploaded')
+
+
+if __name__ == '__main__':
+    main()
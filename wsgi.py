@@ -1,17 +1,12 @@
-from app import create_app, db
-from app.models.user import User
+from app import create_app
 
+# Importing this module only builds the app: schema upgrades and the demo user
+# are set up once by gunicorn's on_starting hook (gunicorn.conf.py) or by
+# `python -m app.init_db`, not in every process that imports it
 app = create_app()
 
-# Initialize database and create demo user
-with app.app_context():
-    db.create_all()
-    demo_user = User.query.filter_by(username='demo').first()
-    if not demo_user:
-        demo_user = User(username='demo')
-        demo_user.set_password('demo123')
-        db.session.add(demo_user)
-        db.session.commit()
-
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080) 
\ No newline at end of file
+    from app.init_db import bootstrap
+    with app.app_context():
+        bootstrap()
+    app.run(host='0.0.0.0', port=8080)